@@ -0,0 +1,115 @@
+"""
+Agents run the load sent by a coordinator (``boom --agents``) and stream
+their results back to it, so several machines can share a run::
+
+    $ boom agent --listen 0.0.0.0:8765
+
+The coordinator sends the run configuration as a JSON line. The agent
+waits for the start time it contains, then streams JSON lines of
+:meth:`RunResults.to_dict` until the run is over. Agents handle one run
+at a time.
+
+Agents load the hooks and "py:" data callables they are told to, so
+they should only listen on trusted networks.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import tempfile
+import time
+
+import gevent
+
+from boom import __version__
+from boom.boom import AGENT_PORT, patch, stream_run
+
+
+logger = logging.getLogger('boom')
+
+
+def _error(sock, message):
+    line = json.dumps({'error': message}) + '\n'
+    sock.sendall(line.encode('utf-8'))
+    sock.close()
+
+
+def handle(sock):
+    """Runs the load described by the first line received on `sock`."""
+    line = sock.makefile('rb').readline()
+    try:
+        config = json.loads(line.decode('utf-8'))
+    except ValueError:
+        sock.close()
+        return
+
+    if config.get('version') != __version__:
+        _error(sock, 'The agent runs boom %s, the coordinator %s' % (
+            __version__, config.get('version')))
+        return
+
+    options = config['options']
+    scenario = options.get('scenario')
+    if scenario is not None:
+        # the coordinator sends the content of the file
+        fd, options['scenario'] = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            f.write(scenario)
+
+    try:
+        gevent.sleep(max(config['start'] - time.time(), 0))
+        stream_run(sock, config['url'], config['num'], config['duration'],
+                   config['concurrency'], config['precision'], options)
+    except Exception as e:
+        logger.exception('Run failed')
+        _error(sock, 'Run failed on %s: %s' % (socket.gethostname(), e))
+    finally:
+        if scenario is not None:
+            os.remove(options['scenario'])
+
+
+def serve(address):
+    """Handles the runs sent to the (host, port) `address`, forever."""
+    patch()
+    family, type_, proto, _, address = socket.getaddrinfo(
+        address[0], address[1], 0, socket.SOCK_STREAM)[0]
+    listener = socket.socket(family, type_, proto)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(address)
+    listener.listen(5)
+    print('Listening on %s:%d' % address[:2])
+    try:
+        while True:
+            sock, peer = listener.accept()
+            print('Running the load sent by %s:%d' % peer[:2])
+            handle(sock)
+    finally:
+        listener.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='boom agent',
+        description='Runs the load sent by "boom --agents".')
+
+    parser.add_argument('--listen',
+                        help='[HOST]:PORT to listen on (default: '
+                             '127.0.0.1:%d). Agents load the hooks they are '
+                             'told to, only listen on trusted networks' %
+                             AGENT_PORT,
+                        type=str, default='127.0.0.1:%d' % AGENT_PORT)
+
+    args = parser.parse_args(args)
+    host, _, port = args.listen.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        print('%r is not a valid address' % args.listen)
+        parser.print_usage()
+        return
+
+    try:
+        serve((host or '0.0.0.0', port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,190 @@
+"""
+Asyncio engine: runs the calls on the standard library event loop, with
+a minimal HTTP/1.1 client instead of gevent and requests.
+
+Importing this module has no side effect (the gevent engine is the one
+monkey-patching the standard library) but it needs Python 3.7 or later.
+
+The request is serialized once for the whole run, each worker keeps its
+connection open between calls, and redirects are not followed.
+"""
+import asyncio
+import socket
+import ssl
+import sys
+
+from boom.connection import clock
+from boom.wire import ProtocolError, chunk_size, has_body, parse_head
+
+
+# errors of the connection, the others are unexpected
+_ERRORS = (OSError, EOFError, asyncio.IncompleteReadError,
+           asyncio.LimitOverrunError, ProtocolError)
+
+
+class Connection(object):
+    """A connection to the host of `request`, opened on the first call
+    and kept open as long as the server allows it."""
+
+    def __init__(self, request):
+        self.request = request
+        self.opened = self.calls = 0
+        # of the last connection opened (or attempted)
+        self.address = None
+        self._reader = self._writer = None
+
+    async def call(self):
+        """Sends the request and reads the whole response.
+
+        Returns a (status, dns, connect, first_byte, size, headers) tuple:
+        the time spent resolving the host and opening a new connection
+        (None when it was reused), the clock time when the head of the
+        response was received, the size of its body and its headers, by
+        lowercased name.
+        """
+        request = self.request
+        dns = connect = None
+        if self._writer is None:
+            dns, connect = await self._connect()
+        self.calls += 1
+
+        try:
+            self._writer.write(request.payload)
+            head = await self._reader.readuntil(b'\r\n\r\n')
+            first_byte = clock()
+            status, keepalive, length, headers = parse_head(head)
+            size = 0
+            if has_body(request.method, status):
+                size = await self._read_body(length)
+                if length is None:
+                    keepalive = False
+        except BaseException:
+            self.close()
+            raise
+        if not (keepalive and request.keepalive):
+            self.close()
+        return status, dns, connect, first_byte, size, headers
+
+    async def _connect(self):
+        request = self.request
+        start = clock()
+        # resolving here times the DNS lookup apart from the connect
+        family, type_, proto, _, address = (
+            await asyncio.get_running_loop().getaddrinfo(
+                request.host, request.port, type=socket.SOCK_STREAM))[0]
+        self.address = address[0]
+        resolved = clock()
+        context = server_hostname = None
+        if request.scheme == 'https':
+            context = ssl.create_default_context()
+            server_hostname = request.host
+        self._reader, self._writer = await asyncio.open_connection(
+            address[0], address[1], ssl=context, family=family, proto=proto,
+            server_hostname=server_hostname)
+        self.opened += 1
+        return resolved - start, clock() - resolved
+
+    async def _read_body(self, length):
+        # returns the size of the body
+        reader = self._reader
+        if length is None:
+            return len(await reader.read())
+        elif length >= 0:
+            await reader.readexactly(length)
+            return length
+        total = 0
+        while True:
+            size = chunk_size(await reader.readline())
+            if size == 0:
+                break
+            await reader.readexactly(size + 2)
+            total += size
+        # trailers, up to the empty line
+        while (await reader.readline()).strip():
+            pass
+        return total
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._reader = self._writer = None
+
+
+async def _call(connection, results, scheduled, expect):
+    sent = clock()
+    try:
+        status, dns, connect, first_byte, size, headers = \
+            await connection.call()
+        done = clock()
+    except _ERRORS as exc:
+        results.record_error(exc, address=connection.address)
+    else:
+        results.record_call(status, sent, first_byte, done, size, scheduled,
+                            dns, connect, address=connection.address,
+                            expect=expect, headers=headers)
+
+
+async def _worker(connection, results, jobs, expect):
+    # `jobs` never blocks, so the workers can share it
+    for scheduled, endpoint in jobs:
+        if scheduled is not None:
+            delay = results.delay(scheduled)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        try:
+            await _call(connection, results, scheduled, expect)
+        except Exception as exc:
+            # an unexpected error fails the call, not the worker
+            results.record_error(exc, address=connection.address)
+
+
+async def _progress(results):
+    interval = .1 if sys.stdout.isatty() else 1
+    while True:
+        await asyncio.sleep(interval)
+        results.show_progress()
+
+
+async def _run(request, results, jobs, concurrency, duration, expect):
+    connections = [Connection(request) for i in range(concurrency)]
+    workers = [asyncio.ensure_future(_worker(connection, results, jobs,
+                                             expect))
+               for connection in connections]
+    progress = None
+    if not results.quiet:
+        progress = asyncio.ensure_future(_progress(results))
+    try:
+        done, pending = await asyncio.wait(workers, timeout=duration)
+        for worker in done:
+            # the errors of the calls are recorded, these are the ones of
+            # the workers themselves
+            worker.result()
+    finally:
+        for task in workers + [progress]:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for connection in connections:
+            connection.close()
+
+    if request.keepalive:
+        results.connections_opened = sum(c.opened for c in connections)
+        results.connections_reused = sum(c.calls - c.opened
+                                         for c in connections)
+
+
+def run(request, results, jobs, concurrency=1, duration=None,
+        expect=None):
+    """Performs the wire.Request `request` for every job of the shared
+    `jobs` iterator with `concurrency` workers, for at most `duration`
+    seconds, and records the calls into `results`, checking the responses
+    against the `expect` Expectations when given.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(
+            _run(request, results, jobs, concurrency, duration, expect))
+    finally:
+        loop.close()
+    if not results.quiet:
+        results.show_progress()
@@ -1,49 +1,126 @@
 from __future__ import absolute_import
 import argparse
 import gevent
+import gzip
+import json
 import logging
+import os
+import re
 import requests
 import sys
 import time
 
 try:
     import urlparse
+    from urllib import urlencode
 except ImportError:
     from urllib import parse as urlparse
+    from urllib.parse import urlencode
 
-import math
-from collections import defaultdict, namedtuple
-from copy import copy
+from collections import defaultdict, namedtuple, OrderedDict
+from functools import partial
+from itertools import count, cycle, repeat
 from gevent import monkey
 from gevent.pool import Pool
+from gevent.socket import create_connection, socketpair
 from requests import RequestException
 from requests.packages.urllib3.util import parse_url
-from socket import gethostbyname, gaierror
-
-from boom import __version__
+from socket import getaddrinfo, gethostbyname, gaierror
+
+from boom import __version__, multiplex, raw, resolver
+from boom.connection import clock, phases, TimedHTTPAdapter
+from boom.expect import (Expectations, parse_header, parse_regex,
+                         parse_size, parse_status)
+from boom.histogram import Histogram
+from boom.metrics import PrometheusExporter, StatsdExporter
 from boom.util import resolve_name
 from boom.pgbar import AnimatedProgressBar
+from boom.replay import Replay
+from boom.scenario import Scenario
+from boom.stages import LoadProfile, parse_stages
+from boom.timeseries import TimeSeries
+from boom.wire import Request
 
 
-monkey.patch_all()
 logger = logging.getLogger('boom')
+#: default port of the agents
+AGENT_PORT = 8765
+_ENGINES = ('gevent', 'asyncio')
 _VERBS = ('GET', 'POST', 'DELETE', 'PUT', 'HEAD', 'OPTIONS')
 _DATA_VERBS = ('POST', 'PUT')
+_PERCENTILES = (50, 90, 95, 99, 99.9)
+# memory addresses in error messages
+_ADDRESS = re.compile(r' at 0x[0-9a-fA-F]+')
+_PHASES = OrderedDict((('dns', 'DNS lookup'), ('connect', 'TCP connect'),
+                       ('tls', 'TLS handshake'),
+                       ('ttfb', 'Time to first byte'),
+                       ('body', 'Body download')))
+
+
+def _isatty(stream):
+    return hasattr(stream, 'isatty') and stream.isatty()
+
+
+def patch():
+    """Monkey-patches the standard library for the gevent engine.
+
+    This is done by the first gevent run rather than at import time, so
+    importing boom leaves the host process alone.
+    """
+    if not monkey.is_module_patched('socket'):
+        monkey.patch_all()
 
 
 class RunResults(object):
 
     """Encapsulates the results of a single Boom run.
 
-    Contains a dictionary of status codes to lists of request durations,
-    a list of exception instances raised during the run, the total time
-    of the run and an animated progress bar.
+    Latencies are kept in histograms of `precision` significant digits:
+
+    - status_code_counter: a histogram per status code.
+    - phases: a histogram per phase of the calls (dns, connect, tls,
+      ttfb, body).
+    - endpoints, endpoint_errors: per endpoint of a scenario.
+    - stages, stage_errors: per stage of the load profile, whose
+      (label, duration, target) stages are in `profile`.
+    - backends, backend_errors: per backend address.
+    - schedule_lag: how late the calls started, for paced runs.
+    - error_counter: the errors per "Class: message".
+    - errors: a sample of the exceptions raised.
+    - body_bytes: the bytes of the bodies received per status code.
+    - assertion_failures: the responses failing each assertion.
+    - http2: the streams reset and GOAWAY frames of HTTP/2 runs.
+    - connections_opened, connections_reused: with keep-alive only.
+    - total_time: the duration of the run, in seconds.
+    - timeline: the per-interval stats of the time series, if any.
     """
 
-    def __init__(self, num=1, quiet=False):
-        self.status_code_counter = defaultdict(list)
-        self.errors = []
+    # dictionaries of histograms and of counters, merged, drained and
+    # serialized alike.
+    _HISTOGRAMS = ('status_code_counter', 'phases', 'endpoints', 'stages',
+                   'backends')
+    _COUNTERS = ('endpoint_errors', 'error_counter', 'stage_errors',
+                 'http2', 'backend_errors', 'body_bytes',
+                 'assertion_failures')
+
+    #: number of exception instances kept in `errors`
+    MAX_ERROR_SAMPLES = 10
+    #: number of distinct error messages counted per exception class
+    MAX_ERROR_MESSAGES = 50
+
+    def __init__(self, num=1, quiet=False, precision=3):
+        self.precision = precision
+        self._reset()
         self.total_time = None
+        self.connections_opened = None
+        self.connections_reused = None
+        self.schedule_lag = None
+        # (label, duration, target) stages of the load profile, and the
+        # label of the current one
+        self.profile = None
+        self.stage = None
+        # per-interval stats, when a TimeSeries was written
+        self.timeline = None
         if num is not None:
             self._progress_bar = AnimatedProgressBar(
                 end=num,
@@ -51,62 +128,433 @@ class RunResults(object):
         else:
             self._progress_bar = None
         self.quiet = quiet
+        self.done = 0
+        self._shown = 0
+        self._started = clock()
+        self._progress = None
+
+    def incr(self, count=1):
+        # the display is refreshed by the greenlet spawned in
+        # start_progress(), not on every call
+        self.done += count
+
+    def show_progress(self):
+        """Displays the progress bar (or the number of calls done when
+        the run has no fixed number of calls) with the current RPS and
+        the running p50/p99 latencies.
+        """
+        elapsed = clock() - self._started
+        rps = self.done / elapsed if elapsed > 0 else 0
+        p50, p99 = self.histogram().percentiles((50, 99))
+        extra = '%d RPS - p50 %.4f s - p99 %.4f s' % (rps, p50, p99)
 
-    def incr(self):
-        if self.quiet:
-            return
         if self._progress_bar is not None:
-            self._progress_bar + 1
-            self._progress_bar.show_progress()
+            self._progress_bar + (self.done - self._shown)
+            self._shown = self.done
+            self._progress_bar.show_progress(extra)
         else:
-            sys.stdout.write('.')
+            line = '%d calls - %s' % (self.done, extra)
+            if _isatty(sys.stdout):
+                sys.stdout.write('\r' + line)
+            else:
+                sys.stdout.write('\n' + line)
             sys.stdout.flush()
 
+    def start_progress(self, interval=.1):
+        """Spawns a greenlet refreshing the progress display every
+        `interval` seconds (every second when stdout is not a terminal,
+        to keep logs readable).
+        """
+        if self.quiet:
+            return
+        if not _isatty(sys.stdout):
+            interval = max(interval, 1)
 
-RunStats = namedtuple(
-    'RunStats', ['count', 'total_time', 'rps', 'avg', 'min',
-                 'max', 'amp', 'stdev'])
+        def refresh():
+            while True:
+                gevent.sleep(interval)
+                self.show_progress()
 
+        self._progress = gevent.spawn(refresh)
 
-def calc_stats(results):
-    """Calculate stats (min, max, avg) from the given RunResults.
+    def stop_progress(self):
+        """Stops refreshing the progress display, after showing it one
+        last time."""
+        if self._progress is None:
+            return
+        self._progress.kill()
+        self._progress = None
+        self.show_progress()
+
+    def _reset(self):
+        for name in self._HISTOGRAMS:
+            setattr(self, name,
+                    defaultdict(partial(Histogram, self.precision)))
+        for name in self._COUNTERS:
+            setattr(self, name, defaultdict(int))
+        self.errors = []
 
-       The statistics are returned as a RunStats object.
-    """
-    all_res = []
-    count = 0
-    for values in results.status_code_counter.values():
-        all_res += values
-        count += len(values)
+    def histogram(self):
+        """Returns a histogram merging all the status codes."""
+        merged = Histogram(self.precision)
+        for histogram in self.status_code_counter.values():
+            merged.merge(histogram)
+        return merged
+
+    def count(self):
+        """Returns the number of calls recorded, errors included."""
+        return (sum(len(histogram)
+                    for histogram in self.status_code_counter.values()) +
+                self.error_count())
+
+    def error_count(self):
+        return sum(self.error_counter.values())
+
+    def add_error(self, error):
+        """Counts an exception under its class and message, and keeps it
+        if there are less than MAX_ERROR_SAMPLES samples.
+        """
+        key = '%s: %s' % (error.__class__.__name__,
+                          _ADDRESS.sub('', str(error)))
+        self.error_counter[self._error_key(key)] += 1
+        if len(self.errors) < self.MAX_ERROR_SAMPLES:
+            self.errors.append(error)
+
+    def record_call(self, status, sent, first_byte, done, size=0,
+                    scheduled=None, dns=None, connect=None, tls=None,
+                    endpoint=None, address=None, expect=None, headers=None,
+                    body=None):
+        """Records a call answered with `status`, whatever the engine.
+
+        `sent`, `first_byte` and `done` are the clock times when it was
+        sent, when the head of the response and its whole body of `size`
+        bytes were received. The call lasted from `scheduled`, when given,
+        or from `sent`. `dns`, `connect` and `tls` are the phases of a new
+        connection, None when it was reused.
+
+        It is recorded under the `endpoint` name, the current stage and the
+        backend `address` when there are some, and the response `headers`
+        (by lowercased name) and `body` are checked against the `expect`
+        Expectations when given.
+        """
+        duration = done - (sent if scheduled is None else scheduled)
+        self.status_code_counter[status].append(duration)
+        self.body_bytes[status] += size
+        if expect is not None:
+            expect.record(self, status, headers, size, body)
+        if endpoint is not None:
+            self.endpoints[endpoint].append(duration)
+        if self.stage is not None:
+            self.stages[self.stage].append(duration)
+        if address is not None:
+            self.backends[address].append(duration)
+        connection = 0
+        for name, phase in (('dns', dns), ('connect', connect),
+                            ('tls', tls)):
+            if phase is not None:
+                self.phases[name].append(phase)
+                connection += phase
+        self.phases['ttfb'].append(first_byte - sent - connection)
+        self.phases['body'].append(done - first_byte)
+        self.incr()
+
+    def record_error(self, error, endpoint=None, address=None):
+        """Records a call failing with the `error` exception, under the
+        `endpoint` name, the current stage and the backend `address` when
+        there are some."""
+        self.add_error(error)
+        if endpoint is not None:
+            self.endpoint_errors[endpoint] += 1
+        if self.stage is not None:
+            self.stage_errors[self.stage] += 1
+        if address is not None:
+            self.backend_errors[address] += 1
+        self.incr()
+
+    def delay(self, scheduled):
+        """Returns how long to wait for the clock time a call is
+        `scheduled` at, recording how late it starts."""
+        delay = scheduled - clock()
+        self.schedule_lag.record(max(-delay, 0))
+        return delay
+
+    def _error_key(self, key):
+        """Returns the key counting the "Class: message" error `key`,
+        which is shared by all the messages of the class over
+        MAX_ERROR_MESSAGES."""
+        if key in self.error_counter:
+            return key
+        prefix = key.split(': ', 1)[0] + ': '
+        messages = sum(1 for other in self.error_counter
+                       if other.startswith(prefix))
+        if messages >= self.MAX_ERROR_MESSAGES:
+            return prefix + '(other messages)'
+        return key
+
+    def merge(self, other):
+        """Adds the results of `other` to these results."""
+        for name in self._HISTOGRAMS:
+            histograms = getattr(self, name)
+            for key, histogram in getattr(other, name).items():
+                histograms[key].merge(histogram)
+        for name in self._COUNTERS:
+            if name == 'error_counter':
+                continue
+            counters = getattr(self, name)
+            for key, value in getattr(other, name).items():
+                counters[key] += value
+        # the chunks merged along a run add up to the same cap
+        for key, value in other.error_counter.items():
+            self.error_counter[self._error_key(key)] += value
+        missing = self.MAX_ERROR_SAMPLES - len(self.errors)
+        self.errors.extend(other.errors[:max(missing, 0)])
+        for name in ('total_time', 'connections_opened',
+                     'connections_reused'):
+            value = getattr(other, name)
+            if value is None:
+                continue
+            if name == 'total_time':
+                # runs merged together happen in parallel
+                value = max(self.total_time or 0, value)
+            else:
+                value += getattr(self, name) or 0
+            setattr(self, name, value)
+        if other.schedule_lag is not None:
+            if self.schedule_lag is None:
+                self.schedule_lag = Histogram(self.precision)
+            self.schedule_lag.merge(other.schedule_lag)
+        if self.profile is None:
+            self.profile = other.profile
+        if self.timeline is None:
+            self.timeline = other.timeline
+        return self
+
+    def drain(self):
+        """Returns the results recorded so far in a new RunResults and
+        starts over with empty ones.
+        """
+        drained = RunResults(None, True, self.precision)
+        for name in self._HISTOGRAMS + self._COUNTERS + ('errors',):
+            setattr(drained, name, getattr(self, name))
+        self._reset()
+        for name in ('total_time', 'connections_opened',
+                     'connections_reused'):
+            setattr(drained, name, getattr(self, name))
+            setattr(self, name, None)
+        if self.schedule_lag is not None:
+            drained.schedule_lag = self.schedule_lag
+            self.schedule_lag = Histogram(self.precision)
+        drained.profile = self.profile
+        return drained
+
+    def to_dict(self):
+        """Returns a JSON-serializable representation of the results.
+
+        Exception samples are kept as their class name and message.
+        """
+        data = {
+            'precision': self.precision,
+            'errors': [(error.__class__.__name__, str(error))
+                       for error in self.errors],
+            'total_time': self.total_time,
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+            'schedule_lag': (self.schedule_lag and
+                             self.schedule_lag.to_dict()),
+            'profile': self.profile,
+            'timeline': self.timeline}
+        # (key, value) lists as status codes are not valid JSON keys
+        for name in self._HISTOGRAMS:
+            data[name] = [(key, histogram.to_dict())
+                          for key, histogram in getattr(self, name).items()]
+        for name in self._COUNTERS:
+            data[name] = list(getattr(self, name).items())
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds RunResults out of a :meth:`to_dict` representation."""
+        results = cls(None, True, data['precision'])
+        # older snapshots miss the histograms and counters added since
+        for name in cls._HISTOGRAMS:
+            histograms = getattr(results, name)
+            for key, histogram in data.get(name, ()):
+                histograms[key] = Histogram.from_dict(histogram)
+        for name in cls._COUNTERS:
+            getattr(results, name).update(data.get(name, ()))
+        for name, message in data['errors']:
+            klass = getattr(requests.exceptions, name, RequestException)
+            results.errors.append(klass(message))
+        results.total_time = data['total_time']
+        results.connections_opened = data['connections_opened']
+        results.connections_reused = data['connections_reused']
+        if data['schedule_lag'] is not None:
+            results.schedule_lag = Histogram.from_dict(data['schedule_lag'])
+        if data.get('profile') is not None:
+            results.profile = [tuple(stage) for stage in data['profile']]
+        results.timeline = data.get('timeline')
+        return results
+
+    def save(self, path):
+        """Saves a snapshot of the results into the file at `path`, as
+        JSON, gzipped when its name ends with `.gz`."""
+        snapshot = {'boom': __version__, 'results': self.to_dict()}
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wb') as f:
+            f.write(json.dumps(snapshot, separators=(',', ':')).encode(
+                'utf-8'))
+
+    @classmethod
+    def load(cls, path):
+        """Loads the results saved by :meth:`save` into `path`.
+
+        Raises a ValueError when the file is not a snapshot.
+        """
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            try:
+                snapshot = json.loads(f.read().decode('utf-8'))
+                return cls.from_dict(snapshot['results'])
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError('%s is not a boom snapshot (%s)' % (path, e))
 
-    cum_time = sum(all_res)
 
-    if cum_time == 0 or len(all_res) == 0:
+RunStats = namedtuple(
+    'RunStats', ['count', 'total_time', 'rps', 'avg', 'min',
+                 'max', 'amp', 'stdev', 'percentiles', 'connections_opened',
+                 'connections_reused', 'schedule_lag_avg',
+                 'schedule_lag_max', 'phases', 'endpoints', 'errors',
+                 'error_rate', 'error_types', 'stages', 'http2',
+                 'backends', 'bytes_received', 'transfer_rate',
+                 'body_sizes', 'assertions'])
+
+
+def calc_stats(results, percentiles=_PERCENTILES):
+    """Calculate stats (min, max, avg, percentiles) from the given
+       RunResults, returned as a RunStats object.
+
+       Its fields besides the latency ones:
+
+       - percentiles: the latency of each of the `percentiles`, by
+         '50', '99.9'...
+       - schedule_lag_avg, schedule_lag_max: None unless the run was paced.
+       - phases: the stats (count, avg, min, max, stdev, percentiles) of
+         each phase. DNS, connect and TLS only count new connections.
+       - endpoints, backends: the same stats plus an errors count, per
+         endpoint of a scenario and per backend address.
+       - stages: the same, plus the target, duration and RPS of each stage
+         of the load profile, in order.
+       - errors, error_rate: the number of errors and its rate per second.
+       - error_types: the count of each type of error, most frequent first.
+       - http2: the 'resets' and 'goaways' counts, None but for HTTP/2.
+       - bytes_received, transfer_rate: the size of the bodies as received
+         and the MB per second.
+       - body_sizes: the mean size of the bodies per status code.
+       - assertions: the number of responses failing each assertion.
+    """
+    def _percentiles(histogram):
+        values = histogram.percentiles(percentiles)
+        return OrderedDict(('%g' % percentile, value)
+                           for percentile, value in zip(percentiles, values))
+
+    def _stats(histogram):
+        return {'count': len(histogram), 'avg': histogram.mean(),
+                'min': histogram.min or 0, 'max': histogram.max or 0,
+                'stdev': histogram.stdev(),
+                'percentiles': _percentiles(histogram)}
+
+    phases = OrderedDict((name, _stats(results.phases[name]))
+                         for name in _PHASES)
+
+    endpoints = OrderedDict()
+    for name in sorted(set(results.endpoints) |
+                       set(results.endpoint_errors)):
+        endpoints[name] = _stats(results.endpoints[name])
+        endpoints[name]['errors'] = results.endpoint_errors[name]
+
+    backends = OrderedDict()
+    for address in sorted(set(results.backends) |
+                          set(results.backend_errors)):
+        backends[address] = _stats(results.backends[address])
+        backends[address]['errors'] = results.backend_errors[address]
+
+    stages = OrderedDict()
+    if results.profile is not None:
+        known = sum(duration for label, duration, target in results.profile
+                    if duration is not None)
+        for label, duration, target in results.profile:
+            if duration is None:
+                # the last stage lasts until the end of the run
+                duration = max((results.total_time or 0) - known, 0)
+            stage = stages[label] = _stats(results.stages[label])
+            stage['errors'] = results.stage_errors[label]
+            stage['target'] = target
+            stage['duration'] = duration
+            stage['rps'] = stage['count'] / duration if duration else 0
+
+    histogram = results.histogram()
+    count = histogram.count
+    percentiles = _percentiles(histogram)
+
+    if histogram.total == 0 or count == 0:
         rps = avg = min_ = max_ = amp = stdev = 0
     else:
         if results.total_time == 0:
             rps = 0
         else:
-            rps = len(all_res) / float(results.total_time)
-        avg = sum(all_res) / len(all_res)
-        max_ = max(all_res)
-        min_ = min(all_res)
-        amp = max(all_res) - min(all_res)
-        stdev = math.sqrt(sum((x-avg)**2 for x in all_res) / count)
+            rps = count / float(results.total_time)
+        avg = histogram.mean()
+        max_ = histogram.max
+        min_ = histogram.min
+        amp = max_ - min_
+        stdev = histogram.stdev()
+
+    if results.schedule_lag is None:
+        lag_avg = lag_max = None
+    else:
+        lag_avg = results.schedule_lag.mean()
+        lag_max = results.schedule_lag.max or 0
+
+    errors = results.error_count()
+    if results.total_time:
+        error_rate = errors / float(results.total_time)
+    else:
+        error_rate = 0
+    error_types = OrderedDict(sorted(results.error_counter.items(),
+                                     key=lambda item: -item[1]))
+
+    bytes_received = sum(results.body_bytes.values())
+    if results.total_time:
+        transfer_rate = bytes_received / 1e6 / results.total_time
+    else:
+        transfer_rate = 0
+    body_sizes = OrderedDict(
+        (code, results.body_bytes[code] / float(len(histogram)))
+        for code, histogram in sorted(results.status_code_counter.items())
+        if len(histogram))
 
     return (
-        RunStats(count, results.total_time, rps, avg, min_, max_, amp, stdev)
+        RunStats(count, results.total_time, rps, avg, min_, max_, amp, stdev,
+                 percentiles, results.connections_opened,
+                 results.connections_reused, lag_avg, lag_max, phases,
+                 endpoints, errors, error_rate, error_types, stages,
+                 dict(results.http2) or None, backends, bytes_received,
+                 transfer_rate, body_sizes,
+                 OrderedDict(results.assertion_failures.items()))
     )
 
 
-def print_stats(results):
-    stats = calc_stats(results)
+def print_stats(results, percentiles=_PERCENTILES):
+    stats = calc_stats(results, percentiles)
     rps = stats.rps
 
     print('')
     print('-------- Results --------')
 
     print('Successful calls\t\t%r' % stats.count)
+    if stats.errors:
+        print('Errors            \t\t%d (%.1f per second)' % (
+            stats.errors, stats.error_rate))
     print('Total time        \t\t%.4f s  ' % stats.total_time)
     print('Average           \t\t%.4f s  ' % stats.avg)
     print('Fastest           \t\t%.4f s  ' % stats.min)
@@ -123,10 +571,69 @@ def print_stats(results):
     else:
         print('BSI              \t\t:(')
     print('')
+    print('-------- Latency distribution --------')
+    for percentile, value in stats.percentiles.items():
+        print('%-18s\t\t%.4f s  ' % (percentile + '%', value))
+    print('')
     print('-------- Status codes --------')
     for code, items in results.status_code_counter.items():
         print('Code %d          \t\t%d times.' % (code, len(items)))
     print('')
+    print('-------- Transfer --------')
+    print('Bytes received    \t\t%d' % stats.bytes_received)
+    print('Throughput        \t\t%.2f MB/s' % stats.transfer_rate)
+    for code, size in stats.body_sizes.items():
+        print('Mean size (%d)   \t\t%d bytes' % (code, size))
+    print('')
+    if stats.connections_opened is not None:
+        print('-------- Connections --------')
+        print('Opened            \t\t%d' % stats.connections_opened)
+        print('Reused            \t\t%d' % stats.connections_reused)
+        print('')
+    print('-------- Phases --------')
+    for name, phase in stats.phases.items():
+        if phase['count'] == 0:
+            continue
+        print('%-18s\t\t%.4f s avg, %.4f s max (%d calls)' % (
+            _PHASES[name], phase['avg'], phase['max'], phase['count']))
+    print('')
+    if stats.endpoints:
+        print('-------- Endpoints --------')
+        for name, endpoint in stats.endpoints.items():
+            print('%-18s\t\t%.4f s avg, %.4f s max (%d calls, %d errors)'
+                  % (name, endpoint['avg'], endpoint['max'],
+                     endpoint['count'], endpoint['errors']))
+        print('')
+    if stats.assertions:
+        print('-------- Assertions --------')
+        for label, failures in stats.assertions.items():
+            print('%-18s\t\t%d failures' % (label, failures))
+        print('')
+    if len(stats.backends) > 1:
+        print('-------- Backends --------')
+        for address, backend in stats.backends.items():
+            print('%-18s\t\t%.4f s avg, %.4f s max (%d calls, %d errors)'
+                  % (address, backend['avg'], backend['max'],
+                     backend['count'], backend['errors']))
+        print('')
+    if stats.stages:
+        print('-------- Stages --------')
+        for label, stage in stats.stages.items():
+            print('%-18s\t\t%d RPS, %.4f s avg, %.4f s max (%d calls, '
+                  '%d errors)' % (label, stage['rps'], stage['avg'],
+                                  stage['max'], stage['count'],
+                                  stage['errors']))
+        print('')
+    if stats.http2 is not None:
+        print('-------- HTTP/2 --------')
+        print('Stream resets     \t\t%d' % stats.http2.get('resets', 0))
+        print('GOAWAY frames     \t\t%d' % stats.http2.get('goaways', 0))
+        print('')
+    if stats.schedule_lag_avg is not None:
+        print('-------- Behind schedule --------')
+        print('Average           \t\t%.4f s  ' % stats.schedule_lag_avg)
+        print('Maximum           \t\t%.4f s  ' % stats.schedule_lag_max)
+        print('')
     print('-------- Legend --------')
     print('RPS: Request Per Second')
     print('BSI: Boom Speed Index')
@@ -145,31 +652,81 @@ def print_server_info(url, method, headers=None):
 
 
 def print_errors(errors):
+    """Prints the given errors, or their counts when `errors` maps them
+    to a number of occurrences."""
     if len(errors) == 0:
         return
     print('')
     print('-------- Errors --------')
-    for error in errors:
-        print(error)
+    if hasattr(errors, 'items'):
+        for error, times in sorted(errors.items(), key=lambda item: -item[1]):
+            print('%d times\t%s' % (times, error))
+    else:
+        for error in errors:
+            print(error)
 
 
-def print_json(results):
+def print_json(results, percentiles=_PERCENTILES):
     """Prints a JSON representation of the results to stdout."""
-    import json
-    stats = calc_stats(results)
+    stats = calc_stats(results, percentiles)
     print(json.dumps(stats._asdict()))
 
 
-def onecall(method, url, results, **options):
+class PayloadPool(object):
+    """Generates `size` payloads up front with the `data` callable, as
+    bytes, and cycles through them when called like `data`.
+    """
+
+    def __init__(self, data, size, method, url, options):
+        self.payloads = [self.encode(data(method, url, dict(options)))
+                         for i in range(size)]
+        self._cycle = cycle(self.payloads)
+
+    @staticmethod
+    def encode(payload):
+        if isinstance(payload, bytes):
+            return payload
+        if isinstance(payload, (dict, list, tuple)):
+            payload = urlencode(payload, doseq=True)
+        return payload.encode('utf-8')
+
+    def __call__(self, method, url, options):
+        return next(self._cycle)
+
+
+# where the discarded bodies are read
+_BODY_BUFFER = bytearray(65536)
+
+
+def onecall(method, url, results, scheduled=None, endpoint=None,
+            discard_body=False, expect=None, **options):
     """Performs a single HTTP call and puts the result into the
        status_code_counter.
 
-    RequestExceptions are caught and put into the errors set.
-    """
-    start = time.time()
+    RequestExceptions are caught and counted as errors.
+
+    Only the network exchange is timed: the `data` callable and the
+    hooks are not. The body is streamed so the time to first byte and
+    the body download are recorded apart, along with the connection
+    phases when a new connection was opened.
 
+    When the call was `scheduled` at a given clock time, its duration is
+    measured from there rather than from the moment it actually started,
+    so the time spent waiting for a free worker counts as latency.
+
+    With `discard_body`, the body is read in chunks into a buffer shared
+    by all the calls and thrown away, rather than kept in the response
+    for the hooks. Its size as received is recorded in both cases.
+
+    The response is checked against the `expect` Expectations when given,
+    unless the post hook fails it.
+
+    The call is recorded with :meth:`RunResults.record_call`, under the
+    scenario `endpoint` name when given and the address of the worker's
+    connection.
+    """
+    # `options` is already a copy, local to this call
     if 'data' in options and callable(options['data']):
-        options = copy(options)
         options['data'] = options['data'](method, url, options)
 
     if 'pre_hook' in options:
@@ -184,21 +741,293 @@ def onecall(method, url, results, **options):
         def post_hook(res):
             return res
 
+    options.setdefault('stream', True)
+    phases.reset()
+    sent = clock()
+
     try:
-        res = post_hook(method(url, **options))
+        res = method(url, **options)
+        first_byte = clock()
+        if discard_body:
+            res.raw.decode_content = False
+            while res.raw.readinto(_BODY_BUFFER):
+                pass
+        else:
+            res.content     # downloads the body
+        done = clock()
+        status, headers, size = res.status_code, res.headers, res.raw.tell()
+        body = None
+        if expect is not None and expect.body is not None:
+            body = res.content
+        post_hook(res)
     except RequestException as exc:
-        results.errors.append(exc)
+        results.record_error(exc, endpoint, phases.address)
     else:
-        duration = time.time() - start
-        results.status_code_counter[res.status_code].append(duration)
-    finally:
-        results.incr()
+        results.record_call(status, sent, first_byte, done, size, scheduled,
+                            phases.dns, phases.connect, phases.tls, endpoint,
+                            phases.address, expect, headers, body)
+
+
+def work(results, jobs, call):
+    """Calls `call(scheduled, endpoint)` for every job of the shared `jobs`
+    iterator, until it is exhausted. This is the loop of the workers of
+    all the gevent engines.
+
+    `jobs` yields (scheduled, endpoint) tuples: calls are delayed until
+    their scheduled clock time when it is not None.
+
+    `call` records the calls into `results` and counts their errors. Any
+    other exception, raised by a hook or a "py:" data callable, is counted
+    as an error of the call too, and the worker goes on with the next job.
+    """
+    for scheduled, endpoint in jobs:
+        if scheduled is not None:
+            delay = results.delay(scheduled)
+            if delay > 0:
+                gevent.sleep(delay)
+        try:
+            call(scheduled, endpoint)
+        except Exception as exc:
+            results.record_error(exc, endpoint and endpoint.name)
+
+
+class RequestsEngine(object):
+    """Performs the calls of a run with requests, going to the job's
+    endpoint when it is not None.
+
+    `method` is the lowercased HTTP verb. Each worker gets a session from
+    :meth:`connect` when keep-alive is on, otherwise each of its calls
+    opens a new connection.
+
+    With a `scenario`, each call without an endpoint goes to one of its
+    endpoints picked at random, instead of `method` and `url`.
+
+    The response bodies are thrown away as they are read when
+    `discard_body` is True, and checked against the `expect` Expectations
+    when given.
+    """
+
+    #: sessions are not shared by the workers
+    connections = None
+
+    def __init__(self, method, url, scenario=None, discard_body=False,
+                 expect=None, **options):
+        self.method = method
+        self.url = url
+        self.scenario = scenario
+        self.discard_body = discard_body
+        self.expect = expect
+        self.options = options
+
+    def connect(self):
+        return create_session()
+
+    def caller(self, session, results):
+        """Returns the `call(scheduled, endpoint)` function of the worker
+        using `session`, for :func:`work`."""
+        client = session or _Unpooled()
+        scenario, options = self.scenario, self.options
+
+        def call(scheduled, endpoint):
+            if endpoint is None and scenario is not None:
+                endpoint = scenario.pick()
+            if endpoint is None:
+                onecall(getattr(client, self.method), self.url, results,
+                        scheduled, discard_body=self.discard_body,
+                        expect=self.expect, **options)
+                return
+            call_options = dict(options, headers=endpoint.headers)
+            if endpoint.data is not None:
+                call_options['data'] = endpoint.data
+            onecall(getattr(client, endpoint.method.lower()), endpoint.url,
+                    results, scheduled, endpoint.name, self.discard_body,
+                    self.expect, **call_options)
+
+        return call
+
+
+def until(deadline):
+    """Yields until the clock reaches the given deadline."""
+    while clock() < deadline:
+        yield
+
+
+def schedule(rate, start, num=None, duration=None):
+    """Yields the clock times at which calls should start to keep a
+    constant `rate` of calls per second, regardless of how fast the
+    previous ones were answered.
+
+    Stops after `num` calls, or once `duration` seconds are scheduled.
+    """
+    interval = 1. / rate
+    for index in count() if num is None else range(num):
+        scheduled = start + index * interval
+        if duration is not None and scheduled >= start + duration:
+            return
+        yield scheduled
+
+
+def _jobs(results, start, num=None, duration=None, rate=None):
+    """Returns the shared iterator of (scheduled, endpoint) jobs of a
+    run of `num` calls or of `duration` seconds, starting at the `start`
+    clock time, at a constant `rate` when it is not None.
+    """
+    if rate is not None:
+        # open loop: calls start on a fixed timetable, `concurrency` only
+        # caps the number of calls in flight.
+        results.schedule_lag = Histogram(results.precision)
+        return ((scheduled, None)
+                for scheduled in schedule(rate, start, num, duration))
+    if num is not None:
+        return repeat((None, None), num)
+    return ((None, None) for _ in until(start + duration))
+
+
+def create_session(maxsize=1):
+    """Returns a requests Session keeping up to `maxsize` connections
+    alive per host, so consecutive calls reuse their TCP (and TLS)
+    connection instead of doing a new handshake.
+    """
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_maxsize=maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class _Unpooled(object):
+    """Stands for a session when keep-alive is off: like the requests
+    module, every call goes through its own session, closed once the call
+    is sent, but one whose connection records its phases.
+    """
+
+    def __getattr__(self, method):
+        def call(url, **options):
+            with create_session() as session:
+                return getattr(session, method)(url, **options)
+        return call
+
+
+def connection_stats(session):
+    """Returns a (opened, reused) tuple counting the connections the
+    given session (or fast path or HTTP/2 connection) opened and the
+    requests that went through an already opened connection.
+    """
+    if isinstance(session, raw.Connection):
+        return session.opened, session.calls - session.opened
+    if isinstance(session, multiplex.Connection):
+        return session.opened, session.streams - session.opened
+
+    opened = requests_sent = 0
+    adapters = dict((id(adapter), adapter)
+                    for adapter in session.adapters.values())
+
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+
+    return opened, max(requests_sent - opened, 0)
 
 
 def run(
     url, num=1, duration=None, method='GET', data=None, ct='text/plain',
         auth=None, concurrency=1, headers=None, pre_hook=None, post_hook=None,
-        quiet=False):
+        quiet=False, keepalive=True, precision=3, processes=1, results=None,
+        rate=None, timeseries=None, scenario=None, replay=None,
+        replay_speed=None, data_pool=None, ramp_up=None, stages=None,
+        sessions=None, engine='gevent', fast_path=True, agents=None,
+        http2=False, connections=1, max_streams=100, resolve_all=False,
+        dns_ttl=60, discard_body=False, expect_status=None,
+        expect_headers=None, expect_body=None, expect_size=None,
+        metrics_listen=None, statsd=None):
+
+    if engine not in _ENGINES:
+        raise ValueError('Unknown engine %r' % engine)
+
+    if discard_body and post_hook is not None:
+        raise ValueError("The post hook needs the bodies, they can't be "
+                         "discarded")
+
+    # checked once and for all, the bodies only being kept by requests
+    expect = Expectations(expect_status, expect_headers, expect_body,
+                          expect_size) or None
+    if expect_body is not None and (discard_body or http2 or
+                                    engine == 'asyncio'):
+        raise ValueError("The assertions on the bodies need them, they "
+                         "can't be discarded, sent over HTTP/2 or with the "
+                         "asyncio engine")
+
+    if agents:
+        if processes > 1 or replay is not None:
+            raise ValueError("Agents can't use several processes nor replay "
+                             "a file")
+        return run_agents(
+            agents, url, num=num, duration=duration, method=method,
+            data=data, ct=ct, auth=auth, concurrency=concurrency,
+            headers=headers, pre_hook=pre_hook, post_hook=post_hook,
+            quiet=quiet, keepalive=keepalive, precision=precision,
+            rate=rate, timeseries=timeseries, scenario=scenario,
+            data_pool=data_pool, ramp_up=ramp_up, stages=stages,
+            engine=engine, fast_path=fast_path, http2=http2,
+            connections=connections, max_streams=max_streams,
+            resolve_all=resolve_all, dns_ttl=dns_ttl,
+            discard_body=discard_body, expect_status=expect_status,
+            expect_headers=expect_headers, expect_body=expect_body,
+            expect_size=expect_size, metrics_listen=metrics_listen,
+            statsd=statsd)
+
+    if http2:
+        unsupported = [name for name, value in (
+            ('the asyncio engine', engine == 'asyncio'),
+            ('pre_hook', pre_hook), ('post_hook', post_hook),
+            ('scenario', scenario), ('replay', replay),
+            ('py: data', data is not None and data.startswith('py:')),
+            ('disabling keep-alive', not keepalive))
+            if value]
+        if unsupported:
+            raise ValueError("HTTP/2 runs don't support %s" %
+                             ', '.join(unsupported))
+        if multiplex.H2Connection is None:
+            raise ValueError('HTTP/2 needs the h2 library: pip install h2')
+
+    if engine == 'asyncio':
+        if sys.version_info < (3, 7):
+            raise ValueError('The asyncio engine needs Python 3.7 or later')
+        unsupported = [name for name, value in (
+            ('processes', processes > 1), ('pre_hook', pre_hook),
+            ('post_hook', post_hook), ('timeseries', timeseries),
+            ('scenario', scenario), ('replay', replay), ('ramp_up', ramp_up),
+            ('stages', stages), ('resolve_all', resolve_all),
+            ('metrics_listen', metrics_listen), ('statsd', statsd),
+            ('py: data', data is not None and data.startswith('py:')))
+            if value]
+        if unsupported:
+            raise ValueError("The asyncio engine doesn't support %s" %
+                             ', '.join(unsupported))
+        return _run_asyncio(url, num, duration, method, data, ct, auth,
+                            concurrency, headers, quiet, keepalive,
+                            precision, results, rate, expect)
+
+    patch()
+
+    if processes > 1:
+        return run_processes(
+            processes, url, num=num, duration=duration, method=method,
+            data=data, ct=ct, auth=auth, concurrency=concurrency,
+            headers=headers, pre_hook=pre_hook, post_hook=post_hook,
+            quiet=quiet, keepalive=keepalive, precision=precision,
+            rate=rate, timeseries=timeseries, scenario=scenario,
+            replay=replay, replay_speed=replay_speed, data_pool=data_pool,
+            ramp_up=ramp_up, stages=stages, fast_path=fast_path, http2=http2,
+            connections=connections, max_streams=max_streams,
+            resolve_all=resolve_all, dns_ttl=dns_ttl,
+            discard_body=discard_body, expect_status=expect_status,
+            expect_headers=expect_headers, expect_body=expect_body,
+            expect_size=expect_size, metrics_listen=metrics_listen,
+            statsd=statsd)
 
     if headers is None:
         headers = {}
@@ -207,10 +1036,31 @@ def run(
         headers['Content-Type'] = ct
 
     if data is not None and data.startswith('py:'):
-        callable = data[len('py:'):]
-        data = resolve_name(callable)
+        data = resolve_name(data[len('py:'):])
+
+    if scenario is not None:
+        # the endpoints headers are added to the common ones
+        endpoints = []
+        for endpoint in Scenario.from_file(scenario, url).endpoints:
+            endpoint_data = endpoint.data
+            if endpoint_data is not None and endpoint_data.startswith('py:'):
+                endpoint_data = resolve_name(endpoint_data[len('py:'):])
+            endpoint_headers = dict(headers)
+            endpoint_headers.update(endpoint.headers)
+            endpoints.append(endpoint._replace(headers=endpoint_headers,
+                                               data=endpoint_data))
+        scenario = Scenario(endpoints)
+
+    # the load profile sets how many of the workers are active over time
+    profile = None
+    if stages is not None:
+        profile = LoadProfile.from_stages(stages)
+        concurrency = profile.concurrency
+        if duration is None:
+            duration = profile.duration
+    elif ramp_up:
+        profile = LoadProfile.ramp_up(ramp_up, concurrency)
 
-    method = getattr(requests, method.lower())
     options = {'headers': headers}
 
     if pre_hook is not None:
@@ -225,33 +1075,507 @@ def run(
     if auth is not None:
         options['auth'] = tuple(auth.split(':', 1))
 
+    if data_pool:
+        # payloads are generated once, before the run
+        if callable(data):
+            options['data'] = PayloadPool(
+                data, data_pool, getattr(requests, method.lower()), url,
+                options)
+        if scenario is not None:
+            scenario = Scenario([
+                endpoint._replace(data=PayloadPool(
+                    endpoint.data, data_pool,
+                    getattr(requests, endpoint.method.lower()),
+                    endpoint.url, dict(options, headers=endpoint.headers)))
+                if callable(endpoint.data) else endpoint
+                for endpoint in scenario.endpoints])
+
+    # plain calls skip requests and go straight to the sockets, HTTP/2
+    # calls are multiplexed over `connections` connections
+    if http2:
+        gevent_engine = multiplex.Engine(
+            Request(method, url, headers, data, options.get('auth')),
+            connections, max_streams, expect)
+    elif (fast_path and keepalive and scenario is None and replay is None and
+            expect_body is None and
+            raw.supports(method, url, data, pre_hook, post_hook)):
+        gevent_engine = raw.Engine(
+            Request(method, url, headers, auth=options.get('auth')), expect)
+    else:
+        gevent_engine = RequestsEngine(method.lower(), url, scenario,
+                                       discard_body, expect, **options)
+
+    # the given `sessions` are extended as needed and left open, so
+    # consecutive runs can reuse their connections
+    shared = sessions is not None
+    if not keepalive:
+        sessions = [None] * concurrency
+    else:
+        size = gevent_engine.connections or concurrency
+        if sessions is None:
+            sessions = []
+        while len(sessions) < size:
+            sessions.append(gevent_engine.connect())
+        sessions = sessions[:size]
+        baseline = [connection_stats(session) for session in sessions]
+        if http2:
+            baseline_events = [(session.resets, session.goaways)
+                               for session in sessions]
+
+    # `concurrency` long-lived workers share a single lazy iterator of
+    # jobs, so memory does not grow with the number of requests or the
+    # duration of the run.
     pool = Pool(concurrency)
-    start = time.time()
-    jobs = None
-    res = RunResults(num, quiet)
+    start = clock()
+    if results is None:
+        res = RunResults(num, quiet, precision)
+    else:
+        res = results
+    if expect is not None:
+        _add_assertions(res, expect)
+
+    if replay is not None:
+        if replay_speed is not None:
+            res.schedule_lag = Histogram(precision)
+        jobs = Replay(replay, url, headers, replay_speed, start, num)
+    else:
+        jobs = _jobs(res, start, num, duration, rate)
+
+    if timeseries is not None:
+        timeseries = TimeSeries(res, timeseries)
+        timeseries.start()
 
+    exporters = _exporters(res, metrics_listen, statsd)
+
+    if profile is not None:
+        res.profile = profile.stages
+        profile.start(res)
+
+    # the new connections to the host of `url` go to all its addresses in
+    # turn
+    url_resolver = None
+    if resolve_all:
+        parts = parse_url(url)
+        url_resolver = resolver.Resolver(
+            parts.host, parts.port or (443 if parts.scheme == 'https' else 80),
+            dns_ttl)
+        resolver.install(url_resolver)
+
+    res.start_progress()
     try:
-        if num is not None:
-            jobs = [pool.spawn(onecall, method, url, res, **options)
-                    for i in range(num)]
-            pool.join()
-        else:
-            with gevent.Timeout(duration, False):
-                jobs = []
-                while True:
-                    jobs.append(pool.spawn(onecall, method, url, res,
-                                           **options))
-                pool.join()
+        for index in range(concurrency):
+            # the workers of HTTP/2 runs share the connections
+            session = sessions[index % len(sessions)]
+            worker_jobs = jobs
+            if profile is not None:
+                worker_jobs = profile.gate(index, jobs)
+            pool.spawn(work, res, worker_jobs,
+                       gevent_engine.caller(session, res))
+        pool.join(timeout=duration)
     except KeyboardInterrupt:
         # In case of a keyboard interrupt, just return whatever already got
         # put into the result object.
         pass
     finally:
-        res.total_time = time.time() - start
+        pool.kill()
+        if profile is not None:
+            profile.stop()
+        if replay is not None:
+            jobs.stop()
+        if url_resolver is not None:
+            resolver.uninstall(url_resolver)
+        res.total_time = clock() - start
+        res.stop_progress()
+        if timeseries is not None:
+            timeseries.stop()
+        for exporter in exporters:
+            exporter.stop()
+        if keepalive:
+            res.connections_opened = res.connections_reused = 0
+            for session, before in zip(sessions, baseline):
+                opened, reused = connection_stats(session)
+                res.connections_opened += opened - before[0]
+                res.connections_reused += reused - before[1]
+            if http2:
+                for session, before in zip(sessions, baseline_events):
+                    res.http2['resets'] += session.resets - before[0]
+                    res.http2['goaways'] += session.goaways - before[1]
+            if not shared:
+                for session in sessions:
+                    session.close()
 
     return res
 
 
+def _exporters(results, metrics_listen=None, statsd=None):
+    """Starts exporting the live metrics of `results` to Prometheus on
+    the `metrics_listen` address and/or to the `statsd` server."""
+    exporters = []
+    if metrics_listen is not None:
+        exporters.append(PrometheusExporter(results, metrics_listen))
+    if statsd is not None:
+        exporters.append(StatsdExporter(results, statsd))
+    for exporter in exporters:
+        exporter.start()
+    return exporters
+
+
+def _add_assertions(results, expect):
+    # reported even when no response fails them
+    for label in expect.labels:
+        results.assertion_failures[label] += 0
+
+
+def _run_asyncio(url, num, duration, method, data, ct, auth, concurrency,
+                 headers, quiet, keepalive, precision, results, rate,
+                 expect=None):
+    """Runs the load with the asyncio engine (see :mod:`boom.aio`)."""
+    # Python 3 only, hence imported here
+    from boom import aio
+
+    headers = dict(headers or {})
+    if 'content-type' not in headers:
+        headers['Content-Type'] = ct
+    if auth is not None:
+        auth = tuple(auth.split(':', 1))
+    request = Request(method, url, headers, data, auth, keepalive)
+
+    res = RunResults(num, quiet, precision) if results is None else results
+    if expect is not None:
+        _add_assertions(res, expect)
+    start = clock()
+    try:
+        aio.run(request, res, _jobs(res, start, num, duration, rate),
+                concurrency, duration, expect)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        res.total_time = clock() - start
+    return res
+
+
+def _share(total, parts, index):
+    """Returns the `index`-th of `parts` near-equal shares of `total`."""
+    return total // parts + (1 if index < total % parts else 0)
+
+
+def _send(sock, results):
+    line = json.dumps(results.to_dict()) + '\n'
+    sock.sendall(line.encode('utf-8'))
+
+
+def stream_run(sock, url, num, duration, concurrency, precision, options):
+    """Runs the load, streaming the partial results through `sock` every
+    half second as JSON lines of :meth:`RunResults.to_dict`.
+    """
+    results = RunResults(num, True, precision)
+
+    def stream():
+        while True:
+            gevent.sleep(.5)
+            _send(sock, results.drain())
+
+    streamer = gevent.spawn(stream)
+    try:
+        run(url, num, duration, concurrency=concurrency, quiet=True,
+            precision=precision, results=results, **options)
+    finally:
+        streamer.kill()
+    _send(sock, results.drain())
+    sock.close()
+
+
+def _run_child(sock, url, num, duration, concurrency, precision, options):
+    """Runs the load in a forked process, streaming the partial results
+    to the parent through `sock`.
+    """
+    try:
+        stream_run(sock, url, num, duration, concurrency, precision, options)
+    except BaseException:
+        logger.exception('Load process failed')
+        os._exit(1)
+    os._exit(0)
+
+
+def _shares(parts, num, concurrency, options):
+    """Splits a run between `parts` processes or agents.
+
+    Returns a (num, concurrency, options) tuple for each part that gets a
+    share of the load: the requests, the concurrency, the rate, the
+    targets of the `stages` and the HTTP/2 connections are shared between
+    them. The stages keep the labels of the whole run.
+    """
+    stages = options.get('stages')
+    if stages is not None:
+        stages = LoadProfile.from_stages(stages).stages
+        concurrency = max(target for label, duration, target in stages)
+    parts = min(parts, concurrency)
+    if num is not None:
+        parts = max(min(parts, num), 1)
+
+    shares = []
+    for index in range(parts):
+        part_options = dict(options)
+        if options.get('rate') is not None:
+            part_options['rate'] = options['rate'] / float(parts)
+        if stages is not None:
+            part_options['stages'] = [
+                (duration, _share(target, parts, index), label)
+                for label, duration, target in stages]
+        if options.get('http2'):
+            part_options['connections'] = max(
+                _share(options.get('connections', 1), parts, index), 1)
+        shares.append((None if num is None else _share(num, parts, index),
+                       _share(concurrency, parts, index), part_options))
+    return shares
+
+
+def _profile(concurrency, options):
+    """Returns the stages of the load profile of a whole run split by
+    :func:`_shares`, None when it has none."""
+    if options.get('stages') is not None:
+        return LoadProfile.from_stages(options['stages']).stages
+    if options.get('ramp_up'):
+        return LoadProfile.ramp_up(options['ramp_up'], concurrency).stages
+    return None
+
+
+def _collect(res, socks, timeseries=None, metrics_listen=None, statsd=None):
+    """Merges the results streamed through `socks` into `res` until they
+    are all closed, writing the `timeseries` file and exporting the live
+    metrics along the way.
+
+    Returns the list of the errors sent instead of results.
+    """
+    errors = []
+
+    def read(sock):
+        for line in sock.makefile('rb'):
+            data = json.loads(line.decode('utf-8'))
+            if 'error' in data:
+                logger.error(data['error'])
+                errors.append(data['error'])
+                continue
+            results = RunResults.from_dict(data)
+            res.merge(results)
+            res.incr(results.count())
+        sock.close()
+
+    readers = [gevent.spawn(read, sock) for sock in socks]
+
+    if timeseries is not None:
+        timeseries = TimeSeries(res, timeseries)
+        timeseries.start()
+
+    exporters = _exporters(res, metrics_listen, statsd)
+
+    res.start_progress()
+    try:
+        gevent.joinall(readers)
+    except KeyboardInterrupt:
+        # The senders got interrupted as well, wait for them to send
+        # what they already got.
+        gevent.joinall(readers)
+    finally:
+        res.stop_progress()
+        if timeseries is not None:
+            timeseries.stop()
+        for exporter in exporters:
+            exporter.stop()
+    return errors
+
+
+def run_processes(processes, url, num=1, duration=None, concurrency=1,
+                  quiet=False, precision=3, timeseries=None,
+                  metrics_listen=None, statsd=None, **options):
+    """Forks `processes` processes sharing the `num` requests and the
+    `concurrency` of the run, and merges the results they stream back
+    into a single RunResults.
+
+    The `timeseries` file is written and the metrics exported by the parent
+    process, from the merged results. The other
+    options are passed to :func:`run` in every process, the targets of the
+    `stages` being shared like the concurrency.
+    """
+    res = RunResults(num, quiet, precision)
+    # the shares have their own targets
+    res.profile = _profile(concurrency, options)
+    start = clock()
+    children = []
+
+    for share, share_concurrency, share_options in _shares(
+            processes, num, concurrency, options):
+        parent_sock, child_sock = socketpair()
+        pid = gevent.fork()
+        if pid == 0:
+            parent_sock.close()
+            _run_child(child_sock, url, share, duration, share_concurrency,
+                       precision, share_options)
+        child_sock.close()
+        children.append((pid, parent_sock))
+
+    try:
+        _collect(res, [sock for pid, sock in children], timeseries,
+                 metrics_listen, statsd)
+    finally:
+        for pid, sock in children:
+            os.waitpid(pid, 0)
+        res.total_time = clock() - start
+
+    return res
+
+
+def run_agents(agents, url, num=1, duration=None, concurrency=1,
+               quiet=False, precision=3, timeseries=None, delay=1,
+               metrics_listen=None, statsd=None, **options):
+    """Runs the load on the `agents`, a list of (host, port) addresses of
+    ``boom agent`` processes, sharing the `num` requests and the
+    `concurrency` of the run like :func:`run_processes` does.
+
+    The agents all start `delay` seconds after the run configuration was
+    sent, according to their wall clock (which should be synchronized),
+    and stream their results back to be merged into a single RunResults.
+    The content of the `scenario` file is sent along. The other options
+    are passed to :func:`run` on every agent.
+
+    Raises an IOError with the errors of the agents when none of them
+    sent results.
+    """
+    if options.get('scenario') is not None:
+        with open(options['scenario']) as f:
+            options['scenario'] = f.read()
+
+    res = RunResults(num, quiet, precision)
+    # the shares have their own targets
+    res.profile = _profile(concurrency, options)
+    shares = _shares(len(agents), num, concurrency, options)
+    start = time.time() + delay
+    socks = []
+    try:
+        for (host, port), (share, share_concurrency, share_options) in zip(
+                agents, shares):
+            sock = create_connection((host, port))
+            socks.append(sock)
+            config = {'version': __version__, 'start': start, 'url': url,
+                      'num': share, 'duration': duration,
+                      'concurrency': share_concurrency,
+                      'precision': precision, 'options': share_options}
+            sock.sendall((json.dumps(config) + '\n').encode('utf-8'))
+    except BaseException:
+        for sock in socks:
+            sock.close()
+        raise
+
+    started = clock()
+    try:
+        errors = _collect(res, socks, timeseries, metrics_listen, statsd)
+    finally:
+        # the total time is the longest of the agents' ones, when they
+        # sent any results
+        received = res.total_time is not None
+        if not received:
+            res.total_time = clock() - started
+    if errors and not received:
+        raise IOError('No agent sent results: %s' % '; '.join(errors))
+    return res
+
+
+CapacityStep = namedtuple('CapacityStep', ['load', 'rps', 'p99',
+                                           'error_ratio', 'passed'])
+
+
+def _print_step(step, by_rate):
+    print('%-18s\t\t%d RPS, %.4f s p99, %.1f%% errors%s' % (
+        ('%g RPS' if by_rate else '%d workers') % step.load, step.rps,
+        step.p99, step.error_ratio * 100, '' if step.passed else ' (over)'))
+
+
+def find_max(url, slo, step_duration=5, concurrency=1, rate=None,
+             max_error_ratio=.01, limit=None, quiet=False, **options):
+    """Searches the highest load keeping the p99 latency under `slo`
+    seconds and the ratio of errors under `max_error_ratio`.
+
+    The load is the concurrency, or the rate of calls when `rate` is
+    given (`concurrency` then caps the calls in flight). Starting from the
+    given one, the load doubles every step of `step_duration` seconds
+    until the limits are crossed, then is bisected between the last step
+    that passed and the first that did not, or stops at `limit`. The
+    workers keep their connections from one step to the next.
+
+    Returns the list of CapacityStep measured, and the step of the highest
+    load that passed (None when even the first one failed). The steps are
+    printed as they are measured unless `quiet` is True. Other options
+    are passed to :func:`run`.
+    """
+    by_rate = rate is not None
+    sessions = []
+    steps = []
+
+    def measure(load):
+        if by_rate:
+            results = run(url, num=None, duration=step_duration,
+                          concurrency=concurrency, rate=load, quiet=True,
+                          sessions=sessions, **options)
+        else:
+            results = run(url, num=None, duration=step_duration,
+                          concurrency=load, quiet=True, sessions=sessions,
+                          **options)
+        stats = calc_stats(results, (99,))
+        calls = stats.count + stats.errors
+        error_ratio = stats.errors / float(calls) if calls else 0
+        p99 = stats.percentiles['99']
+        step = CapacityStep(load, stats.rps, p99, error_ratio,
+                            stats.count > 0 and p99 <= slo and
+                            error_ratio <= max_error_ratio)
+        steps.append(step)
+        if not quiet:
+            _print_step(step, by_rate)
+        return step
+
+    if not quiet:
+        print('-------- Capacity search --------')
+
+    try:
+        load = rate if by_rate else concurrency
+        best = None
+        while True:
+            step = measure(load)
+            if not step.passed:
+                break
+            best = step
+            if limit is not None and load >= limit:
+                return steps, best
+            load *= 2
+            if limit is not None:
+                load = min(load, limit)
+
+        if best is not None:
+            good, bad = best.load, load
+            while bad - good > (good * .05 if by_rate else 1):
+                load = (good + bad) / 2. if by_rate else (good + bad) // 2
+                step = measure(load)
+                if step.passed:
+                    good, best = load, step
+                else:
+                    bad = load
+    finally:
+        for session in sessions:
+            session.close()
+
+    return steps, best
+
+
+def print_knee(knee, by_rate=False):
+    """Prints the highest load found by :func:`find_max`."""
+    print('')
+    if knee is None:
+        print('Knee              \t\tnone, the first step is over the limits')
+    else:
+        print('Knee              \t\t%s - %d RPS - p99 %.4f s' % (
+            ('%g RPS' if by_rate else '%d workers') % knee.load, knee.rps,
+            knee.p99))
+
+
 def resolve(url):
     parts = parse_url(url)
 
@@ -281,28 +1605,203 @@ def resolve(url):
 
 
 def load(url, requests, concurrency, duration, method, data, ct, auth,
-         headers=None, pre_hook=None, post_hook=None, quiet=False):
+         headers=None, pre_hook=None, post_hook=None, quiet=False,
+         keepalive=True, precision=3, processes=1, rate=None,
+         timeseries=None, scenario=None, replay=None, replay_speed=None,
+         data_pool=None, ramp_up=None, stages=None, engine='gevent',
+         fast_path=True, agents=None, http2=False, connections=1,
+         max_streams=100, resolve_all=False, dns_ttl=60,
+         discard_body=False, expect_status=None, expect_headers=None,
+         expect_body=None, expect_size=None, metrics_listen=None,
+         statsd=None):
     if not quiet:
-        print_server_info(url, method, headers=headers)
+        if scenario is not None:
+            print('Running the %s scenario' % scenario)
+        elif replay is not None:
+            print('Replaying %s' % replay)
+        elif http2:
+            # the server may not speak HTTP/1.1
+            print('Running %s %s' % (method, url))
+        else:
+            print_server_info(url, method, headers=headers)
 
         if requests is not None:
             print('Running %d queries - concurrency %d' % (requests,
                                                            concurrency))
+        elif duration is None:
+            print('Running all queries - concurrency %d' % concurrency)
         else:
             print('Running for %d seconds - concurrency %d.' %
                   (duration, concurrency))
 
+        if rate is not None:
+            print('Target rate %g RPS' % rate)
+
+        if stages is not None:
+            print('Stages %s' % ', '.join('%gs@%d' % stage
+                                          for stage in stages))
+        elif ramp_up:
+            print('Ramping up in %g seconds' % ramp_up)
+
+        if processes > 1:
+            print('Using %d processes' % processes)
+
+        if agents:
+            print('Using %d agents' % len(agents))
+
+        if engine != 'gevent':
+            print('Using the %s engine' % engine)
+
+        if http2:
+            print('HTTP/2 over %d connections, up to %d streams each' % (
+                connections, max_streams))
+
+        if resolve_all:
+            print('Spreading the connections over all the addresses of the '
+                  'host')
+
+        if metrics_listen is not None:
+            print('Serving the metrics on http://%s:%d/metrics' % (
+                metrics_listen[0] or '0.0.0.0', metrics_listen[1]))
+
+        if statsd is not None:
+            print('Pushing the metrics to StatsD at %s:%d' % statsd)
+
         sys.stdout.write('Starting the load')
     try:
         return run(url, requests, duration, method,
                    data, ct, auth, concurrency, headers,
-                   pre_hook, post_hook, quiet=quiet)
+                   pre_hook, post_hook, quiet=quiet, keepalive=keepalive,
+                   precision=precision, processes=processes, rate=rate,
+                   timeseries=timeseries, scenario=scenario, replay=replay,
+                   replay_speed=replay_speed, data_pool=data_pool,
+                   ramp_up=ramp_up, stages=stages, engine=engine,
+                   fast_path=fast_path, agents=agents, http2=http2,
+                   connections=connections, max_streams=max_streams,
+                   resolve_all=resolve_all, dns_ttl=dns_ttl,
+                   discard_body=discard_body, expect_status=expect_status,
+                   expect_headers=expect_headers, expect_body=expect_body,
+                   expect_size=expect_size, metrics_listen=metrics_listen,
+                   statsd=statsd)
     finally:
         if not quiet:
             print(' Done')
 
 
+def percentiles(value):
+    """Parses a comma-separated list of percentiles."""
+    try:
+        values = tuple(float(percentile) for percentile in value.split(','))
+    except ValueError:
+        values = ()
+
+    if not values or not all(0 < percentile <= 100 for percentile in values):
+        raise argparse.ArgumentTypeError(
+            'Percentiles must be comma-separated numbers in ]0, 100]')
+
+    return values
+
+
+def latency(value):
+    """Parses a latency in seconds, or in milliseconds with a "ms"
+    suffix."""
+    try:
+        if value.endswith('ms'):
+            seconds = float(value[:-2]) / 1000
+        else:
+            seconds = float(value.rstrip('s'))
+    except ValueError:
+        seconds = 0
+
+    if not seconds > 0:
+        raise argparse.ArgumentTypeError(
+            'A latency must be a positive number of seconds, or of '
+            'milliseconds with a "ms" suffix')
+
+    return seconds
+
+
+def agents(value):
+    """Parses a comma-separated list of HOST[:PORT] agent addresses."""
+    addresses = []
+    for address in value.split(','):
+        host, _, port = address.strip().partition(':')
+        try:
+            port = int(port or AGENT_PORT)
+        except ValueError:
+            port = None
+        if not host or port is None:
+            raise argparse.ArgumentTypeError(
+                '%r is not a valid agent address' % address)
+        addresses.append((host, port))
+    return addresses
+
+
+def address(value):
+    """Parses a [HOST]:PORT address."""
+    host, _, port = value.rpartition(':')
+    try:
+        port = int(port)
+    except ValueError:
+        port = None
+    if port is None or not 0 < port < 65536:
+        raise argparse.ArgumentTypeError('%r is not a valid address' % value)
+    return host, port
+
+
+def stages(value):
+    """Parses a comma-separated list of DURATION@TARGET stages."""
+    try:
+        return parse_stages(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expect_status(value):
+    """Parses a comma-separated list of expected status codes."""
+    try:
+        return parse_status(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expect_header(value):
+    """Parses a NAME:REGEX header assertion."""
+    try:
+        return parse_header(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expect_body(value):
+    """Parses a regular expression the bodies should match."""
+    try:
+        return parse_regex(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def expect_size(value):
+    """Parses a MIN-MAX range of body sizes."""
+    try:
+        return parse_size(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
 def main():
+    if sys.argv[1:2] == ['agent']:
+        from boom.agent import main as agent_main
+        return agent_main(sys.argv[2:])
+
+    if sys.argv[1:2] == ['compare']:
+        from boom.compare import main as compare_main
+        return compare_main(sys.argv[2:])
+
+    if sys.argv[1:2] == ['selftest']:
+        from boom.selftest import main as selftest_main
+        return selftest_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser(
         description='Simple HTTP Load runner.')
 
@@ -321,6 +1820,11 @@ def main():
                               'a python callable.'),
                         type=str)
 
+    parser.add_argument('--data-pool',
+                        help='Number of payloads generated before the run '
+                             'by the "py:" data callable, then reused in '
+                             'turn', type=int, metavar='N')
+
     parser.add_argument('-c', '--concurrency', help='Concurrency',
                         type=int, default=1)
 
@@ -349,14 +1853,195 @@ def main():
                               "failed request."),
                         type=str)
 
+    parser.add_argument('--expect-status',
+                        help='Comma-separated status codes the responses '
+                             'should have. Like the other assertions, the '
+                             'responses failing it are counted, not turned '
+                             'into errors',
+                        type=expect_status, metavar='CODES')
+
+    parser.add_argument('--expect-header',
+                        help='NAME:REGEX, a header the responses should '
+                             'have, matching the regular expression. Can '
+                             'be repeated',
+                        type=expect_header, action='append',
+                        dest='expect_headers')
+
+    parser.add_argument('--expect-body-regex',
+                        help='Regular expression the bodies should match. '
+                             'Makes the calls go through requests',
+                        type=expect_body, metavar='REGEX')
+
+    parser.add_argument('--expect-size-range',
+                        help='MIN-MAX size of the bodies in bytes, as '
+                             'received, either bound being optional',
+                        type=expect_size, metavar='RANGE')
+
     parser.add_argument('--json-output',
                         help='Prints the results in JSON instead of the '
                              'default format',
                         action='store_true')
 
+    parser.add_argument('--no-keepalive',
+                        help="Open a new connection for every request "
+                             "instead of reusing them",
+                        action='store_false', dest='keepalive')
+
+    parser.add_argument('--discard-body',
+                        help='Reads the response bodies in chunks and '
+                             'throws them away instead of keeping them in '
+                             'memory for the hooks. The fast path, HTTP/2 '
+                             'and the asyncio engine always do',
+                        action='store_true')
+
+    parser.add_argument('--no-fast-path',
+                        help="Go through requests even for plain GET and "
+                             "HEAD calls, which otherwise skip it",
+                        action='store_false', dest='fast_path')
+
+    parser.add_argument('--precision',
+                        help='Number of significant digits kept when '
+                             'recording latencies (1-5)',
+                        type=int, default=3, choices=range(1, 6))
+
+    parser.add_argument('--percentiles',
+                        help='Comma-separated latency percentiles to report '
+                             '(default: %s)' % ','.join('%g' % p for p in
+                                                        _PERCENTILES),
+                        type=percentiles, default=_PERCENTILES)
+
+    parser.add_argument('-r', '--rate',
+                        help='Start calls at a constant rate (per second) '
+                             'instead of as soon as a worker is free. '
+                             'Latencies are measured from the scheduled '
+                             'start time',
+                        type=float)
+
+    parser.add_argument('--scenario',
+                        help='JSON file describing weighted endpoints to '
+                             'hit instead of a single URL. Their URLs can '
+                             'be relative to the given URL',
+                        type=str, metavar='FILE')
+
+    parser.add_argument('--replay',
+                        help='Replays the calls of a file: a list of URLs '
+                             '(optionally prefixed by the method) or an '
+                             'access log in the common or combined format, '
+                             'gzipped or not. Relative URLs are joined to '
+                             'the given URL',
+                        type=str, metavar='FILE')
+
+    parser.add_argument('--replay-speed',
+                        help='Keeps the time between the calls of the '
+                             'replayed access log, divided by this factor',
+                        type=float, metavar='FACTOR')
+
+    parser.add_argument('--timeseries',
+                        help='File where stats are written every second '
+                             'during the run, as CSV when its name ends '
+                             'with .csv, as JSON lines otherwise',
+                        type=str, metavar='FILE')
+
+    parser.add_argument('--metrics-listen',
+                        help='[HOST]:PORT where Prometheus can scrape the '
+                             'live metrics of the run on /metrics, e.g. '
+                             ':9100 for all the interfaces',
+                        type=address, metavar='ADDRESS')
+
+    parser.add_argument('--statsd',
+                        help='[HOST]:PORT of a StatsD server the live '
+                             'metrics are pushed to every second, over UDP',
+                        type=address, metavar='ADDRESS')
+
+    parser.add_argument('--save',
+                        help='File where the results are saved, to be '
+                             'compared with "boom compare BASE NEW". '
+                             'Gzipped when its name ends with .gz',
+                        type=str, metavar='FILE')
+
+    parser.add_argument('-p', '--processes',
+                        help='Number of processes sharing the load',
+                        type=int, default=1)
+
+    parser.add_argument('--engine',
+                        help='Engine doing the calls: gevent and requests '
+                             '(the default), or asyncio (Python 3.7+) with '
+                             'a minimal HTTP/1.1 client, faster but without '
+                             'hooks, "py:" data, scenarios, replays, stages, '
+                             'processes or time series',
+                        type=str, default='gevent', choices=_ENGINES)
+
+    parser.add_argument('--http2',
+                        help='Multiplexes the calls over a few HTTP/2 '
+                             'connections (needs the h2 library). HTTPS '
+                             'URLs negotiate it, HTTP ones are spoken to '
+                             'in HTTP/2 directly',
+                        action='store_true')
+
+    parser.add_argument('--connections',
+                        help='Number of HTTP/2 connections shared by the '
+                             'workers (default: 1)',
+                        type=int, default=1, metavar='N')
+
+    parser.add_argument('--max-streams',
+                        help='Maximum number of concurrent streams per '
+                             'HTTP/2 connection, lowered to the limit of '
+                             'the server (default: 100)',
+                        type=int, default=100, metavar='N')
+
+    parser.add_argument('--resolve-all',
+                        help='Spreads the connections over all the IPv4 '
+                             'and IPv6 addresses of the host, with stats '
+                             'per address, instead of using the first one',
+                        action='store_true')
+
+    parser.add_argument('--dns-ttl',
+                        help='Seconds after which --resolve-all looks the '
+                             'addresses up again (default: 60)',
+                        type=float, default=60, metavar='SECONDS')
+
+    parser.add_argument('--agents',
+                        help='Comma-separated HOST[:PORT] addresses of '
+                             '"boom agent" processes sharing the load, '
+                             'instead of running it locally (default port: '
+                             '%d)' % AGENT_PORT,
+                        type=agents)
+
     parser.add_argument('-q', '--quiet', help="Don't display progress bar",
                         action='store_true')
 
+    profile = parser.add_mutually_exclusive_group()
+
+    profile.add_argument('--ramp-up',
+                         help='Starts the workers gradually over that many '
+                              'seconds instead of all at once',
+                         type=float, metavar='SECONDS')
+
+    profile.add_argument('--stages',
+                         help='Comma-separated DURATION@WORKERS stages, '
+                              'each ramping the number of active workers to '
+                              'its target over its duration (eg: '
+                              '10s@50,60s@200,10s@0). Overrides the '
+                              'concurrency, and sets the duration unless '
+                              'one is given',
+                         type=stages)
+
+    parser.add_argument('--find-max',
+                        help='Searches the highest concurrency (or rate, '
+                             'starting from --rate) keeping the p99 under '
+                             '--slo-p99, in steps of -d seconds (5 by '
+                             'default)',
+                        action='store_true')
+
+    parser.add_argument('--slo-p99',
+                        help='p99 latency limit of --find-max (eg: 200ms)',
+                        type=latency, metavar='LATENCY')
+
+    parser.add_argument('--max-error-ratio',
+                        help='Ratio of errors tolerated by --find-max '
+                             '(default: 0.01)',
+                        type=float, default=.01, metavar='RATIO')
+
     group = parser.add_mutually_exclusive_group()
 
     group.add_argument('-n', '--requests', help='Number of requests',
@@ -365,14 +2050,15 @@ def main():
     group.add_argument('-d', '--duration', help='Duration in seconds',
                        type=int)
 
-    parser.add_argument('url', help='URL to hit', nargs='?')
+    parser.add_argument('url', help='URL to hit (or base URL of the '
+                                    'scenario)', nargs='?')
     args = parser.parse_args()
 
     if args.version:
         print(__version__)
         sys.exit(0)
 
-    if args.url is None:
+    if args.url is None and args.scenario is None and args.replay is None:
         print('You need to provide an URL.')
         parser.print_usage()
         sys.exit(0)
@@ -382,15 +2068,78 @@ def main():
         parser.print_usage()
         sys.exit(0)
 
-    if args.requests is None and args.duration is None:
+    if args.replay is not None and not os.path.exists(args.replay):
+        print('%s does not exist' % args.replay)
+        sys.exit(1)
+
+    if args.replay is not None and args.processes > 1:
+        print("You can't replay a file with several processes")
+        parser.print_usage()
+        sys.exit(0)
+
+    if args.replay is not None and args.rate is not None:
+        print("--replay can't be combined with --rate, the calls of the "
+              "file being paced by --replay-speed")
+        parser.print_usage()
+        sys.exit(0)
+
+    if args.agents and (args.replay is not None or args.processes > 1 or
+                        args.find_max):
+        print("--agents can't be combined with --replay, --processes or "
+              "--find-max")
+        parser.print_usage()
+        sys.exit(0)
+
+    if args.find_max and args.slo_p99 is None:
+        print('--find-max needs --slo-p99')
+        parser.print_usage()
+        sys.exit(0)
+
+    if args.find_max and (args.processes > 1 or args.replay is not None or
+                          args.stages is not None or args.ramp_up):
+        print("--find-max can't be combined with --processes, --replay, "
+              "--stages or --ramp-up")
+        parser.print_usage()
+        sys.exit(0)
+
+    if (args.requests is None and args.duration is None and
+            args.replay is None and args.stages is None):
         args.requests = 1
 
-    try:
-        url, original, resolved = resolve(args.url)
-    except gaierror as e:
-        print_errors(("DNS resolution failed for %s (%s)" %
-                      (args.url, str(e)),))
-        sys.exit(1)
+    if args.url is None:
+        url = original = resolved = None
+    else:
+        try:
+            if args.resolve_all:
+                # each connection resolves the host
+                parts = parse_url(args.url)
+                getaddrinfo(parts.host, parts.port)
+                url = original = resolved = args.url
+            else:
+                url, original, resolved = resolve(args.url)
+        except gaierror as e:
+            print_errors(("DNS resolution failed for %s (%s)" %
+                          (args.url, str(e)),))
+            sys.exit(1)
+
+    scenario = None
+    if args.scenario is not None:
+        try:
+            scenario = Scenario.from_file(args.scenario, url)
+        except (IOError, ValueError) as e:
+            print('Invalid scenario: %s' % e)
+            sys.exit(1)
+
+    if args.data_pool:
+        # the payloads are only generated by the "py:" callables
+        data = [args.data]
+        if scenario is not None:
+            data.extend(endpoint.data for endpoint in scenario.endpoints)
+        if not any(item is not None and item.startswith('py:')
+                   for item in data):
+            print('--data-pool needs "py:" data, from -D or the scenario')
+            parser.print_usage()
+            sys.exit(0)
 
     def _split(header):
         header = header.split(':')
@@ -410,21 +2159,81 @@ def main():
     if original != resolved and 'Host' not in headers:
         headers['Host'] = original
 
+    if args.find_max:
+        try:
+            steps, knee = find_max(
+                url, args.slo_p99, args.duration or 5, args.concurrency,
+                args.rate, args.max_error_ratio, quiet=args.json_output,
+                method=args.method, data=args.data, ct=args.content_type,
+                auth=args.auth, headers=headers, pre_hook=args.pre_hook,
+                post_hook=args.post_hook, keepalive=args.keepalive,
+                precision=args.precision, scenario=args.scenario,
+                data_pool=args.data_pool, engine=args.engine,
+                fast_path=args.fast_path, http2=args.http2,
+                connections=args.connections, max_streams=args.max_streams,
+                resolve_all=args.resolve_all, dns_ttl=args.dns_ttl,
+                discard_body=args.discard_body,
+                expect_status=args.expect_status,
+                expect_headers=args.expect_headers,
+                expect_body=args.expect_body_regex,
+                expect_size=args.expect_size_range)
+        except RequestException as e:
+            print_errors((e, ))
+            sys.exit(1)
+        except ValueError as e:
+            # options the engine doesn't support
+            print(e)
+            sys.exit(1)
+        except (IOError, OSError) as e:
+            print_errors((e, ))
+            sys.exit(1)
+        if args.json_output:
+            print(json.dumps({'steps': [step._asdict() for step in steps],
+                              'knee': knee and knee._asdict()}))
+        else:
+            print_knee(knee, args.rate is not None)
+        return
+
     try:
         res = load(
             url, args.requests, args.concurrency, args.duration,
             args.method, args.data, args.content_type, args.auth,
             headers=headers, pre_hook=args.pre_hook,
-            post_hook=args.post_hook, quiet=(args.json_output or args.quiet))
+            post_hook=args.post_hook, quiet=(args.json_output or args.quiet),
+            keepalive=args.keepalive, precision=args.precision,
+            processes=args.processes, rate=args.rate,
+            timeseries=args.timeseries, scenario=args.scenario,
+            replay=args.replay, replay_speed=args.replay_speed,
+            data_pool=args.data_pool, ramp_up=args.ramp_up,
+            stages=args.stages, engine=args.engine,
+            fast_path=args.fast_path, agents=args.agents, http2=args.http2,
+            connections=args.connections, max_streams=args.max_streams,
+            resolve_all=args.resolve_all, dns_ttl=args.dns_ttl,
+            discard_body=args.discard_body, expect_status=args.expect_status,
+            expect_headers=args.expect_headers,
+            expect_body=args.expect_body_regex,
+            expect_size=args.expect_size_range,
+            metrics_listen=args.metrics_listen, statsd=args.statsd)
     except RequestException as e:
         print_errors((e, ))
         sys.exit(1)
+    except ValueError as e:
+        # options the engine doesn't support
+        print(e)
+        sys.exit(1)
+    except (IOError, OSError) as e:
+        # unreachable agents
+        print_errors((e, ))
+        sys.exit(1)
+
+    if args.save is not None:
+        res.save(args.save)
 
     if not args.json_output:
-        print_errors(res.errors)
-        print_stats(res)
+        print_errors(res.error_counter)
+        print_stats(res, args.percentiles)
     else:
-        print_json(res)
+        print_json(res, args.percentiles)
 
     logger.info('Bye!')
 
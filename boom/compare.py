@@ -0,0 +1,237 @@
+"""
+Compares the results of two runs saved with ``--save``, flagging the
+significant regressions::
+
+    $ boom compare base.json new.json
+
+A metric regresses when it gets worse by more than a threshold (5% by
+default) and the difference is statistically significant:
+
+- latencies are compared on their whole distributions, with a
+  Mann-Whitney U test computed on the histograms;
+- the error ratio is compared with a two-proportion z-test;
+- the RPS is compared with a Welch t-test on the per-second RPS of the
+  runs when both were saved with a time series, on the threshold alone
+  otherwise.
+
+The p-values use the normal approximation, which holds with the number
+of calls of a load test.
+"""
+import argparse
+import json
+import math
+import sys
+from collections import namedtuple
+
+from boom.boom import _PERCENTILES, RunResults, calc_stats
+
+
+#: one metric compared between the base and the new run. `p_value` is
+#: None when no test applies, `change` is the relative change, None when
+#: the metric was 0 in the base run only.
+Difference = namedtuple('Difference', ['metric', 'base', 'new', 'change',
+                                       'p_value', 'regression'])
+
+
+def _p_value(z):
+    """Two-sided p-value of a standard normal score."""
+    return math.erfc(abs(z) / math.sqrt(2))
+
+
+def mann_whitney(base, new):
+    """Compares the distributions of two histograms.
+
+    Returns a (z, p_value) tuple, `z` being positive when the values of
+    `new` tend to be higher than the ones of `base`.
+    """
+    n1, n2 = len(base), len(new)
+    n = n1 + n2
+    if not n1 or not n2:
+        return 0, None
+
+    counts = {}
+    for value, count in base:
+        counts.setdefault(value, [0, 0])[0] += count
+    for value, count in new:
+        counts.setdefault(value, [0, 0])[1] += count
+
+    # the values of a bucket are tied and share their average rank
+    rank = ranks = ties = 0
+    for value in sorted(counts):
+        in_base, in_new = counts[value]
+        tied = in_base + in_new
+        ranks += in_new * (rank + (tied + 1) / 2.)
+        ties += tied ** 3 - tied
+        rank += tied
+
+    u = ranks - n2 * (n2 + 1) / 2.
+    variance = n1 * n2 / 12. * ((n + 1) - ties / float(n * (n - 1)))
+    if variance <= 0:
+        return 0, 1.
+    z = (u - n1 * n2 / 2.) / math.sqrt(variance)
+    return z, _p_value(z)
+
+
+def proportions(base_hits, base_total, new_hits, new_total):
+    """Two-proportion z-test, returns a (z, p_value) tuple."""
+    if not base_total or not new_total:
+        return 0, None
+    pooled = (base_hits + new_hits) / float(base_total + new_total)
+    variance = pooled * (1 - pooled) * (1. / base_total + 1. / new_total)
+    if variance <= 0:
+        return 0, 1.
+    z = ((new_hits / float(new_total) - base_hits / float(base_total)) /
+         math.sqrt(variance))
+    return z, _p_value(z)
+
+
+def welch(base, new):
+    """Welch t-test on two lists of samples, returns a (t, p_value)
+    tuple."""
+    if len(base) < 2 or len(new) < 2:
+        return 0, None
+
+    def mean_variance(samples):
+        mean = sum(samples) / float(len(samples))
+        variance = (sum((sample - mean) ** 2 for sample in samples) /
+                    (len(samples) - 1))
+        return mean, variance / len(samples)
+
+    base_mean, base_variance = mean_variance(base)
+    new_mean, new_variance = mean_variance(new)
+    if base_variance + new_variance <= 0:
+        return 0, 1.
+    t = (new_mean - base_mean) / math.sqrt(base_variance + new_variance)
+    return t, _p_value(t)
+
+
+def _rps(results):
+    """The RPS of every full second of the run."""
+    if not results.timeline:
+        return []
+    return [bucket['rps'] for bucket in results.timeline
+            if bucket['elapsed'] >= 1]
+
+
+def compare(base, new, percentiles=_PERCENTILES, threshold=.05,
+            alpha=.01):
+    """Compares two RunResults, returns a list of Difference.
+
+    A metric is a regression when it got worse by more than `threshold`
+    (relatively) and its p-value, when there is one, is under `alpha`.
+    """
+    base_stats = calc_stats(base, percentiles)
+    new_stats = calc_stats(new, percentiles)
+
+    def difference(metric, base_value, new_value, p_value, higher_is_worse):
+        if base_value:
+            change = (new_value - base_value) / float(base_value)
+            worse = (change > threshold if higher_is_worse
+                     else -change > threshold)
+        else:
+            change = None if new_value else 0.
+            worse = higher_is_worse and bool(new_value)
+        significant = p_value is None or p_value < alpha
+        return Difference(metric, base_value, new_value, change, p_value,
+                          worse and significant)
+
+    differences = []
+    t, p_value = welch(_rps(base), _rps(new))
+    differences.append(difference('rps', base_stats.rps, new_stats.rps,
+                                  p_value, False))
+
+    z, p_value = mann_whitney(base.histogram(), new.histogram())
+    differences.append(difference('avg', base_stats.avg, new_stats.avg,
+                                  p_value, True))
+    for percentile in base_stats.percentiles:
+        differences.append(difference(
+            'p' + percentile, base_stats.percentiles[percentile],
+            new_stats.percentiles[percentile], p_value, True))
+
+    base_calls = base_stats.count + base_stats.errors
+    new_calls = new_stats.count + new_stats.errors
+    z, p_value = proportions(base_stats.errors, base_calls,
+                             new_stats.errors, new_calls)
+    differences.append(difference(
+        'error_ratio', base_stats.errors / float(base_calls or 1),
+        new_stats.errors / float(new_calls or 1), p_value, True))
+    return differences
+
+
+def print_comparison(differences):
+    print('-------- Comparison --------')
+    print('%-18s\t%12s\t%12s\t%8s\t%s' % ('', 'base', 'new', 'change',
+                                          'p-value'))
+    for difference in differences:
+        p_value = ('' if difference.p_value is None else
+                   '%.4f' % difference.p_value)
+        change = ('%8s' % 'new' if difference.change is None else
+                  '%+7.1f%%' % (difference.change * 100))
+        print('%-18s\t%12.4f\t%12.4f\t%s\t%-8s%s' % (
+            difference.metric, difference.base, difference.new, change,
+            p_value,
+            '\tREGRESSION' if difference.regression else ''))
+
+
+def merge(paths):
+    """Merges the results saved in the files at `paths`, as if the runs
+    were parallel: the RPS of their time series add up second by second,
+    when they all have one."""
+    runs = [RunResults.load(path) for path in paths]
+    timelines = [results.timeline for results in runs]
+    merged = runs[0]
+    for results in runs[1:]:
+        merged.merge(results)
+    if len(runs) > 1:
+        merged.timeline = None
+        if all(timelines):
+            merged.timeline = [
+                {'elapsed': min(bucket['elapsed'] for bucket in buckets),
+                 'rps': sum(bucket['rps'] for bucket in buckets)}
+                for buckets in zip(*timelines)]
+    return merged
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='boom compare',
+        description='Compares the results of two runs saved with --save. '
+                    'Exits with 1 when there are regressions.')
+
+    parser.add_argument('base', help='Results of the base run(s), merged '
+                                     'as if they ran in parallel when '
+                                     'several comma-separated files are '
+                                     'given')
+    parser.add_argument('new', help='Results of the new run(s)')
+
+    parser.add_argument('--threshold',
+                        help='Relative change over which a significant '
+                             'difference is a regression (default: 0.05)',
+                        type=float, default=.05)
+
+    parser.add_argument('--alpha',
+                        help='Significance level (default: 0.01)',
+                        type=float, default=.01)
+
+    parser.add_argument('--json-output',
+                        help='Prints the comparison in JSON',
+                        action='store_true')
+
+    args = parser.parse_args(args)
+    try:
+        base = merge(args.base.split(','))
+        new = merge(args.new.split(','))
+    except (IOError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    differences = compare(base, new, threshold=args.threshold,
+                          alpha=args.alpha)
+    if args.json_output:
+        print(json.dumps([difference._asdict()
+                          for difference in differences]))
+    else:
+        print_comparison(differences)
+
+    if any(difference.regression for difference in differences):
+        sys.exit(1)
@@ -0,0 +1,94 @@
+"""
+Connection classes timing the DNS resolution, TCP connect and TLS
+handshake of every new connection.
+
+The timings of the last connection opened by the current greenlet are
+kept in :data:`phases`, which the caller resets before each call, along
+with its address. The address comes from the resolver installed for the
+host, if any (see :mod:`boom.resolver`).
+"""
+import socket
+import time
+
+from gevent.local import local
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import (HTTPConnection,
+                                                  HTTPSConnection)
+from requests.packages.urllib3.connectionpool import (HTTPConnectionPool,
+                                                      HTTPSConnectionPool)
+
+from boom.resolver import next_address
+
+
+#: monotonic, high resolution clock used to time the calls
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Phases(local):
+    """Per-greenlet timings of the connection phases, in seconds.
+
+    Phases are None when the call reused an already opened connection.
+    `address` is the one of the last connection opened (or attempted),
+    which each worker keeps for all its calls as long as it can reuse it.
+    """
+
+    def __init__(self):
+        self.address = None
+        self.reset()
+
+    def reset(self):
+        self.dns = self.connect = self.tls = None
+
+
+phases = Phases()
+
+
+class _TimedConnectionMixin(object):
+
+    def _new_conn(self):
+        start = clock()
+        host = self._dns_host
+        try:
+            # resolving here times the DNS lookup apart from the connect
+            self._dns_host = next_address(host, self.port)[4][0]
+            phases.address = self._dns_host
+        except socket.gaierror:
+            # let urllib3 raise its own error
+            pass
+        connected = clock()
+        phases.dns = connected - start
+        try:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = host
+            phases.connect = clock() - connected
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+
+    def connect(self):
+        start = clock()
+        super(TimedHTTPSConnection, self).connect()
+        phases.tls = clock() - start - phases.dns - phases.connect
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections record their phases."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool}
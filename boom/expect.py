@@ -0,0 +1,112 @@
+"""
+Assertions on the responses, declared on the command line instead of
+written in a post hook::
+
+    $ boom --expect-status 200,204 --expect-header "content-type:json" \\
+        --expect-body-regex '"ok": *true' --expect-size-range 100-2000 URL
+
+They are compiled once for the whole run. A response failing one of them
+is still counted as a successful call, the failure being counted apart
+under the label of the assertion.
+
+The size of a body is the one received, before decompression.
+"""
+import re
+
+
+def parse_status(value):
+    """Parses a comma-separated list of status codes."""
+    try:
+        return tuple(int(code) for code in value.split(','))
+    except ValueError:
+        raise ValueError('Status codes must be comma-separated integers')
+
+
+def parse_header(value):
+    """Parses a NAME:REGEX header assertion."""
+    name, separator, pattern = value.partition(':')
+    if not name.strip() or not separator:
+        raise ValueError('A header assertion must be of the form '
+                         'NAME:REGEX')
+    return name.strip(), parse_regex(pattern.strip())
+
+
+def parse_regex(value):
+    try:
+        re.compile(value)
+    except re.error as e:
+        raise ValueError('Invalid regular expression %r (%s)' % (value, e))
+    return value
+
+
+def parse_size(value):
+    """Parses a MIN-MAX range of sizes in bytes, one of the bounds being
+    optional."""
+    low, separator, high = value.partition('-')
+    try:
+        low = int(low) if low.strip() else None
+        high = int(high) if high.strip() else None
+    except ValueError:
+        low = high = None
+    if not separator or (low is None and high is None):
+        raise ValueError('A size range must be of the form MIN-MAX, MIN- '
+                         'or -MAX, in bytes')
+    return low, high
+
+
+class Expectations(object):
+    """Assertions on the `status` code (a list of the valid ones), the
+    `headers` (a list of (name, regex) tuples), the `body` (a regex) and
+    the `size` of the body (a (min, max) tuple, either bound being None).
+    """
+
+    def __init__(self, status=None, headers=None, body=None, size=None):
+        self.labels = []
+        self.status = None
+        if status:
+            self.status = frozenset(status)
+            self._status_label = self._label(
+                'status in %s' % ','.join('%d' % code for code in status))
+        self.headers = [(name.lower(), re.compile(pattern),
+                         self._label('header %s ~ %s' % (name, pattern)))
+                        for name, pattern in headers or ()]
+        self.body = None
+        if body is not None:
+            self.body = re.compile(body.encode('utf-8'))
+            self._body_label = self._label('body ~ %s' % body)
+        self.size = None
+        if size is not None:
+            self.size = tuple(size)
+            self._size_label = self._label('size in %s-%s' % tuple(
+                '' if bound is None else bound for bound in size))
+
+    def _label(self, label):
+        self.labels.append(label)
+        return label
+
+    def __bool__(self):
+        return bool(self.labels)
+
+    __nonzero__ = __bool__
+
+    def record(self, results, status, headers, size, body=None):
+        """Counts the assertions a response fails into `results`.
+
+        `headers` maps the lowercased names to their value, `body` is
+        only needed when there is an assertion on it.
+        """
+        failures = results.assertion_failures
+        if self.status is not None and status not in self.status:
+            failures[self._status_label] += 1
+        if self.size is not None:
+            low, high = self.size
+            if ((low is not None and size < low) or
+                    (high is not None and size > high)):
+                failures[self._size_label] += 1
+        for name, pattern, label in self.headers:
+            value = headers.get(name)
+            if value is None or pattern.search(value) is None:
+                failures[label] += 1
+        if self.body is not None and (body is None or
+                                      self.body.search(body) is None):
+            failures[self._body_label] += 1
@@ -0,0 +1,170 @@
+"""
+Fixed-memory latency histogram, in the spirit of HdrHistogram.
+
+Values (durations in seconds) are recorded as integer microseconds in
+log-linear buckets: values are exact below ``2 * 10 ** digits`` µs and
+beyond that every power of two is split in sub-buckets so the relative
+error stays under ``10 ** -digits``. The memory used only depends on the
+range of the recorded values, never on how many were recorded.
+
+    >>> h = Histogram()
+    >>> h.record(0.25)
+    >>> h.record(0.75)
+    >>> len(h), h.min, h.max, h.mean()
+    (2, 0.25, 0.75, 0.5)
+"""
+import math
+
+
+_UNIT = 1000000.   # microseconds
+
+
+class Histogram(object):
+    """Log-bucketed histogram of durations.
+
+    `significant_digits` controls the precision (1 to 5) of the recorded
+    values. The exact count, sum, min and max are kept aside the buckets.
+    """
+
+    def __init__(self, significant_digits=3):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError('significant_digits must be between 1 and 5')
+        self.significant_digits = significant_digits
+        largest = 2 * 10 ** significant_digits
+        self._sub_bucket_bits = int(math.ceil(math.log(largest, 2)))
+        self._sub_bucket_count = 1 << self._sub_bucket_bits
+        self._sub_bucket_half = self._sub_bucket_count >> 1
+        self.counts = {}
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self._sub_bucket_count:
+            return value
+        shift = value.bit_length() - self._sub_bucket_bits
+        return (shift * self._sub_bucket_half) + (value >> shift)
+
+    def _value(self, index):
+        """Returns the value in the middle of the bucket at `index`."""
+        if index < self._sub_bucket_count:
+            return index
+        shift = index // self._sub_bucket_half - 1
+        lowest = (index - shift * self._sub_bucket_half) << shift
+        return lowest + ((1 << shift) - 1) / 2.
+
+    def record(self, value):
+        """Records a duration, in seconds."""
+        index = self._index(int(value * _UNIT + .5))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    # list-like API, so code filling the former lists keeps working
+    append = record
+
+    def extend(self, values):
+        for value in values:
+            self.record(value)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        """Yields (value, count) tuples, in increasing value order."""
+        for index in sorted(self.counts):
+            yield self._value(index) / _UNIT, self.counts[index]
+
+    def merge(self, other):
+        """Adds the values recorded by `other` to this histogram."""
+        if other.significant_digits != self.significant_digits:
+            raise ValueError('Cannot merge histograms of different '
+                             'precisions')
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is None:
+                continue
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+        return self
+
+    def diff(self, previous):
+        """Returns a histogram of the values recorded since `previous`, an
+        earlier copy of this histogram.
+
+        The min and max of the returned histogram are bucket values.
+        """
+        histogram = Histogram(self.significant_digits)
+        for index, count in self.counts.items():
+            count -= previous.counts.get(index, 0)
+            if count:
+                histogram.counts[index] = count
+        histogram.count = self.count - previous.count
+        histogram.total = self.total - previous.total
+        if histogram.counts:
+            histogram.min = self._value(min(histogram.counts)) / _UNIT
+            histogram.max = self._value(max(histogram.counts)) / _UNIT
+        return histogram
+
+    def to_dict(self):
+        """Returns a JSON-serializable representation of the histogram."""
+        return {'significant_digits': self.significant_digits,
+                'counts': sorted(self.counts.items()),
+                'count': self.count, 'total': self.total,
+                'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds a histogram out of a :meth:`to_dict` representation."""
+        histogram = cls(data['significant_digits'])
+        histogram.counts = dict((index, count)
+                                for index, count in data['counts'])
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.min = data['min']
+        histogram.max = data['max']
+        return histogram
+
+    def percentiles(self, percentiles):
+        """Returns the values at the given percentiles (0 to 100), computed
+        in a single pass over the buckets."""
+        if self.count == 0:
+            return [0] * len(percentiles)
+        ranks = [min(max(int(math.ceil(p * self.count / 100.)), 1),
+                     self.count) for p in percentiles]
+        targets = sorted((rank, i) for i, rank in enumerate(ranks))
+        results = [None] * len(percentiles)
+        seen = 0
+        buckets = iter(self)
+        for rank, i in targets:
+            while seen < rank:
+                value, count = next(buckets)
+                seen += count
+            results[i] = min(max(value, self.min), self.max)
+        return results
+
+    def percentile(self, percentile):
+        return self.percentiles([percentile])[0]
+
+    def mean(self):
+        if self.count == 0:
+            return 0
+        return self.total / self.count
+
+    def stdev(self):
+        if self.count == 0:
+            return 0
+        mean = self.mean()
+        variance = sum(count * (value - mean) ** 2
+                       for value, count in self) / self.count
+        return math.sqrt(variance)
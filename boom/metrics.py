@@ -0,0 +1,229 @@
+"""
+Live metrics of a run, for the dashboards watching it while it is in
+progress: an HTTP endpoint scraped by Prometheus, and/or stats pushed to
+StatsD over UDP.
+
+Both read the RunResults the calls are recorded into, like the time
+series do, so exporting them costs the same whatever the rate of the
+calls: a scrape or a push only walks the buckets of the histograms.
+"""
+import socket
+from collections import defaultdict
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+from boom.connection import clock
+from boom.histogram import Histogram
+
+
+#: upper bounds of the buckets of the Prometheus latency histogram
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _error_types(results):
+    """Counts the errors per exception class."""
+    types = defaultdict(int)
+    for error, count in results.error_counter.items():
+        types[error.split(':', 1)[0]] += count
+    return types
+
+
+def prometheus(results):
+    """Returns the current metrics of `results` in the Prometheus text
+    format."""
+    lines = []
+
+    def metric(name, kind, help, samples):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s %s' % (name, kind))
+        for labels, value in samples:
+            if labels:
+                labels = '{%s}' % ','.join('%s="%s"' % (key, _escape(label))
+                                           for key, label in labels)
+            lines.append('%s%s %r' % (name, labels or '', value))
+
+    metric('boom_calls_total', 'counter', 'Calls done, by status code.',
+           [((('status', code),), len(histogram)) for code, histogram in
+            sorted(results.status_code_counter.items())])
+    metric('boom_errors_total', 'counter', 'Calls failed, by error type.',
+           [((('type', name),), count) for name, count in
+            sorted(_error_types(results).items())])
+
+    histogram = results.histogram()
+    samples = []
+    bounds = iter(BUCKETS)
+    bound = next(bounds)
+    cumulated = 0
+    for value, count in histogram:
+        while bound is not None and value > bound:
+            samples.append(((('le', '%g' % bound),), cumulated))
+            bound = next(bounds, None)
+        cumulated += count
+    while bound is not None:
+        samples.append(((('le', '%g' % bound),), cumulated))
+        bound = next(bounds, None)
+    samples.append(((('le', '+Inf'),), histogram.count))
+    metric('boom_latency_seconds', 'histogram', 'Latency of the calls.', [])
+    lines.extend('boom_latency_seconds_bucket{le="%s"} %d' % (
+        labels[0][1], value) for labels, value in samples)
+    lines.append('boom_latency_seconds_sum %r' % histogram.total)
+    lines.append('boom_latency_seconds_count %d' % histogram.count)
+
+    metric('boom_body_bytes_total', 'counter',
+           'Bytes of the response bodies received.',
+           [((), sum(results.body_bytes.values()))])
+    if results.assertion_failures:
+        metric('boom_assertion_failures_total', 'counter',
+               'Responses failing an assertion, by assertion.',
+               [((('assertion', label),), count) for label, count in
+                results.assertion_failures.items()])
+    if results.backends or results.backend_errors:
+        metric('boom_backend_calls_total', 'counter',
+               'Calls done, by backend address.',
+               [((('address', address),), len(histogram)) for
+                address, histogram in sorted(results.backends.items())])
+        metric('boom_backend_errors_total', 'counter',
+               'Calls failed, by backend address.',
+               [((('address', address),), count) for address, count in
+                sorted(results.backend_errors.items())])
+    return '\n'.join(lines) + '\n'
+
+
+class PrometheusExporter(object):
+    """Serves the metrics of `results` on /metrics at the (host, port)
+    `address` during the run."""
+
+    def __init__(self, results, address):
+        self.results = results
+        self.address = (address[0] or '0.0.0.0', address[1])
+        self._server = None
+
+    def _app(self, environ, start_response):
+        if environ['PATH_INFO'] != '/metrics':
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        body = prometheus(self.results).encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+            ('Content-Length', str(len(body)))])
+        return [body]
+
+    def start(self):
+        self._server = WSGIServer(self.address, self._app, log=None)
+        self._server.start()
+        # the port chosen when binding on 0
+        self.address = self._server.address[:2]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.stop()
+            self._server = None
+
+
+class StatsdExporter(object):
+    """Pushes the metrics of `results` to the StatsD server at the
+    (host, port) `address` every `interval` seconds, in UDP packets of at
+    most `packet_size` bytes.
+
+    Counters are pushed as the increments since the previous push, the
+    RPS and the latencies of the interval (average and `percentiles`, in
+    milliseconds) as gauges, their names starting with `prefix`.
+    """
+
+    def __init__(self, results, address, interval=1, prefix='boom',
+                 percentiles=(50, 90, 99), packet_size=1432):
+        self.results = results
+        self.address = address
+        self.interval = interval
+        self.prefix = prefix
+        self.percentiles = percentiles
+        self.packet_size = packet_size
+        self._sock = self._greenlet = None
+
+    def start(self):
+        family, type_, proto, _, self._sockaddr = socket.getaddrinfo(
+            self.address[0] or '127.0.0.1', self.address[1], 0,
+            socket.SOCK_DGRAM)[0]
+        self._sock = socket.socket(family, type_, proto)
+        self._previous = Histogram(self.results.precision)
+        self._counters = {}
+        self._last = clock()
+        self._greenlet = gevent.spawn(self._run)
+
+    def _run(self):
+        deadline = self._last
+        while True:
+            deadline += self.interval
+            gevent.sleep(max(deadline - clock(), 0))
+            self.push()
+
+    def stop(self):
+        """Pushes the last, partial, interval."""
+        if self._greenlet is None:
+            return
+        self._greenlet.kill()
+        self._greenlet = None
+        self.push()
+        self._sock.close()
+
+    def _increments(self):
+        results = self.results
+        counters = {'errors': results.error_count(),
+                    'body_bytes': sum(results.body_bytes.values()),
+                    'assertion_failures': sum(
+                        results.assertion_failures.values())}
+        for code, histogram in results.status_code_counter.items():
+            counters['calls.%s' % code] = len(histogram)
+        for name, value in sorted(counters.items()):
+            increment = value - self._counters.get(name, 0)
+            self._counters[name] = value
+            if increment:
+                yield name, increment
+
+    def metrics(self):
+        """Returns the lines of the metrics since the previous call."""
+        now = clock()
+        elapsed = now - self._last
+        self._last = now
+        histogram = self.results.histogram()
+        interval = histogram.diff(self._previous)
+        self._previous = histogram
+
+        lines = ['%s.%s:%d|c' % (self.prefix, name, increment)
+                 for name, increment in self._increments()]
+        rps = len(interval) / elapsed if elapsed > 0 else 0
+        lines.append('%s.rps:%g|g' % (self.prefix, rps))
+        if len(interval):
+            lines.append('%s.latency.avg:%g|g' % (
+                self.prefix, interval.mean() * 1000))
+            for percentile, value in zip(
+                    self.percentiles, interval.percentiles(self.percentiles)):
+                lines.append('%s.latency.p%g:%g|g' % (
+                    self.prefix, percentile, value * 1000))
+        return lines
+
+    def push(self):
+        """Sends the metrics since the previous push, batched in as few
+        packets as possible."""
+        packet = b''
+        for line in self.metrics():
+            line = line.encode('utf-8')
+            if packet and len(packet) + 1 + len(line) > self.packet_size:
+                self._send(packet)
+                packet = b''
+            packet = packet + b'\n' + line if packet else line
+        if packet:
+            self._send(packet)
+
+    def _send(self, packet):
+        try:
+            self._sock.sendto(packet, self._sockaddr)
+        except socket.error:
+            # metrics are best effort, the run goes on
+            pass
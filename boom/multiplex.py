@@ -0,0 +1,359 @@
+"""
+HTTP/2 client multiplexing the calls of the workers as streams over a
+few connections, instead of giving each worker its own connection.
+
+It needs the h2 library (``pip install h2``). Plain HTTP URLs are spoken
+to with prior knowledge of HTTP/2, HTTPS ones negotiate it with ALPN.
+
+Each connection carries up to `max_streams` concurrent streams, fewer
+when the server's SETTINGS_MAX_CONCURRENT_STREAMS is lower: the workers
+over the limit wait for a stream to end. Streams reset by the server and
+GOAWAY frames are counted. After a GOAWAY, the streams the server won't
+process fail, the others end normally, then the connection is reopened.
+
+Response bodies are read and discarded, errors are raised as requests
+exceptions like the other engines do.
+"""
+import socket
+import ssl
+from functools import partial
+
+import gevent
+from gevent.event import AsyncResult, Event
+from gevent.lock import Semaphore
+from requests.exceptions import ConnectionError, RequestException
+
+from boom.connection import clock
+from boom.resolver import next_address
+
+try:
+    from h2 import events
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.exceptions import ProtocolError
+except ImportError:
+    H2Connection = None
+
+
+# connection-specific headers, forbidden in HTTP/2
+_HOP_BY_HOP = ('connection', 'keep-alive', 'proxy-connection',
+               'transfer-encoding', 'upgrade')
+
+
+class StreamReset(RequestException):
+    """Raised when the server resets the stream of a call."""
+
+
+def _code(error_code):
+    return getattr(error_code, 'name', error_code)
+
+
+def request_headers(request):
+    """Returns the HTTP/2 header block of the wire.Request `request`.
+
+    The Host header becomes the :authority pseudo-header.
+    """
+    authority = request.netloc
+    fields = []
+    for name, value in request.fields:
+        name = name.lower()
+        if name == 'host':
+            authority = value
+        elif name not in _HOP_BY_HOP:
+            fields.append((name, value))
+    return [(':method', request.method), (':scheme', request.scheme),
+            (':authority', authority), (':path', request.path)] + fields
+
+
+def request_body(request):
+    """Returns the body of `request`, as bytes."""
+    data = request.data
+    if data is not None and not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return data
+
+
+class _Stream(object):
+
+    def __init__(self):
+        self.status = self.first_byte = self.headers = None
+        self.size = 0
+        # set to (status, first_byte) when the response ends
+        self.response = AsyncResult()
+
+
+class Connection(object):
+    """A HTTP/2 connection to `host`:`port` (over TLS when `secure` is
+    True), opened on the first call and reopened when the server closes
+    it or sends a GOAWAY frame.
+
+    `opened` counts the connections opened, `streams` the calls sent,
+    `resets` the streams reset by the server and `goaways` the GOAWAY
+    frames received.
+    """
+
+    def __init__(self, host, port, secure=False, max_streams=100):
+        if H2Connection is None:
+            raise ValueError('HTTP/2 needs the h2 library: pip install h2')
+        self.host = host
+        self.port = port
+        self.secure = secure
+        self.max_streams = max_streams
+        self.opened = self.streams = self.resets = self.goaways = 0
+        # of the last connection opened (or attempted)
+        self.address = None
+        self._sock = self._conn = self._reader = None
+        self._connecting = self._draining = self._settled = False
+        self._limit = max_streams
+        # stream id -> _Stream of the calls in flight
+        self._pending = {}
+        self._changed = Event()
+        # the frames of a connection are sent in the order h2 wrote them
+        self._lock = Semaphore()
+
+    def _notify(self):
+        changed, self._changed = self._changed, Event()
+        changed.set()
+
+    def request(self, headers, body=None):
+        """Sends a call on a new stream and waits for the end of its
+        response, whose body is discarded.
+
+        Returns a (status, dns, connect, tls, first_byte, size, headers)
+        tuple: the time spent resolving the host, connecting and doing the
+        TLS handshake (None when the connection was already open), the
+        clock time when the headers of the response were received, the
+        size of its body and its headers, as a list of (name, value)
+        bytes.
+        """
+        timings = (None, None, None)
+        while True:
+            if self._connecting:
+                self._changed.wait()
+            elif self._conn is None:
+                timings = self._open()
+            elif self._draining and not self._pending:
+                self.close()
+            elif not self._draining and len(self._pending) < self._limit:
+                break
+            else:
+                self._changed.wait()
+
+        conn = self._conn
+        stream_id = conn.get_next_available_stream_id()
+        stream = self._pending[stream_id] = _Stream()
+        self.streams += 1
+        try:
+            conn.send_headers(stream_id, headers, end_stream=not body)
+            self._flush(conn)
+            if body:
+                self._send_body(conn, stream_id, stream, body)
+            status, first_byte = stream.response.get()
+        except RequestException:
+            raise
+        except (socket.error, ProtocolError) as exc:
+            self._drop(ConnectionError(exc))
+            raise ConnectionError(exc)
+        finally:
+            del self._pending[stream_id]
+            self._notify()
+        return (status,) + timings + (first_byte, stream.size,
+                                      stream.headers)
+
+    def _open(self):
+        # the calls wait for the settings of the server, which may allow
+        # fewer concurrent streams than `max_streams`
+        self._connecting = True
+        try:
+            timings = self._connect()
+            conn = self._conn
+            while self._conn is conn and not self._settled:
+                self._changed.wait()
+            if self._conn is not conn:
+                raise ConnectionError('Connection closed by the server')
+        except RequestException:
+            raise
+        except socket.error as exc:
+            self._drop(ConnectionError(exc))
+            raise ConnectionError(exc)
+        finally:
+            self._connecting = False
+            self._notify()
+        self.opened += 1
+        return timings
+
+    def _connect(self):
+        start = clock()
+        family, type_, proto, _, address = next_address(self.host,
+                                                        self.port)
+        self.address = address[0]
+        resolved = clock()
+        sock = socket.socket(family, type_, proto)
+        tls = None
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.connect(address)
+            connected = clock()
+            if self.secure:
+                context = ssl.create_default_context()
+                context.set_alpn_protocols(['h2'])
+                sock = context.wrap_socket(sock, server_hostname=self.host)
+                tls = clock() - connected
+                if sock.selected_alpn_protocol() != 'h2':
+                    raise ConnectionError("%s doesn't speak HTTP/2" %
+                                          self.host)
+        except BaseException:
+            sock.close()
+            raise
+
+        conn = H2Connection(H2Configuration(client_side=True,
+                                            header_encoding=None))
+        conn.initiate_connection()
+        self._sock, self._conn = sock, conn
+        self._limit = self.max_streams
+        self._settled = False
+        self._flush(conn)
+        self._reader = gevent.spawn(self._read, sock, conn)
+        return resolved - start, connected - resolved, tls
+
+    def _flush(self, conn):
+        with self._lock:
+            data = conn.data_to_send()
+            if data and conn is self._conn:
+                self._sock.sendall(data)
+
+    def _send_body(self, conn, stream_id, stream, body):
+        # as much as the flow control windows let through, then waits
+        # for the server to open them
+        while not stream.response.ready():
+            window = min(conn.local_flow_control_window(stream_id),
+                         conn.max_outbound_frame_size)
+            if window <= 0:
+                self._changed.wait()
+                continue
+            chunk, body = body[:window], body[window:]
+            conn.send_data(stream_id, chunk, end_stream=not body)
+            self._flush(conn)
+            if not body:
+                return
+
+    def _read(self, sock, conn):
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    raise EOFError('Connection closed by the server')
+                for event in conn.receive_data(data):
+                    self._handle(conn, event)
+                self._flush(conn)
+        except (socket.error, EOFError, ProtocolError) as exc:
+            self._drop(ConnectionError(exc))
+
+    def _handle(self, conn, event):
+        stream = self._pending.get(getattr(event, 'stream_id', None))
+
+        if isinstance(event, events.ResponseReceived):
+            if stream is not None:
+                stream.headers = event.headers
+                stream.status = int(dict(event.headers)[b':status'])
+                stream.first_byte = clock()
+        elif isinstance(event, events.DataReceived):
+            if stream is not None:
+                stream.size += len(event.data)
+            conn.acknowledge_received_data(event.flow_controlled_length,
+                                           event.stream_id)
+        elif isinstance(event, events.StreamEnded):
+            if stream is not None:
+                stream.response.set((stream.status, stream.first_byte))
+        elif isinstance(event, events.StreamReset):
+            self.resets += 1
+            if stream is not None:
+                stream.response.set_exception(StreamReset(
+                    'Stream reset by the server (%s)' %
+                    _code(event.error_code)))
+        elif isinstance(event, events.ConnectionTerminated):
+            self.goaways += 1
+            self._draining = True
+            last = event.last_stream_id
+            for stream_id, stream in self._pending.items():
+                if last is None or stream_id > last:
+                    stream.response.set_exception(ConnectionError(
+                        'Stream refused by a GOAWAY frame (%s)' %
+                        _code(event.error_code)))
+            self._notify()
+        elif isinstance(event, events.RemoteSettingsChanged):
+            self._limit = min(self.max_streams,
+                              conn.remote_settings.max_concurrent_streams)
+            self._settled = True
+            self._notify()
+        elif isinstance(event, events.WindowUpdated):
+            self._notify()
+
+    def _drop(self, error):
+        """Closes the connection, failing its calls in flight with
+        `error`."""
+        reader = self._reader
+        self._reader = None
+        if reader is not None and reader is not gevent.getcurrent():
+            reader.kill(block=False)
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._conn = None
+        self._draining = False
+        for stream in self._pending.values():
+            if not stream.response.ready():
+                stream.response.set_exception(error)
+        self._notify()
+
+    def close(self):
+        self._drop(ConnectionError('Connection closed'))
+
+
+def call(connection, headers, body, results, scheduled=None,
+         endpoint=None, expect=None):
+    """Performs a call through `connection` and records it into
+    `results`, like :func:`boom.boom.onecall` does, checking the response
+    against the `expect` Expectations when given."""
+    sent = clock()
+    try:
+        (status, dns, connect, tls, first_byte, size,
+         response_headers) = connection.request(headers, body)
+        done = clock()
+    except RequestException as exc:
+        results.record_error(exc, endpoint, connection.address)
+        return
+    if expect is not None and expect.headers:
+        response_headers = dict(
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in response_headers)
+    results.record_call(status, sent, first_byte, done, size, scheduled, dns,
+                        connect, tls, endpoint, connection.address, expect,
+                        response_headers)
+
+
+class Engine(object):
+    """Performs the calls of a run over HTTP/2: the wire.Request `request`
+    is sent as streams multiplexed over `connections` Connections shared by
+    the workers, each carrying up to `max_streams` of them. The responses
+    are checked against the `expect` Expectations when given."""
+
+    def __init__(self, request, connections=1, max_streams=100,
+                 expect=None):
+        self.request = request
+        self.connections = max(connections, 1)
+        self.max_streams = max_streams
+        self.expect = expect
+        # encoded once for all the calls
+        self.headers = request_headers(request)
+        self.body = request_body(request)
+
+    def connect(self):
+        request = self.request
+        return Connection(request.host, request.port,
+                          request.scheme == 'https', self.max_streams)
+
+    def caller(self, connection, results):
+        """Returns the `call(scheduled, endpoint)` function of the workers
+        sharing `connection`, for :func:`boom.boom.work`."""
+        return partial(call, connection, self.headers, self.body, results,
+                       expect=self.expect)
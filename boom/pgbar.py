@@ -105,15 +105,24 @@ class AnimatedProgressBar(ProgressBar):
     """
 
     def __init__(self, *args, **kwargs):
+        self.stdout = kwargs.pop('stdout', sys.stdout)
         super(AnimatedProgressBar, self).__init__(*args, **kwargs)
-        self.stdout = kwargs.get('stdout', sys.stdout)
-
-    def show_progress(self):
-        if hasattr(self.stdout, 'isatty') and self.stdout.isatty():
-            self.stdout.write('\r')
+        self._length = 0
+
+    def isatty(self):
+        return hasattr(self.stdout, 'isatty') and self.stdout.isatty()
+
+    def show_progress(self, extra=''):
+        """Writes the progress bar, followed by the optional `extra` text."""
+        line = str(self)
+        if extra:
+            line += ' ' + extra
+        if self.isatty():
+            # pad with spaces to erase a longer previous line
+            self.stdout.write('\r' + line.ljust(self._length))
         else:
-            self.stdout.write('\n')
-        self.stdout.write(str(self))
+            self.stdout.write('\n' + line)
+        self._length = len(line)
         self.stdout.flush()
 
 
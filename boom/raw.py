@@ -0,0 +1,263 @@
+"""
+Fast path for plain calls, going straight to the sockets.
+
+requests prepares every call (PreparedRequest, cookie jar, header
+dictionaries, redirect handling), which is what costs the most CPU per
+call at high rates. Here the request is serialized once for the whole
+run and written on persistent sockets, and only the status line and the
+framing of the responses are parsed, their bodies being read into a
+buffer reused from one call to the next.
+
+It is used for GET and HEAD calls over plain HTTP, without hooks nor
+data. GET redirects are followed like requests does when they stay on
+the same host, the others are handed to requests. Errors are raised as
+requests exceptions, so the results don't depend on the path taken.
+"""
+import socket
+from functools import partial
+
+import requests
+from requests.exceptions import ConnectionError, TooManyRedirects
+
+from boom.connection import clock
+from boom.resolver import next_address
+from boom.wire import (ProtocolError, Request, chunk_size, has_body,
+                       parse_head)
+
+try:
+    import urlparse
+except ImportError:
+    from urllib import parse as urlparse
+
+
+_REDIRECTS = (301, 302, 303, 307, 308)
+#: same limit as requests
+MAX_REDIRECTS = 30
+
+
+def supports(method, url, data=None, pre_hook=None, post_hook=None):
+    """Tells if calls with these options can take the fast path."""
+    return (method.upper() in ('GET', 'HEAD') and data is None and
+            pre_hook is None and post_hook is None and
+            urlparse.urlsplit(url).scheme == 'http')
+
+
+class Connection(object):
+    """A persistent connection to `host`:`port`, opened on the first call
+    and reopened whenever the server closes it.
+
+    Responses are read in a single buffer of `size` bytes, which bounds
+    the size of their head. `received` counts the bytes of their bodies.
+    """
+
+    def __init__(self, host, port, size=65536):
+        self.host = host
+        self.port = port
+        self.opened = self.calls = self.received = 0
+        # of the last connection opened (or attempted)
+        self.address = None
+        self._sock = None
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        # the unread bytes are self._buffer[self._start:self._end]
+        self._start = self._end = 0
+
+    def exchange(self, request):
+        """Sends the wire.Request `request` and reads the whole response.
+
+        Returns a (status, headers, dns, connect, first_byte) tuple: the
+        time spent resolving the host and connecting (None when the
+        connection was reused) and the clock time when the head of the
+        response was received.
+        """
+        reused = self._sock is not None
+        dns = connect = None
+        if not reused:
+            dns, connect = self._connect()
+        self.calls += 1
+
+        try:
+            self._sock.sendall(request.payload)
+            head = self._read_until(b'\r\n\r\n')
+        except (socket.error, EOFError):
+            self.close()
+            if not reused:
+                raise
+            # the server closed the connection while it was idle
+            self.calls -= 1
+            return self.exchange(request)
+        except BaseException:
+            self.close()
+            raise
+
+        try:
+            first_byte = clock()
+            status, keepalive, length, headers = parse_head(head)
+            if has_body(request.method, status):
+                self._skip_body(length)
+                if length is None:
+                    keepalive = False
+        except BaseException:
+            self.close()
+            raise
+        if not keepalive:
+            self.close()
+        return status, headers, dns, connect, first_byte
+
+    def _connect(self):
+        start = clock()
+        family, type_, proto, _, address = next_address(self.host,
+                                                        self.port)
+        self.address = address[0]
+        resolved = clock()
+        sock = socket.socket(family, type_, proto)
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.connect(address)
+        except BaseException:
+            sock.close()
+            raise
+        self._sock = sock
+        self._start = self._end = 0
+        self.opened += 1
+        return resolved - start, clock() - resolved
+
+    def _fill(self):
+        """Receives more bytes after the unread ones."""
+        if self._start == self._end:
+            self._start = self._end = 0
+        elif self._end == len(self._buffer):
+            unread = self._end - self._start
+            if unread == len(self._buffer):
+                raise ProtocolError('Response head too large')
+            self._buffer[:unread] = self._buffer[self._start:self._end]
+            self._start, self._end = 0, unread
+        received = self._sock.recv_into(self._view[self._end:])
+        if not received:
+            raise EOFError('Connection closed by the server')
+        self._end += received
+
+    def _read_until(self, separator):
+        while True:
+            index = self._buffer.find(separator, self._start, self._end)
+            if index >= 0:
+                end = index + len(separator)
+                data = bytes(self._view[self._start:end])
+                self._start = end
+                return data
+            self._fill()
+
+    def _skip(self, size):
+        while size > self._end - self._start:
+            size -= self._end - self._start
+            self._start = self._end
+            self._fill()
+        self._start += size
+
+    def _skip_body(self, length):
+        if length is None:
+            try:
+                while True:
+                    self.received += self._end - self._start
+                    self._start = self._end
+                    self._fill()
+            except EOFError:
+                return
+        elif length >= 0:
+            self.received += length
+            self._skip(length)
+        else:
+            while True:
+                size = chunk_size(self._read_until(b'\r\n'))
+                if size == 0:
+                    break
+                self.received += size
+                self._skip(size + 2)
+            # trailers, up to the empty line
+            while self._read_until(b'\r\n') != b'\r\n':
+                pass
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+
+def _follow(connection, request):
+    """Performs `request` and the redirects that follow it.
+
+    Returns a (status, headers, dns, connect, first_byte) tuple.
+    """
+    dns = connect = None
+    for hop in range(MAX_REDIRECTS + 1):
+        try:
+            status, headers, hop_dns, hop_connect, first_byte = \
+                connection.exchange(request)
+        except (socket.error, EOFError, ProtocolError) as exc:
+            raise ConnectionError(exc)
+        if hop_dns is not None:
+            dns, connect = hop_dns, hop_connect
+
+        # like requests.head, HEAD calls don't follow redirects
+        if (request.method == 'HEAD' or status not in _REDIRECTS or
+                'location' not in headers):
+            return status, headers, dns, connect, first_byte
+
+        url = urlparse.urljoin(request.url, headers['location'])
+        parts = urlparse.urlsplit(url)
+        if (parts.scheme != 'http' or parts.hostname != connection.host or
+                (parts.port or 80) != connection.port):
+            # another host: requests takes it from here
+            redirect_headers = dict(
+                (name, value) for name, value in request.headers.items()
+                if name.lower() != 'host')
+            res = requests.request(request.method, url,
+                                   headers=redirect_headers,
+                                   auth=request.auth)
+            return res.status_code, res.headers, dns, connect, clock()
+        request = Request(request.method, url, request.headers,
+                          request.data, request.auth, request.keepalive)
+
+    raise TooManyRedirects('Exceeded %d redirects.' % MAX_REDIRECTS)
+
+
+def call(connection, request, results, scheduled=None, endpoint=None,
+         expect=None):
+    """Performs `request` through `connection` and records it into
+    `results`, like :func:`boom.boom.onecall` does, checking the response
+    against the `expect` Expectations when given."""
+    sent = clock()
+    received = connection.received
+    try:
+        status, headers, dns, connect, first_byte = _follow(connection,
+                                                            request)
+        done = clock()
+    except requests.RequestException as exc:
+        results.record_error(exc, endpoint, connection.address)
+    else:
+        results.record_call(status, sent, first_byte, done,
+                            connection.received - received, scheduled, dns,
+                            connect, None, endpoint, connection.address,
+                            expect, headers)
+
+
+class Engine(object):
+    """Performs the calls of a run on the fast path: each worker keeps a
+    Connection to the host of the wire.Request `request`, and checks the
+    responses against the `expect` Expectations when given."""
+
+    #: connections are not shared by the workers
+    connections = None
+
+    def __init__(self, request, expect=None):
+        self.request = request
+        self.expect = expect
+
+    def connect(self):
+        return Connection(self.request.host, self.request.port)
+
+    def caller(self, connection, results):
+        """Returns the `call(scheduled, endpoint)` function of the worker
+        using `connection`, for :func:`boom.boom.work`."""
+        return partial(call, connection, self.request, results,
+                       expect=self.expect)
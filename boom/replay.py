@@ -0,0 +1,131 @@
+"""
+Replays the calls listed in a file: a list of URLs (optionally prefixed
+by the HTTP method) or an access log in the common or combined format.
+Gzipped files are read transparently.
+
+The file is read line by line by a greenlet that stays at most
+`readahead` calls ahead of the workers, so memory does not depend on the
+size of the file.
+"""
+import calendar
+import gzip
+import logging
+import re
+from datetime import datetime
+from itertools import islice
+
+import gevent
+import requests
+from gevent.queue import Queue
+
+from boom.connection import clock
+from boom.scenario import Endpoint
+
+try:
+    import urlparse
+except ImportError:
+    from urllib import parse as urlparse
+
+
+logger = logging.getLogger('boom')
+
+_ACCESS_LOG = re.compile(r'^\S+ \S+ \S+ \[(?P<time>[^\]]+)\] '
+                         r'"(?P<method>[A-Z]+) (?P<url>\S+)[^"]*"')
+_URL = re.compile(r'^(?:(?P<method>[A-Z]+)\s+)?(?P<url>\S+)$')
+
+
+def parse_time(value):
+    """Returns the timestamp of an access log time, such as
+    10/Oct/2000:13:55:36 -0700.
+    """
+    date, offset = value.split(' ')
+    timestamp = calendar.timegm(
+        datetime.strptime(date, '%d/%b/%Y:%H:%M:%S').timetuple())
+    offset = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    return timestamp - offset if value[-5] == '+' else timestamp + offset
+
+
+def read_calls(path):
+    """Yields a (timestamp, method, url) tuple for each call of the file.
+
+    The timestamp is None in URL lists. Lines that can't be parsed are
+    skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        for line in f:
+            line = line.decode('utf-8', 'replace').strip()
+            if not line or line.startswith('#'):
+                continue
+            match = _ACCESS_LOG.match(line)
+            if match is not None:
+                try:
+                    timestamp = parse_time(match.group('time'))
+                except (ValueError, IndexError):
+                    logger.debug('Invalid time in %r' % line)
+                    continue
+                yield timestamp, match.group('method'), match.group('url')
+                continue
+            match = _URL.match(line)
+            if match is None:
+                logger.debug('Skipping %r' % line)
+                continue
+            yield None, match.group('method') or 'GET', match.group('url')
+
+
+class Replay(object):
+    """Shared iterator of (scheduled, endpoint) jobs read from `path`.
+
+    URLs are joined to `base_url`. With a `speed` factor, calls are
+    scheduled to keep the time between them in the file, divided by
+    `speed`, starting at the `start` clock time. Only the `num` first
+    calls are replayed when `num` is not None.
+    """
+
+    def __init__(self, path, base_url=None, headers=None, speed=None,
+                 start=None, num=None, readahead=1000):
+        self.path = path
+        self.base_url = base_url
+        self.headers = headers or {}
+        self.speed = speed
+        self.start = clock() if start is None else start
+        self.num = num
+        self._queue = Queue(readahead)
+        self._reader = gevent.spawn(self._read)
+
+    def _read(self):
+        first = None
+        try:
+            for timestamp, method, url in islice(read_calls(self.path),
+                                                 self.num):
+                if not hasattr(requests, method.lower()):
+                    logger.debug('Skipping %s %s' % (method, url))
+                    continue
+                scheduled = None
+                if self.speed is not None and timestamp is not None:
+                    if first is None:
+                        first = timestamp
+                    scheduled = self.start + (timestamp - first) / self.speed
+                if self.base_url is not None:
+                    url = urlparse.urljoin(self.base_url, url)
+                endpoint = Endpoint(None, method, url, self.headers, None, 1)
+                self._queue.put((scheduled, endpoint))
+        except (IOError, OSError) as e:
+            logger.error('Could not read %s (%s)' % (self.path, e))
+        self._queue.put(StopIteration)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        job = self._queue.get()
+        if job is StopIteration:
+            # let the other workers stop as well
+            self._queue.put(StopIteration)
+            raise StopIteration
+        return job
+
+    next = __next__
+
+    def stop(self):
+        self._reader.kill()
@@ -0,0 +1,90 @@
+"""
+Resolver spreading the connections over all the addresses of a host.
+
+A host fronting a pool of backends resolves to several A and AAAA
+records, and connecting to the first one only would load a single
+backend. A Resolver looks them all up with ``getaddrinfo`` and hands
+them in turn to the new connections, looking them up again once they
+are older than its TTL (the system resolver doesn't tell the TTL of the
+records).
+
+The connections of boom (through requests, the fast path or HTTP/2)
+get their address from :func:`next_address`, which uses the resolver
+installed for the host if there is one.
+"""
+import socket
+import time
+from itertools import count
+
+
+# boom.connection uses this module, hence not its clock
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class Resolver(object):
+    """Resolves `host`:`port` to all its addresses, for `ttl` seconds."""
+
+    def __init__(self, host, port, ttl=60):
+        self.host = host
+        self.port = port
+        self.ttl = ttl
+        self._addresses = []
+        self._expires = None
+        self._next = count()
+
+    def addresses(self):
+        """Returns the getaddrinfo entries of the distinct addresses of
+        the host, looked up again when they expired.
+
+        The addresses of the last lookup are kept when a new one fails.
+        """
+        if self._expires is None or _clock() >= self._expires:
+            try:
+                infos = self._lookup()
+            except socket.gaierror:
+                if not self._addresses:
+                    raise
+            else:
+                seen = set()
+                self._addresses = []
+                for info in infos:
+                    if info[4][0] not in seen:
+                        seen.add(info[4][0])
+                        self._addresses.append(info)
+            self._expires = _clock() + self.ttl
+        return self._addresses
+
+    def _lookup(self):
+        return socket.getaddrinfo(self.host, self.port, 0,
+                                  socket.SOCK_STREAM)
+
+    def pick(self):
+        """Returns the entry of the next address, in turn."""
+        addresses = self.addresses()
+        return addresses[next(self._next) % len(addresses)]
+
+
+# (host, port) -> installed Resolver
+_resolvers = {}
+
+
+def install(resolver):
+    """Makes the new connections to the host of `resolver` use it."""
+    _resolvers[resolver.host, resolver.port] = resolver
+
+
+def uninstall(resolver):
+    if _resolvers.get((resolver.host, resolver.port)) is resolver:
+        del _resolvers[resolver.host, resolver.port]
+
+
+def next_address(host, port):
+    """Returns the (family, type, proto, canonname, sockaddr) entry of the
+    address a new connection to `host`:`port` should use: the next one of
+    its resolver when one is installed, the first one getaddrinfo returns
+    otherwise.
+    """
+    resolver = _resolvers.get((host, port))
+    if resolver is not None:
+        return resolver.pick()
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0]
@@ -0,0 +1,121 @@
+"""
+Scenarios describe a mix of endpoints to hit during a single run.
+
+A scenario is a JSON file like::
+
+    {"endpoints": [
+        {"name": "home", "url": "/", "weight": 8},
+        {"name": "search", "url": "/search?q=boom", "weight": 2,
+         "headers": {"Accept": "application/json"}},
+        {"name": "post", "url": "/items", "method": "POST",
+         "data": {"name": "boom"}, "weight": 1}
+    ]}
+
+`url` may be relative to the URL given on the command line. `method`
+defaults to GET, `weight` to 1 and `name` to "METHOD url". `data` is sent
+as is when it is a string (a "py:" prefix points a python callable) and
+JSON-encoded otherwise.
+"""
+import json
+import random
+from collections import namedtuple
+
+import requests
+
+try:
+    import urlparse
+except ImportError:
+    from urllib import parse as urlparse
+
+
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'url', 'headers',
+                                   'data', 'weight'])
+
+
+class AliasSampler(object):
+    """Picks indexes at random, proportionally to the given weights, in
+    constant time (Vose's alias method).
+    """
+
+    def __init__(self, weights):
+        size = len(weights)
+        total = float(sum(weights))
+        scaled = [weight * size / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        self._size = size
+        self._probability = [1.] * size
+        self._alias = list(range(size))
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] += scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+    def sample(self):
+        index = int(random.random() * self._size)
+        if random.random() < self._probability[index]:
+            return index
+        return self._alias[index]
+
+
+class Scenario(object):
+    """A weighted list of endpoints."""
+
+    def __init__(self, endpoints):
+        if not endpoints:
+            raise ValueError('A scenario needs at least one endpoint')
+        self.endpoints = endpoints
+        self._sampler = AliasSampler([e.weight for e in endpoints])
+
+    def pick(self):
+        """Returns an endpoint at random, according to their weights."""
+        return self.endpoints[self._sampler.sample()]
+
+    @classmethod
+    def from_file(cls, path, base_url=None):
+        """Loads a scenario file, relative URLs are joined to `base_url`.
+
+        Raises a ValueError when the file is not a valid scenario.
+        """
+        with open(path) as f:
+            try:
+                definition = json.load(f)
+            except ValueError as e:
+                raise ValueError('%s is not valid JSON (%s)' % (path, e))
+
+        endpoints = []
+        for item in definition.get('endpoints', []):
+            if 'url' not in item:
+                raise ValueError('Endpoint without an url in %s' % path)
+            url = item['url']
+            if base_url is not None:
+                url = urlparse.urljoin(base_url, url)
+            elif not urlparse.urlparse(url).netloc:
+                raise ValueError('%r is relative and no URL was given' %
+                                 url)
+
+            method = item.get('method', 'GET').upper()
+            if not hasattr(requests, method.lower()):
+                raise ValueError('Unknown method %r in %s' % (method, path))
+
+            weight = item.get('weight', 1)
+            if not weight > 0:
+                raise ValueError('Weights must be positive in %s' % path)
+
+            headers = dict(item.get('headers', {}))
+            data = item.get('data')
+            if isinstance(data, (dict, list)):
+                data = json.dumps(data)
+                headers.setdefault('Content-Type', 'application/json')
+
+            name = item.get('name', '%s %s' % (method, item['url']))
+            endpoints.append(Endpoint(name, method, url, headers, data,
+                                      weight))
+
+        return cls(endpoints)
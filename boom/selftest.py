@@ -0,0 +1,345 @@
+"""
+Measures the ceiling of boom itself, the calls per second it can do and
+the CPU they cost it, against a minimal local server::
+
+    $ boom selftest --save base
+    $ pip install -U gevent requests
+    $ boom selftest --save new --baseline base
+
+The server is a gevent WSGI application forked before the runs and
+listening on the loopback, so the CPU time measured is the one of the
+client only. Every configuration of a matrix of concurrencies,
+keep-alive, body sizes and post hook is run for a few seconds without
+any rate limit: its RPS is the most boom can do with it on this machine,
+with these versions of gevent and requests.
+
+The results of every configuration are saved like --save does, along
+with a summary, and compared to the ones of a baseline with the tests
+of ``boom compare``.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import signal
+import socket
+import sys
+from collections import namedtuple
+
+import gevent
+import requests
+from gevent.pywsgi import WSGIServer
+
+from boom import __version__
+from boom.boom import RunResults, calc_stats, patch, run
+from boom.compare import Difference, compare, print_comparison
+
+
+#: name of the summary of a run saved with --save
+SUMMARY = 'summary.json'
+
+
+class Configuration(namedtuple('Configuration', ['concurrency', 'keepalive',
+                                                 'size', 'hook'])):
+    """Calls of `size` bytes bodies by `concurrency` workers, over
+    persistent connections or not, with a post hook or not."""
+
+    @property
+    def name(self):
+        return 'c%d-%s-%dB-%s' % (
+            self.concurrency, 'keepalive' if self.keepalive else 'close',
+            self.size, 'hook' if self.hook else 'nohook')
+
+
+#: what a configuration costs: `cpu` is the CPU time of the client per
+#: call, in seconds
+Measure = namedtuple('Measure', ['name', 'rps', 'cpu', 'p50', 'p99',
+                                 'errors'])
+
+
+def matrix(concurrencies=(1, 10, 50), sizes=(16, 65536)):
+    """Returns all the configurations of the `concurrencies` and body
+    `sizes`, with and without keep-alive and post hook."""
+    return [Configuration(*values) for values in itertools.product(
+        concurrencies, (True, False), sizes, (False, True))]
+
+
+def post_hook(response):
+    """The cheapest post hook, to measure the cost of having one."""
+    return response
+
+
+class _Server(WSGIServer):
+
+    def handle(self, sock, address):
+        # no Nagle delay between the headers and the body of the responses
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return super(_Server, self).handle(sock, address)
+
+
+def _serve(listener, bodies):
+    def app(environ, start_response):
+        body = bodies.get(environ['PATH_INFO'])
+        if body is None:
+            start_response('404 Not Found', [('Content-Length', '0')])
+            return []
+        start_response('200 OK', [('Content-Type', 'text/plain'),
+                                  ('Content-Length', str(len(body)))])
+        return [body]
+
+    try:
+        _Server(listener, app, log=None, error_log=None).serve_forever()
+    finally:
+        os._exit(0)
+
+
+class Server(object):
+    """Forks `processes` processes serving bodies of the given `sizes`
+    in bytes on /<size>, sharing a listener on the loopback."""
+
+    def __init__(self, sizes, processes=1):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(1024)
+        self.url = 'http://127.0.0.1:%d' % listener.getsockname()[1]
+        bodies = dict(('/%d' % size, b'x' * size) for size in sizes)
+        self.pids = []
+        for _ in range(processes):
+            pid = gevent.fork()
+            if pid == 0:
+                _serve(listener, bodies)
+            self.pids.append(pid)
+        listener.close()
+
+    def stop(self):
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        self.pids = []
+
+
+def _cpu():
+    """CPU time of this process, the forked server not included."""
+    times = os.times()
+    return times[0] + times[1]
+
+
+def measure(url, configuration, duration=2, precision=3):
+    """Runs `configuration` against the selftest server at `url` for
+    `duration` seconds, returns a (Measure, RunResults) tuple."""
+    options = {}
+    if configuration.hook:
+        options['post_hook'] = 'boom.selftest.post_hook'
+    results = RunResults(None, True, precision)
+    start = _cpu()
+    # the time series gives compare() the per-second RPS
+    run('%s/%d' % (url, configuration.size), num=None, duration=duration,
+        concurrency=configuration.concurrency,
+        keepalive=configuration.keepalive, quiet=True, precision=precision,
+        results=results, timeseries=os.devnull, **options)
+    cpu = _cpu() - start
+
+    stats = calc_stats(results, (50, 99))
+    calls = stats.count + stats.errors
+    return Measure(configuration.name, stats.rps, cpu / (calls or 1),
+                   stats.percentiles['50'], stats.percentiles['99'],
+                   stats.errors), results
+
+
+def versions():
+    """The versions the RPS of boom depend on."""
+    return {'boom': __version__, 'gevent': gevent.__version__,
+            'requests': requests.__version__,
+            'python': '%s %s' % (platform.python_implementation(),
+                                 platform.python_version())}
+
+
+def selftest(configurations, duration=2, server_processes=1, save=None,
+             progress=None):
+    """Measures every configuration, returns the list of Measure.
+
+    The results of every configuration and a summary are saved in the
+    `save` directory, when given. `progress` is called with each Measure
+    as soon as it is taken.
+    """
+    patch()
+    server = Server(set(configuration.size
+                        for configuration in configurations),
+                    server_processes)
+    measures = []
+    try:
+        for configuration in configurations:
+            measured, results = measure(server.url, configuration, duration)
+            measures.append(measured)
+            if save is not None:
+                if not os.path.isdir(save):
+                    os.makedirs(save)
+                results.save(os.path.join(save, measured.name + '.json'))
+            if progress is not None:
+                progress(measured)
+    finally:
+        server.stop()
+
+    if save is not None:
+        with open(os.path.join(save, SUMMARY), 'w') as f:
+            json.dump({'versions': versions(), 'duration': duration,
+                       'measures': [measured._asdict()
+                                    for measured in measures]}, f)
+    return measures
+
+
+def compare_baseline(measures, new, base, threshold=.05, alpha=.01):
+    """Compares the RPS and the CPU per call of the configurations saved
+    in both the `new` and `base` directories, returns a list of
+    Difference named after the configurations.
+
+    The RPS are compared with :func:`boom.compare.compare`, the CPU per
+    call on the `threshold` alone.
+    """
+    with open(os.path.join(base, SUMMARY)) as f:
+        base_cpu = dict((measured['name'], measured['cpu'])
+                        for measured in json.load(f)['measures'])
+
+    differences = []
+    for measured in measures:
+        if measured.name not in base_cpu:
+            continue
+        path = measured.name + '.json'
+        rps = compare(RunResults.load(os.path.join(base, path)),
+                      RunResults.load(os.path.join(new, path)),
+                      threshold=threshold, alpha=alpha)[0]
+        differences.append(rps._replace(metric=measured.name + ' rps'))
+
+        cpu = base_cpu[measured.name]
+        change = (measured.cpu - cpu) / cpu if cpu else 0.
+        differences.append(Difference(
+            measured.name + ' cpu', cpu, measured.cpu, change, None,
+            change > threshold))
+    return differences
+
+
+def print_measure(measured):
+    print('%-28s\t%8d\t%8.1f us\t%.4f s\t%.4f s\t%d' % (
+        measured.name, measured.rps, measured.cpu * 1000000, measured.p50,
+        measured.p99, measured.errors))
+
+
+def _list(value):
+    try:
+        values = tuple(int(item) for item in value.split(','))
+    except ValueError:
+        values = ()
+    if not values or min(values) < 1:
+        raise argparse.ArgumentTypeError(
+            'Must be comma-separated positive integers')
+    return values
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog='boom selftest',
+        description='Measures the RPS boom can do and the CPU per call it '
+                    'spends against a local server, for every '
+                    'configuration of a matrix of concurrencies, body '
+                    'sizes, with and without keep-alive and post hook.')
+
+    parser.add_argument('--concurrency',
+                        help='Comma-separated concurrencies '
+                             '(default: 1,10,50)',
+                        type=_list, default=(1, 10, 50))
+
+    parser.add_argument('--sizes',
+                        help='Comma-separated sizes of the bodies, in '
+                             'bytes (default: 16,65536)',
+                        type=_list, default=(16, 65536))
+
+    parser.add_argument('-d', '--duration',
+                        help='Duration of each configuration in seconds '
+                             '(default: 2)',
+                        type=float, default=2)
+
+    parser.add_argument('--server-processes',
+                        help='Number of processes of the server '
+                             '(default: 1)',
+                        type=int, default=1)
+
+    parser.add_argument('--save',
+                        help='Directory where the results are saved, to '
+                             'be the --baseline of a later selftest',
+                        type=str, metavar='DIR')
+
+    parser.add_argument('--baseline',
+                        help='Directory of a saved selftest to compare '
+                             'with. Exits with 1 when there are '
+                             'regressions',
+                        type=str, metavar='DIR')
+
+    parser.add_argument('--threshold',
+                        help='Relative change over which a significant '
+                             'difference is a regression (default: 0.05)',
+                        type=float, default=.05)
+
+    parser.add_argument('--alpha',
+                        help='Significance level (default: 0.01)',
+                        type=float, default=.01)
+
+    parser.add_argument('--json-output',
+                        help='Prints the measures in JSON',
+                        action='store_true')
+
+    args = parser.parse_args(args)
+    if args.baseline is not None and args.save is None:
+        print('--baseline needs --save, the results being compared from '
+              'the files')
+        parser.print_usage()
+        sys.exit(0)
+
+    configurations = matrix(args.concurrency, args.sizes)
+    progress = None
+    if not args.json_output:
+        current = versions()
+        print('boom %s, gevent %s, requests %s on %s' % (
+            current['boom'], current['gevent'], current['requests'],
+            current['python']))
+        print('Running %d configurations for %g seconds each' % (
+            len(configurations), args.duration))
+        print('')
+        print('-------- Selftest --------')
+        print('%-28s\t%8s\t%11s\t%8s\t%8s\t%s' % (
+            'configuration', 'RPS', 'CPU/call', 'p50', 'p99', 'errors'))
+        progress = print_measure
+
+    try:
+        measures = selftest(configurations, args.duration,
+                            args.server_processes, args.save, progress)
+    except KeyboardInterrupt:
+        sys.exit(1)
+
+    best = max(measures, key=lambda measured: measured.rps)
+    differences = []
+    if args.baseline is not None:
+        try:
+            differences = compare_baseline(measures, args.save, args.baseline,
+                                           args.threshold, args.alpha)
+        except (IOError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+
+    if args.json_output:
+        print(json.dumps({
+            'versions': versions(),
+            'measures': [measured._asdict() for measured in measures],
+            'max_rps': best._asdict(),
+            'comparison': [difference._asdict()
+                           for difference in differences]}))
+    else:
+        print('')
+        print('Max RPS           \t\t%d (%s)' % (best.rps, best.name))
+        if args.baseline is not None:
+            print('')
+            print_comparison(differences)
+
+    if any(difference.regression for difference in differences):
+        sys.exit(1)
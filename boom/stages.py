@@ -0,0 +1,148 @@
+"""
+Load profiles: the number of active workers grows and shrinks over time.
+
+A profile is a list of stages. Each stage linearly ramps the number of
+active workers from the previous stage's target (0 for the first one) to
+its own target, over its duration. On the command line, stages are
+written as comma-separated DURATION@TARGET items, for example
+``10s@50,60s@200,10s@0``; durations are in seconds unless suffixed by
+``m`` or ``h``.
+"""
+import gevent
+from gevent.event import Event
+
+from boom.connection import clock
+
+
+_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+
+def parse_stages(value):
+    """Returns a list of (duration, target) tuples.
+
+    Raises a ValueError when `value` is not a valid list of stages.
+    """
+    stages = []
+    for item in value.split(','):
+        try:
+            duration, target = item.strip().split('@')
+            unit = _UNITS.get(duration[-1:], None)
+            if unit is not None:
+                duration = duration[:-1]
+            duration = float(duration) * (unit or 1)
+            target = int(target)
+        except ValueError:
+            raise ValueError('%r is not a valid stage' % item)
+        if duration <= 0 or target < 0:
+            raise ValueError('%r is not a valid stage' % item)
+        stages.append((duration, target))
+    return stages
+
+
+def _format(seconds):
+    return '%gs' % seconds
+
+
+class LoadProfile(object):
+    """Controls how many workers are active over time.
+
+    `stages` is a list of (label, duration, target) tuples. A None
+    duration holds the target until the end of the run. Workers are
+    numbered and the ones whose number is below the current number of
+    active workers may take jobs.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.active = 0
+        self.stage = None
+        self._changed = Event()
+        self._greenlet = None
+
+    @classmethod
+    def from_stages(cls, stages):
+        """Builds a profile out of :func:`parse_stages` results.
+
+        A stage may carry its label as a third item: the shares of a run
+        split between processes or agents keep the labels of the stages
+        of the whole run that way.
+        """
+        profile = []
+        for index, stage in enumerate(stages, 1):
+            duration, target = stage[0], stage[1]
+            if len(stage) > 2:
+                label = stage[2]
+            else:
+                label = '%d: %s@%d' % (index, _format(duration), target)
+            profile.append((label, duration, target))
+        return cls(profile)
+
+    @classmethod
+    def ramp_up(cls, seconds, concurrency):
+        """Builds a profile ramping up to `concurrency` workers in
+        `seconds`, then holding it."""
+        return cls([('ramp-up', seconds, concurrency),
+                    ('steady', None, concurrency)])
+
+    @property
+    def concurrency(self):
+        """The maximum number of active workers."""
+        return max(target for label, duration, target in self.stages)
+
+    @property
+    def duration(self):
+        """The total duration, None when the last target is held."""
+        durations = [duration for label, duration, target in self.stages]
+        if None in durations:
+            return None
+        return sum(durations)
+
+    def start(self, results):
+        """Follows the stages in a greenlet, setting the current stage
+        label on `results`."""
+        self._greenlet = gevent.spawn(self._run, results)
+
+    def stop(self):
+        if self._greenlet is not None:
+            self._greenlet.kill()
+            self._greenlet = None
+
+    def _run(self, results):
+        previous = 0
+        for label, duration, target in self.stages:
+            self.stage = results.stage = label
+            if duration is None:
+                self._set(target)
+                return
+            started = clock()
+            elapsed = 0
+            while elapsed < duration:
+                ramped = previous + (target - previous) * elapsed / duration
+                self._set(int(round(ramped)))
+                gevent.sleep(min(.1, duration - elapsed))
+                elapsed = clock() - started
+            self._set(target)
+            previous = target
+
+    def _set(self, active):
+        if active == self.active:
+            return
+        self.active = active
+        changed, self._changed = self._changed, Event()
+        changed.set()
+
+    def wait(self, index):
+        """Blocks until the worker number `index` is active."""
+        while index >= self.active:
+            self._changed.wait()
+
+    def gate(self, index, jobs):
+        """Yields the jobs of the shared `jobs` iterator, only pulling one
+        when the worker number `index` is active."""
+        while True:
+            self.wait(index)
+            try:
+                job = next(jobs)
+            except StopIteration:
+                return
+            yield job
@@ -6,9 +6,13 @@ try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
+import csv
 import json
+import socket
+import tempfile
 
 from gevent.pywsgi import WSGIServer
+from gevent.server import StreamServer
 import requests
 import gevent
 
@@ -22,6 +26,18 @@ if sys.version_info[0] < 3:
 else:
     PY3 = True
 
+#: the asyncio engine needs Python 3.7 or later
+ASYNCIO = sys.version_info >= (3, 7)
+
+
+def engines(*options):
+    """Returns the `options` of the gevent engines to test, followed by the
+    ones of the asyncio engine when this Python supports it."""
+    options = list(options)
+    if ASYNCIO:
+        options.append({'engine': 'asyncio'})
+    return options
+
 
 class App(object):
 
@@ -42,6 +58,9 @@ class App(object):
                 return [str(self.numcalls).encode('latin-1')]
             else:
                 return [str(self.numcalls)]
+        elif env['PATH_INFO'] == '/large':
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return [b'x' * 200000]
         elif env['PATH_INFO'] == '/redir':
             self.numcalls += 1
             start_response('302 Found', [('Location', '/redir')])
@@ -90,6 +109,19 @@ def pre_hook(method, url, options):
     return method, url, options
 
 
+def slow_data(method, url, options):
+    gevent.sleep(.2)
+    return 'data'
+
+
+_PAYLOADS = []
+
+
+def payload(method, url, options):
+    _PAYLOADS.append(None)
+    return {'id': len(_PAYLOADS)}
+
+
 def post_hook(response):
     return response
 
@@ -100,6 +132,16 @@ def post_hook_fails(data):
     return data
 
 
+_HOOK_CALLS = []
+
+
+def post_hook_raises(response):
+    _HOOK_CALLS.append(None)
+    if len(_HOOK_CALLS) == 2:
+        raise ValueError('hook bug')
+    return response
+
+
 class TestBoom(unittest.TestCase):
 
     @classmethod
@@ -128,6 +170,663 @@ class TestBoom(unittest.TestCase):
         res = self.get('/calls').content
         self.assertEqual(int(res), 10)
 
+    def test_concurrency_above_num(self):
+        run_results = runboom(self.server, num=3, concurrency=10, quiet=True)
+        res = self.get('/calls').content
+        self.assertEqual(int(res), 3)
+        self.assertEqual(len(run_results.status_code_counter[200]), 3)
+
+    def test_duration(self):
+        run_results = runboom(self.server, num=None, duration=1,
+                              concurrency=2, quiet=True)
+        self.assertTrue(len(run_results.status_code_counter[200]) > 0)
+        self.assertAlmostEqual(run_results.total_time, 1, delta=0.5)
+
+    def test_processes(self):
+        run_results = runboom(self.server, num=10, concurrency=4,
+                              processes=2, quiet=True)
+        res = self.get('/calls').content
+        self.assertEqual(int(res), 10)
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+        self.assertEqual(run_results.connections_opened, 4)
+        self.assertTrue(run_results.total_time > 0)
+
+    def test_processes_errors(self):
+        run_results = runboom('http://localhost:9999', num=4, concurrency=2,
+                              processes=2, quiet=True)
+        self.assertEqual(len(run_results.errors), 4)
+        for error in run_results.errors:
+            self.assertIsInstance(error, requests.ConnectionError)
+
+    def test_results_serialization(self):
+        results = RunResults()
+        results.status_code_counter[200].extend([0.1, 0.2])
+        results.add_error(requests.ConnectionError('boom'))
+        results.total_time = 2
+        copy = RunResults.from_dict(json.loads(json.dumps(
+            results.to_dict())))
+        self.assertEqual(len(copy.status_code_counter[200]), 2)
+        self.assertIsInstance(copy.errors[0], requests.ConnectionError)
+
+        copy.merge(results)
+        self.assertEqual(copy.count(), 6)
+        self.assertEqual(copy.total_time, 2)
+
+        results.profile = [('ramp-up', 1, 2), ('steady', None, 2)]
+        results.stages['ramp-up'].append(0.1)
+        copy = RunResults.from_dict(json.loads(json.dumps(
+            results.to_dict()))).merge(copy)
+        self.assertEqual(copy.profile, results.profile)
+        self.assertEqual(len(copy.stages['ramp-up']), 1)
+
+        drained = copy.drain()
+        self.assertEqual(drained.count(), 9)
+        self.assertEqual(copy.count(), 0)
+
+    def test_merge_errors(self):
+        # the chunks drained by the processes don't add up over the cap
+        results = RunResults()
+        for chunk in range(20):
+            streamed = RunResults()
+            for index in range(60):
+                streamed.add_error(requests.ConnectionError(
+                    'failure %d-%d' % (chunk, index)))
+            results.merge(RunResults.from_dict(json.loads(json.dumps(
+                streamed.drain().to_dict()))))
+        self.assertEqual(len(results.error_counter),
+                         RunResults.MAX_ERROR_MESSAGES + 1)
+        self.assertEqual(results.error_count(), 1200)
+        self.assertEqual(
+            results.error_counter['ConnectionError: (other messages)'],
+            1200 - RunResults.MAX_ERROR_MESSAGES)
+
+    def test_save(self):
+        results = RunResults()
+        results.status_code_counter[200].extend([0.1, 0.2])
+        results.timeline = [{'rps': 2}]
+        for suffix in ('.json', '.json.gz'):
+            with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+                results.save(f.name)
+                copy = RunResults.load(f.name)
+            self.assertEqual(len(copy.status_code_counter[200]), 2)
+            self.assertEqual(copy.timeline, [{'rps': 2}])
+
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            f.write('{}')
+            f.flush()
+            self.assertRaises(ValueError, RunResults.load, f.name)
+
+    def test_save_option(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            code, stdout, stderr = self._run('-n', '3', '--save', f.name,
+                                             self.server)
+            self.assertEqual(code, 0)
+            results = RunResults.load(f.name)
+        self.assertEqual(len(results.status_code_counter[200]), 3)
+
+    def test_rate(self):
+        run_results = runboom(self.server, num=10, concurrency=2, rate=20,
+                              quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+        # the 10th call is scheduled 0.45s after the first one
+        self.assertTrue(run_results.total_time >= 0.45)
+        self.assertEqual(len(run_results.schedule_lag), 10)
+
+        stats = boom.calc_stats(run_results)
+        self.assertTrue(stats.schedule_lag_max < 0.45)
+
+    def test_rate_duration(self):
+        run_results = runboom(self.server, num=None, duration=1, rate=10,
+                              concurrency=2, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+
+    def test_stages(self):
+        run_results = runboom(self.server, num=None,
+                              stages=[(.3, 2), (.3, 4), (.2, 0)], quiet=True)
+        self.assertTrue(0.8 <= run_results.total_time < 1.2)
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(list(stats.stages),
+                         ['1: 0.3s@2', '2: 0.3s@4', '3: 0.2s@0'])
+        self.assertEqual(sum(stage['count'] for stage in
+                             stats.stages.values()), stats.count)
+        self.assertTrue(stats.stages['2: 0.3s@4']['rps'] > 0)
+        self.assertEqual(stats.stages['2: 0.3s@4']['target'], 4)
+        json.dumps(stats._asdict())
+
+    def test_stages_processes(self):
+        # the shares of the targets differ, the labels don't
+        run_results = runboom(self.server, num=None, processes=2,
+                              stages=[(.3, 3), (.3, 1)], quiet=True)
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(list(stats.stages), ['1: 0.3s@3', '2: 0.3s@1'])
+        self.assertEqual(stats.stages['1: 0.3s@3']['target'], 3)
+        self.assertEqual(sum(stage['count'] for stage in
+                             stats.stages.values()), stats.count)
+
+        run_results = runboom(self.server, num=None, duration=.4,
+                              concurrency=3, processes=2, ramp_up=.2,
+                              quiet=True)
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(stats.stages['steady']['target'], 3)
+
+    def test_ramp_up(self):
+        run_results = runboom(self.server, num=20, concurrency=4,
+                              ramp_up=.2, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 20)
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(list(stats.stages), ['ramp-up', 'steady'])
+        self.assertEqual(stats.stages['steady']['target'], 4)
+
+    def test_find_max(self):
+        steps, knee = boom.find_max(self.server, 10, step_duration=.2,
+                                    limit=4, quiet=True)
+        self.assertEqual([step.load for step in steps], [1, 2, 4])
+        self.assertEqual(knee, steps[-1])
+        self.assertTrue(knee.rps > 0)
+
+        steps, knee = boom.find_max(self.server, 10, step_duration=.2,
+                                    concurrency=2, rate=10, limit=15,
+                                    quiet=True)
+        self.assertEqual([step.load for step in steps], [10, 15])
+
+        steps, knee = boom.find_max(self.server, 1e-9, step_duration=.2,
+                                    quiet=True)
+        self.assertEqual(len(steps), 1)
+        self.assertFalse(steps[0].passed)
+        self.assertEqual(knee, None)
+
+    def test_find_max_bisect(self):
+        used = {}
+
+        def run(url, num, duration, concurrency, quiet, sessions,
+                **options):
+            # p99 is over the limit above 5 workers
+            results = RunResults(None, True)
+            results.status_code_counter[200].append(
+                .1 if concurrency > 5 else .01)
+            results.total_time = duration
+            used[concurrency] = sessions
+            return results
+
+        old_run = boom.run
+        boom.run = run
+        try:
+            steps, knee = boom.find_max(self.server, .05, quiet=True)
+        finally:
+            boom.run = old_run
+        self.assertEqual([step.load for step in steps], [1, 2, 4, 8, 6, 5])
+        self.assertEqual(knee.load, 5)
+        # the same sessions are used all along
+        self.assertEqual(len(set(id(sessions) for sessions in used.values())),
+                         1)
+
+    def test_find_max_option_errors(self):
+        # the options run() rejects are reported like without --find-max
+        code, stdout, stderr = self._run(
+            '--find-max', '--slo-p99', '1s', '--discard-body', '--post-hook',
+            'boom.tests.test_boom.post_hook', self.server)
+        self.assertEqual(code, 1)
+        self.assertTrue("can't be discarded" in stdout, stdout)
+
+    def test_latency_option(self):
+        self.assertEqual(boom.latency('200ms'), .2)
+        self.assertEqual(boom.latency('1.5s'), 1.5)
+        self.assertEqual(boom.latency('2'), 2)
+        self.assertRaises(boom.argparse.ArgumentTypeError, boom.latency,
+                          'fast')
+
+    def test_shared_sessions(self):
+        sessions = []
+        runboom(self.server, num=4, concurrency=2, quiet=True,
+                sessions=sessions)
+        run_results = runboom(self.server, num=4, concurrency=2, quiet=True,
+                              sessions=sessions)
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual(run_results.connections_opened, 0)
+        self.assertEqual(run_results.connections_reused, 4)
+
+    @unittest.skipIf(not ASYNCIO, 'needs Python 3.7 or later')
+    def test_asyncio_engine(self):
+        run_results = runboom(self.server, num=10, concurrency=2,
+                              engine='asyncio', quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+        self.assertEqual(run_results.connections_opened, 2)
+        self.assertEqual(run_results.connections_reused, 8)
+        self.assertEqual(len(run_results.phases['connect']), 2)
+
+        run_results = runboom(self.server + '/missing', num=None, duration=.5,
+                              rate=10, method='POST', data='boom',
+                              engine='asyncio', keepalive=False, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[404]), 5)
+        self.assertEqual(len(run_results.schedule_lag), 5)
+        self.assertEqual(run_results.connections_opened, None)
+
+        run_results = runboom('http://127.0.0.1:9', num=3, engine='asyncio',
+                              quiet=True)
+        self.assertEqual(run_results.error_count(), 3)
+
+    def test_asyncio_engine_unsupported(self):
+        if not ASYNCIO:
+            self.assertRaises(ValueError, runboom, self.server,
+                              engine='asyncio', quiet=True)
+        with self.assertRaises(ValueError):
+            runboom(self.server, engine='asyncio', quiet=True,
+                    pre_hook='boom.tests.test_boom.pre_hook')
+        with self.assertRaises(ValueError):
+            runboom(self.server, engine='curio', quiet=True)
+
+    def test_import_without_patching(self):
+        code = ('import boom.boom; from gevent import monkey; '
+                'print(monkey.is_module_patched("socket"))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+    def test_fast_path(self):
+        sessions = []
+        runboom(self.server, num=4, concurrency=2, quiet=True,
+                sessions=sessions)
+        self.assertTrue(all(isinstance(session, boom.raw.Connection)
+                            for session in sessions))
+
+        sessions = []
+        runboom(self.server, num=4, concurrency=2, quiet=True,
+                sessions=sessions, fast_path=False)
+        self.assertTrue(all(isinstance(session, requests.Session)
+                            for session in sessions))
+
+    def test_engines_record_the_same(self):
+        for options in engines({'fast_path': False}, {'fast_path': True}):
+            run_results = runboom(self.server, num=4, concurrency=2,
+                                  quiet=True, **options)
+            self.assertEqual(len(run_results.status_code_counter[200]), 4)
+            self.assertEqual(len(run_results.backends['0.0.0.0']), 4)
+            self.assertEqual(len(run_results.phases['connect']), 2)
+            self.assertEqual(len(run_results.phases['ttfb']), 4)
+
+            run_results = runboom('http://127.0.0.1:9', num=3, quiet=True,
+                                  **options)
+            self.assertEqual(run_results.error_count(), 3)
+            self.assertEqual(run_results.backend_errors, {'127.0.0.1': 3})
+
+    def test_resolve_all(self):
+        def lookup(resolver):
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', address)
+                    for address in addresses]
+
+        original = boom.resolver.Resolver._lookup
+        boom.resolver.Resolver._lookup = lookup
+        try:
+            addresses = [('127.0.0.1', 8089), ('127.0.0.2', 8089)]
+            for fast_path in (True, False):
+                run_results = runboom(self.server, num=20, concurrency=4,
+                                      quiet=True, resolve_all=True,
+                                      fast_path=fast_path)
+                backends = boom.calc_stats(run_results).backends
+                self.assertEqual(list(backends), ['127.0.0.1', '127.0.0.2'])
+                self.assertEqual(backends['127.0.0.1']['count'] +
+                                 backends['127.0.0.2']['count'], 20)
+                self.assertEqual(run_results.connections_opened, 4)
+
+            # every call opens a new connection, to each address in turn
+            run_results = runboom(self.server, num=20, concurrency=4,
+                                  quiet=True, resolve_all=True,
+                                  keepalive=False)
+            backends = boom.calc_stats(run_results).backends
+            self.assertEqual(backends['127.0.0.1']['count'], 10)
+            self.assertEqual(backends['127.0.0.2']['count'], 10)
+
+            # the errors are counted per address
+            addresses = [('127.0.0.1', 8089), ('127.0.0.2', 1)]
+            run_results = runboom(self.server, num=10, concurrency=2,
+                                  quiet=True, resolve_all=True)
+            self.assertEqual(list(run_results.backend_errors),
+                             ['127.0.0.2'])
+            self.assertEqual(run_results.count(), 10)
+        finally:
+            boom.resolver.Resolver._lookup = original
+
+        self.assertRaises(ValueError, runboom, self.server, quiet=True,
+                          resolve_all=True, engine='asyncio')
+
+    def test_discard_body(self):
+        for options in engines({'fast_path': False},
+                               {'fast_path': False, 'discard_body': True},
+                               {'fast_path': True}):
+            run_results = runboom(self.server + '/large', num=6,
+                                  concurrency=2, quiet=True, **options)
+            stats = boom.calc_stats(run_results)
+            self.assertEqual(stats.bytes_received, 1200000)
+            self.assertEqual(stats.body_sizes, {200: 200000})
+            self.assertTrue(stats.transfer_rate > 0)
+            self.assertEqual(run_results.connections_opened, 2)
+
+        self.assertRaises(ValueError, runboom, self.server, quiet=True,
+                          discard_body=True,
+                          post_hook='boom.tests.test_boom.post_hook')
+
+    def test_expectations(self):
+        expectations = {'expect_status': [200],
+                        'expect_headers': [('Content-Type', 'html')],
+                        'expect_size': (None, 10)}
+        for options in engines({'fast_path': True}, {'fast_path': False}):
+            options.update(expectations)
+            run_results = runboom(self.server, num=4, quiet=True, **options)
+            self.assertEqual(len(run_results.status_code_counter[200]), 4)
+            self.assertEqual(boom.calc_stats(run_results).assertions, {
+                'status in 200': 0, 'header Content-Type ~ html': 0,
+                'size in -10': 4})
+
+        run_results = runboom(self.server + '/missing', num=4, quiet=True,
+                              expect_body='hello', **expectations)
+        self.assertEqual(dict(run_results.assertion_failures), {
+            'status in 200': 4, 'header Content-Type ~ html': 4,
+            'size in -10': 0, 'body ~ hello': 4})
+
+        self.assertRaises(ValueError, runboom, self.server, quiet=True,
+                          expect_body='hello', discard_body=True)
+
+    def test_expectations_option(self):
+        code, stdout, stderr = self._run(
+            '-n', '2', '--expect-status', '200,204', '--expect-header',
+            'content-type:html', '--json-output', self.server)
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(stdout)['assertions'], {
+            'status in 200,204': 0, 'header content-type ~ html': 0})
+
+        code, stdout, stderr = self._run('--expect-size-range', '10',
+                                         self.server)
+        self.assertEqual(code, 2)
+
+    def test_agents(self):
+        agents = []
+        for port in (8766, 8767):
+            agents.append(subprocess.Popen(
+                [sys.executable, '-c', 'from boom.agent import main; '
+                 'main(["--listen", "127.0.0.1:%d"])' % port],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE))
+        try:
+            for port in (8766, 8767):
+                while True:
+                    try:
+                        socket.create_connection(('127.0.0.1', port)).close()
+                        break
+                    except socket.error:
+                        gevent.sleep(.1)
+            run_results = runboom(self.server, num=10, concurrency=4,
+                                  agents=[('127.0.0.1', 8766),
+                                          ('127.0.0.1', 8767)], quiet=True)
+            self.assertEqual(int(self.get('/calls').content), 10)
+            staged = runboom(self.server, num=None,
+                             stages=[(.3, 3), (.3, 1)],
+                             agents=[('127.0.0.1', 8766),
+                                     ('127.0.0.1', 8767)], quiet=True)
+        finally:
+            for agent in agents:
+                agent.terminate()
+                agent.wait()
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+        self.assertEqual(run_results.connections_opened, 4)
+
+        # the stages are labelled after the whole run, not the shares
+        stats = boom.calc_stats(staged)
+        self.assertEqual(list(stats.stages), ['1: 0.3s@3', '2: 0.3s@1'])
+        self.assertEqual(sum(stage['count'] for stage in
+                             stats.stages.values()), stats.count)
+
+    def test_agents_errors(self):
+        def refuse(sock, address):
+            sock.makefile('rb').readline()
+            sock.sendall(b'{"error": "Version mismatch"}\n')
+            sock.close()
+
+        agent = StreamServer(('127.0.0.1', 0), refuse)
+        agent.start()
+        self.addCleanup(agent.stop)
+        address = ('127.0.0.1', agent.server_port)
+        self.assertRaises(IOError, runboom, self.server, num=2, quiet=True,
+                          agents=[address])
+
+        code, stdout, stderr = self._run('-n', '2', '--agents',
+                                         '127.0.0.1:%d' % address[1],
+                                         self.server)
+        self.assertEqual(code, 1)
+        self.assertTrue('Version mismatch' in stdout, stdout)
+
+    def test_agents_option(self):
+        self.assertEqual(boom.agents('host1,host2:9000'),
+                         [('host1', boom.AGENT_PORT), ('host2', 9000)])
+        self.assertRaises(boom.argparse.ArgumentTypeError, boom.agents,
+                          'host:port')
+
+    def test_address_option(self):
+        self.assertEqual(boom.address(':9100'), ('', 9100))
+        self.assertEqual(boom.address('host:8125'), ('host', 8125))
+        self.assertRaises(boom.argparse.ArgumentTypeError, boom.address,
+                          'host')
+
+    def test_schedule(self):
+        self.assertEqual(list(boom.schedule(2, 10, num=3)), [10, 10.5, 11])
+        self.assertEqual(list(boom.schedule(4, 0, duration=1)),
+                         [0, 0.25, 0.5, 0.75])
+
+    def test_progress(self):
+        old_stdout = sys.stdout
+        try:
+            sys.stdout = StringIO()
+            results = RunResults(num=10)
+            results.status_code_counter[200].extend([0.1, 0.2])
+            results.incr(2)
+            self.assertEqual(sys.stdout.getvalue(), '')
+            results.start_progress(interval=.01)
+            gevent.sleep(1.1)
+            results.stop_progress()
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = old_stdout
+
+        # not a terminal: refreshed once per second, plus the final display
+        self.assertEqual(output.count('\n'), 2)
+        self.assertTrue('20%' in output, output)
+        self.assertTrue('RPS - p50 0.1' in output, output)
+
+    def test_phases(self):
+        run_results = runboom(self.server, num=5, concurrency=1, quiet=True)
+        stats = boom.calc_stats(run_results)
+        # a single connection was opened
+        self.assertEqual(stats.phases['dns']['count'], 1)
+        self.assertEqual(stats.phases['connect']['count'], 1)
+        self.assertEqual(stats.phases['tls']['count'], 0)
+        self.assertEqual(stats.phases['ttfb']['count'], 5)
+        self.assertEqual(stats.phases['body']['count'], 5)
+        self.assertTrue(stats.phases['ttfb']['max'] <= stats.max)
+
+        # without keep-alive, every call opens a timed connection
+        run_results = runboom(self.server, num=5, concurrency=1, quiet=True,
+                              keepalive=False)
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(stats.phases['dns']['count'], 5)
+        self.assertEqual(stats.phases['connect']['count'], 5)
+        self.assertEqual(stats.phases['tls']['count'], 0)
+        self.assertEqual(stats.phases['ttfb']['count'], 5)
+
+    def test_phases_not_timing_hooks(self):
+        run_results = runboom(self.server, num=2, concurrency=1, quiet=True,
+                              method='POST', data='py:boom.tests.test_boom.'
+                                                  'slow_data')
+        self.assertTrue(run_results.histogram().max < 0.2)
+
+    def test_timeseries(self):
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            run_results = runboom(self.server, num=None, duration=2,
+                                  rate=20, concurrency=2, quiet=True,
+                                  timeseries=f.name)
+            buckets = [json.loads(line) for line in open(f.name)]
+
+        self.assertTrue(len(buckets) >= 2, buckets)
+        self.assertEqual(sum(b['requests'] for b in buckets),
+                         len(run_results.status_code_counter[200]))
+        self.assertAlmostEqual(buckets[0]['rps'], 20, delta=5)
+        self.assertEqual(buckets[0]['status_codes'],
+                         {'200': buckets[0]['requests']})
+        self.assertTrue(0 < buckets[0]['p50'] < 1)
+        self.assertEqual(run_results.timeline, buckets)
+
+    def test_timeseries_csv(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as f:
+            runboom(self.server, num=5, quiet=True, timeseries=f.name)
+            rows = list(csv.reader(open(f.name)))
+
+        self.assertEqual(rows[0][:3], ['timestamp', 'elapsed', 'requests'])
+        self.assertEqual(rows[0][-1], 'status_codes')
+        self.assertEqual(rows[-1][2], '5')
+        self.assertEqual(rows[-1][-1], '200:5')
+
+    def test_live_metrics(self):
+        statsd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        statsd.bind(('127.0.0.1', 0))
+        self.addCleanup(statsd.close)
+
+        def scrape():
+            gevent.sleep(.5)
+            return requests.get('http://127.0.0.1:8095/metrics').text
+
+        scraper = gevent.spawn(scrape)
+        run_results = runboom(self.server, num=None, duration=1.2, rate=20,
+                              quiet=True, metrics_listen=('127.0.0.1', 8095),
+                              statsd=statsd.getsockname())
+        self.assertTrue('boom_calls_total{status="200"} ' in scraper.get())
+
+        calls = 0
+        statsd.settimeout(.1)
+        try:
+            while True:
+                for line in statsd.recv(65536).decode('utf-8').split('\n'):
+                    if line.startswith('boom.calls.200:'):
+                        calls += int(line.split(':')[1][:-2])
+        except socket.timeout:
+            pass
+        self.assertEqual(calls, len(run_results.status_code_counter[200]))
+
+        self.assertRaises(ValueError, runboom, self.server, quiet=True,
+                          engine='asyncio', statsd=statsd.getsockname())
+
+    def test_scenario(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'endpoints': [
+                {'name': 'home', 'url': '/', 'weight': 3},
+                {'name': 'missing', 'url': '/missing'}]}, f)
+            f.flush()
+            run_results = runboom(self.server, num=40, concurrency=2,
+                                  scenario=f.name, quiet=True)
+
+        home = len(run_results.endpoints['home'])
+        missing = len(run_results.endpoints['missing'])
+        self.assertEqual(home + missing, 40)
+        self.assertEqual(home, len(run_results.status_code_counter[200]))
+        self.assertEqual(missing, len(run_results.status_code_counter[404]))
+        self.assertEqual(int(self.get('/calls').content), home)
+
+        stats = boom.calc_stats(run_results)
+        self.assertEqual(list(stats.endpoints), ['home', 'missing'])
+        self.assertEqual(stats.endpoints['home']['count'], home)
+        self.assertEqual(stats.endpoints['home']['errors'], 0)
+
+    def test_invalid_scenario(self):
+        code, stdout, stderr = self._run('--scenario', '/not/there.json')
+        self.assertEqual(code, 1)
+        self.assertTrue('Invalid scenario' in stdout, stdout)
+
+    def test_replay(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as f:
+            f.write('/\n/missing\n' * 5)
+            f.flush()
+            run_results = runboom(self.server, num=None, concurrency=3,
+                                  replay=f.name, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 5)
+        self.assertEqual(len(run_results.status_code_counter[404]), 5)
+
+    def test_data_pool_option_errors(self):
+        code, stdout, stderr = self._run('--data-pool', '3', '-m', 'POST',
+                                         '-D', 'plain', self.server)
+        self.assertEqual(code, 0)
+        self.assertTrue('--data-pool needs "py:" data' in stdout, stdout)
+        self.assertEqual(int(self.get('/calls').content), 0)
+
+    def test_replay_option_errors(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as f:
+            f.write('/\n')
+            f.flush()
+            code, stdout, stderr = self._run('--replay', f.name, '--rate',
+                                             '10', self.server)
+        self.assertEqual(code, 0)
+        self.assertTrue("can't be combined with --rate" in stdout, stdout)
+        self.assertEqual(int(self.get('/calls').content), 0)
+
+    def test_replay_speed(self):
+        line = '127.0.0.1 - - [10/Oct/2000:13:55:%02d +0000] "GET / HTTP/1.0"'
+        with tempfile.NamedTemporaryFile('w', suffix='.log') as f:
+            f.write('\n'.join(line % second for second in (0, 1, 2)))
+            f.flush()
+            run_results = runboom(self.server, num=None, concurrency=3,
+                                  replay=f.name, replay_speed=4, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 3)
+        self.assertTrue(run_results.total_time >= 0.5)
+        self.assertEqual(len(run_results.schedule_lag), 3)
+
+    def test_data_pool(self):
+        del _PAYLOADS[:]
+        run_results = runboom(self.server, method='POST', num=10,
+                              concurrency=2, data='py:boom.tests.test_boom.'
+                                                  'payload',
+                              data_pool=3, quiet=True)
+        self.assertEqual(len(run_results.status_code_counter[200]), 10)
+        self.assertEqual(len(_PAYLOADS), 3)
+
+    def test_payload_pool(self):
+        payloads = iter([{'id': 1}, b'raw'])
+        pool = boom.PayloadPool(lambda *args: next(payloads), 2, None, None,
+                                {})
+        self.assertEqual(pool.payloads, [b'id=1', b'raw'])
+        self.assertEqual([pool(None, None, {}) for i in range(3)],
+                         [b'id=1', b'raw', b'id=1'])
+        self.assertEqual(pool.encode(u'\xe9'), b'\xc3\xa9')
+
+    def test_errors_aggregation(self):
+        results = RunResults()
+        for i in range(100):
+            results.add_error(requests.ConnectionError(
+                '<Connection object at 0x%x>: refused' % i))
+        for i in range(RunResults.MAX_ERROR_MESSAGES + 10):
+            results.add_error(requests.HTTPError('error %d' % i))
+        results.total_time = 10
+
+        self.assertEqual(len(results.errors), RunResults.MAX_ERROR_SAMPLES)
+        self.assertEqual(results.error_count(),
+                         110 + RunResults.MAX_ERROR_MESSAGES)
+        self.assertEqual(
+            results.error_counter['ConnectionError: <Connection object>: '
+                                  'refused'], 100)
+        self.assertEqual(
+            results.error_counter['HTTPError: (other messages)'], 10)
+
+        stats = boom.calc_stats(results)
+        self.assertEqual(stats.errors, 110 + RunResults.MAX_ERROR_MESSAGES)
+        self.assertEqual(stats.error_rate, 16)
+        self.assertEqual(list(stats.error_types)[0],
+                         'ConnectionError: <Connection object>: refused')
+
+    def test_keepalive(self):
+        run_results = runboom(self.server, num=10, concurrency=1, quiet=True)
+        self.assertEqual(run_results.connections_opened, 1)
+        self.assertEqual(run_results.connections_reused, 9)
+
+    def test_no_keepalive(self):
+        run_results = runboom(self.server, num=10, concurrency=1, quiet=True,
+                              keepalive=False)
+        res = self.get('/calls').content
+        self.assertEqual(int(res), 10)
+        self.assertEqual(run_results.connections_opened, None)
+
     def test_pre_hook(self):
         runboom(self.server, method='POST', num=10, concurrency=1,
                 pre_hook='boom.tests.test_boom.pre_hook', quiet=True)
@@ -155,6 +854,17 @@ class TestBoom(unittest.TestCase):
 
         self.assertEqual(int(res), 10)
 
+    def test_post_hook_raises(self):
+        # the worker survives the exceptions that are not RequestException
+        del _HOOK_CALLS[:]
+        run_results = runboom(
+            self.server, method='GET', num=10, concurrency=1,
+            post_hook='boom.tests.test_boom.post_hook_raises', quiet=True)
+        self.assertEqual(run_results.count(), 10)
+        self.assertEqual(len(run_results.status_code_counter[200]), 9)
+        self.assertEqual(dict(run_results.error_counter),
+                         {'ValueError: hook bug': 1})
+
     def test_connection_error(self):
         run_results = runboom(
             'http://localhost:9999', num=10, concurrency=1,
@@ -254,6 +964,22 @@ class TestBoom(unittest.TestCase):
         self.assertEqual(0.2, actual['max'])
         self.assertAlmostEqual(0.1, actual['avg'], delta=0.1)
         self.assertEqual(0.2, actual['amp'])
+        self.assertEqual(['50', '90', '95', '99', '99.9'],
+                         list(actual['percentiles']))
+        self.assertAlmostEqual(0.1, actual['percentiles']['50'], delta=0.001)
+        self.assertAlmostEqual(0.2, actual['percentiles']['99.9'],
+                               delta=0.001)
+
+    def test_percentiles_option(self):
+        self.assertEqual(boom.percentiles('50,99.9'), (50, 99.9))
+        self.assertRaises(Exception, boom.percentiles, '50,foo')
+        self.assertRaises(Exception, boom.percentiles, '0,200')
+
+        code, stdout, stderr = self._run(self.server, '-n', '5',
+                                         '--percentiles', '50,99')
+        self.assertEqual(code, 0)
+        self.assertTrue('Latency distribution' in stdout, stdout)
+        self.assertTrue('99%' in stdout, stdout)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,135 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from boom.boom import RunResults
+from boom.compare import (compare, main, mann_whitney, merge, proportions,
+                          welch)
+from boom.histogram import Histogram
+
+
+def _results(latencies, errors=0, total_time=10):
+    results = RunResults(None, True)
+    results.status_code_counter[200].extend(latencies)
+    results.error_counter['ConnectionError: refused'] = errors
+    results.total_time = total_time
+    return results
+
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        self.random = random.Random(1)
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _latencies(self, mean, size=2000):
+        return [self.random.expovariate(1. / mean) for i in range(size)]
+
+    def test_mann_whitney(self):
+        base, same, slower = Histogram(), Histogram(), Histogram()
+        base.extend(self._latencies(.1))
+        same.extend(self._latencies(.1))
+        slower.extend(self._latencies(.12))
+        self.assertTrue(mann_whitney(base, same)[1] > .01)
+        z, p_value = mann_whitney(base, slower)
+        self.assertTrue(z > 0)
+        self.assertTrue(p_value < .01)
+        self.assertEqual(mann_whitney(base, Histogram()), (0, None))
+
+    def test_proportions(self):
+        self.assertTrue(proportions(10, 1000, 12, 1000)[1] > .01)
+        z, p_value = proportions(10, 1000, 50, 1000)
+        self.assertTrue(z > 0)
+        self.assertTrue(p_value < .01)
+
+    def test_welch(self):
+        self.assertEqual(welch([1], [2, 3]), (0, None))
+        t, p_value = welch([100, 102, 98, 101], [80, 82, 79, 81])
+        self.assertTrue(t < 0)
+        self.assertTrue(p_value < .01)
+
+    def test_compare(self):
+        base = _results(self._latencies(.1), errors=10)
+        new = _results(self._latencies(.2), errors=10)
+        differences = dict((difference.metric, difference)
+                           for difference in compare(base, new))
+        self.assertTrue(differences['p50'].regression)
+        self.assertTrue(differences['avg'].change > .5)
+        # as many calls in the same time
+        self.assertFalse(differences['rps'].regression)
+        self.assertFalse(differences['error_ratio'].regression)
+
+        differences = compare(base, _results(self._latencies(.1)))
+        self.assertFalse(any(difference.regression
+                             for difference in differences))
+
+    def test_compare_from_zero(self):
+        base = _results(self._latencies(.1))
+        new = _results(self._latencies(.1), errors=10)
+        error_ratio = compare(base, new)[-1]
+        self.assertEqual(error_ratio.metric, 'error_ratio')
+        self.assertEqual(error_ratio.change, None)
+        self.assertTrue(error_ratio.regression)
+
+        paths = [os.path.join(self.tmp, name) for name in ('base.json',
+                                                           'new.json')]
+        base.save(paths[0])
+        new.save(paths[1])
+        old_stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            self.assertRaises(SystemExit, main, paths + ['--json-output'])
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = old_stdout
+        # valid JSON, without Infinity
+        self.assertEqual(json.loads(output)[-1]['change'], None)
+
+    def test_merge(self):
+        paths = []
+        for rps in ((10, 12, 11), (20, 21), (5, 5, 5)):
+            paths.append(os.path.join(self.tmp, '%d.json' % len(paths)))
+            results = _results(self._latencies(.1, 10))
+            results.timeline = [{'elapsed': index + 1, 'rps': value}
+                                for index, value in enumerate(rps)]
+            results.save(paths[-1])
+
+        # the runs are parallel, their RPS add up
+        merged = merge(paths[:2])
+        self.assertEqual(merged.count(), 20)
+        self.assertEqual([bucket['rps'] for bucket in merged.timeline],
+                         [30, 33])
+        self.assertEqual(len(merge(paths).timeline), 2)
+
+        # one of the runs has no time series
+        _results(self._latencies(.1, 10)).save(paths[2])
+        self.assertEqual(merge(paths).timeline, None)
+        self.assertEqual(len(merge(paths[:1]).timeline), 3)
+
+    def test_main(self):
+        paths = []
+        for name, mean in (('base', .1), ('same', .1), ('slow', .2)):
+            paths.append(os.path.join(self.tmp, name + '.json.gz'))
+            _results(self._latencies(mean)).save(paths[-1])
+
+        old_stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            main([paths[0], paths[1]])
+            self.assertRaises(SystemExit, main, [paths[0], paths[2]])
+            self.assertRaises(SystemExit, main,
+                              [paths[0] + ',' + paths[1], __file__])
+        finally:
+            sys.stdout.close()
+            sys.stdout = old_stdout
@@ -0,0 +1,41 @@
+import unittest
+
+from boom.boom import RunResults
+from boom.expect import (Expectations, parse_header, parse_regex,
+                         parse_size, parse_status)
+
+
+class TestExpect(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_status('200,204'), (200, 204))
+        self.assertRaises(ValueError, parse_status, '200,ok')
+        self.assertEqual(parse_header('Content-Type: json'),
+                         ('Content-Type', 'json'))
+        self.assertRaises(ValueError, parse_header, 'Content-Type')
+        self.assertRaises(ValueError, parse_regex, '(')
+        self.assertEqual(parse_size('10-20'), (10, 20))
+        self.assertEqual(parse_size('10-'), (10, None))
+        self.assertEqual(parse_size('-20'), (None, 20))
+        self.assertRaises(ValueError, parse_size, '-')
+        self.assertRaises(ValueError, parse_size, '10')
+
+    def test_record(self):
+        expect = Expectations([200, 204], [('Content-Type', 'json')],
+                              '"ok": *true', (None, 20))
+        self.assertEqual(expect.labels, ['status in 200,204',
+                                         'header Content-Type ~ json',
+                                         'body ~ "ok": *true',
+                                         'size in -20'])
+        results = RunResults()
+        expect.record(results, 200, {'content-type': 'application/json'},
+                      12, b'{"ok": true}')
+        self.assertEqual(results.assertion_failures, {})
+
+        expect.record(results, 500, {}, 30, b'{"ok": false}')
+        self.assertEqual(results.assertion_failures,
+                         dict((label, 1) for label in expect.labels))
+
+    def test_empty(self):
+        self.assertFalse(Expectations())
+        self.assertTrue(Expectations(size=(1, None)))
@@ -0,0 +1,92 @@
+import json
+import math
+import random
+import unittest
+
+from boom.histogram import Histogram
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_empty(self):
+        h = Histogram()
+        self.assertEqual(len(h), 0)
+        self.assertEqual(h.min, None)
+        self.assertEqual(h.mean(), 0)
+        self.assertEqual(h.stdev(), 0)
+        self.assertEqual(list(h), [])
+
+    def test_record(self):
+        h = Histogram()
+        h.extend([0, 0.1, 0.2])
+        self.assertEqual(len(h), 3)
+        self.assertEqual(h.min, 0)
+        self.assertEqual(h.max, 0.2)
+        self.assertAlmostEqual(h.mean(), 0.1)
+
+    def test_precision(self):
+        values = [random.expovariate(10) for i in range(5000)]
+        mean = sum(values) / len(values)
+        stdev = math.sqrt(sum((x - mean) ** 2 for x in values) / len(values))
+
+        for digits in (2, 3):
+            h = Histogram(digits)
+            h.extend(values)
+            self.assertAlmostEqual(h.mean(), mean)
+            self.assertAlmostEqual(h.stdev(), stdev,
+                                   delta=stdev * 10 ** -digits)
+            for value, count in h:
+                self.assertTrue(count > 0)
+
+    def test_constant_memory(self):
+        h = Histogram()
+        for i in range(100000):
+            h.record(0.05 + (i % 100) / 1000.)
+        self.assertEqual(len(h), 100000)
+        self.assertTrue(len(h.counts) <= 100)
+
+    def test_percentiles(self):
+        h = Histogram()
+        h.extend([i / 1000. for i in range(1, 1001)])
+        p50, p99, p100 = h.percentiles([50, 99, 100])
+        self.assertAlmostEqual(p50, 0.5, delta=0.001)
+        self.assertAlmostEqual(p99, 0.99, delta=0.001)
+        self.assertEqual(p100, 1.)
+        self.assertAlmostEqual(h.percentile(0.1), 0.001, delta=0.0001)
+        self.assertEqual(Histogram().percentiles([50, 99]), [0, 0])
+
+    def test_merge(self):
+        one, two = Histogram(), Histogram()
+        one.extend([0.1, 0.2])
+        two.extend([0.05, 0.3])
+        one.merge(two)
+        self.assertEqual(len(one), 4)
+        self.assertEqual(one.min, 0.05)
+        self.assertEqual(one.max, 0.3)
+        self.assertRaises(ValueError, one.merge, Histogram(2))
+
+    def test_diff(self):
+        h = Histogram()
+        h.extend([0.1, 0.2])
+        previous = Histogram().merge(h)
+        h.extend([0.5, 0.5, 0.7])
+        diff = h.diff(previous)
+        self.assertEqual(len(diff), 3)
+        self.assertAlmostEqual(diff.mean(), 0.5667, places=3)
+        self.assertAlmostEqual(diff.min, 0.5, places=3)
+        self.assertAlmostEqual(diff.max, 0.7, places=3)
+        self.assertEqual(len(h.diff(h)), 0)
+
+    def test_serialization(self):
+        h = Histogram(2)
+        h.extend([0.001, 0.5, 0.5, 12])
+        data = json.loads(json.dumps(h.to_dict()))
+        copy = Histogram.from_dict(data)
+        self.assertEqual(copy.significant_digits, 2)
+        self.assertEqual(list(copy), list(h))
+        self.assertEqual((copy.min, copy.max, copy.total),
+                         (h.min, h.max, h.total))
+
+    def test_bad_precision(self):
+        self.assertRaises(ValueError, Histogram, 0)
+        self.assertRaises(ValueError, Histogram, 6)
@@ -0,0 +1,115 @@
+import socket
+import unittest
+
+import requests
+
+from boom.boom import RunResults, patch
+from boom.metrics import PrometheusExporter, StatsdExporter, prometheus
+
+
+def _results():
+    results = RunResults()
+    results.status_code_counter[200].extend([.002, .02, .3])
+    results.status_code_counter[500].append(3)
+    results.error_counter['ConnectionError: refused'] = 2
+    results.error_counter['ConnectionError: reset'] = 1
+    results.body_bytes[200] = 300
+    results.assertion_failures['body ~ "ok"'] = 1
+    return results
+
+
+class TestMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        patch()
+
+    def test_prometheus(self):
+        lines = prometheus(_results()).splitlines()
+        self.assertTrue('boom_calls_total{status="200"} 3' in lines)
+        self.assertTrue('boom_calls_total{status="500"} 1' in lines)
+        self.assertTrue('boom_errors_total{type="ConnectionError"} 3' in lines)
+        self.assertTrue('# TYPE boom_latency_seconds histogram' in lines)
+        buckets = [line for line in lines
+                   if line.startswith('boom_latency_seconds_bucket')]
+        self.assertEqual(buckets[0], 'boom_latency_seconds_bucket'
+                                     '{le="0.005"} 1')
+        self.assertTrue('boom_latency_seconds_bucket{le="0.025"} 2' in lines)
+        self.assertTrue('boom_latency_seconds_bucket{le="2.5"} 3' in lines)
+        self.assertEqual(buckets[-1], 'boom_latency_seconds_bucket'
+                                      '{le="+Inf"} 4')
+        self.assertTrue('boom_latency_seconds_count 4' in lines)
+        self.assertTrue('boom_body_bytes_total 300' in lines)
+        self.assertTrue('boom_assertion_failures_total'
+                        '{assertion="body ~ \\"ok\\""} 1' in lines)
+
+    def test_prometheus_exporter(self):
+        exporter = PrometheusExporter(_results(), ('127.0.0.1', 0))
+        exporter.start()
+        try:
+            url = 'http://127.0.0.1:%d' % exporter.address[1]
+            res = requests.get(url + '/metrics')
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.headers['Content-Type'].startswith(
+                'text/plain; version=0.0.4'))
+            self.assertTrue('boom_calls_total{status="200"} 3' in res.text)
+            self.assertEqual(requests.get(url + '/').status_code, 404)
+        finally:
+            exporter.stop()
+
+    def test_statsd(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        results = _results()
+        exporter = StatsdExporter(results, server.getsockname(),
+                                  interval=60)
+        exporter.start()
+        exporter.push()
+        lines = server.recv(65536).decode('utf-8').split('\n')
+        self.assertEqual(lines[:5], [
+            'boom.assertion_failures:1|c', 'boom.body_bytes:300|c',
+            'boom.calls.200:3|c', 'boom.calls.500:1|c', 'boom.errors:3|c'])
+        self.assertTrue(lines[5].startswith('boom.rps:'))
+        gauges = dict(line[:-2].split(':') for line in lines[6:])
+        self.assertEqual(sorted(gauges), [
+            'boom.latency.avg', 'boom.latency.p50', 'boom.latency.p90',
+            'boom.latency.p99'])
+        # in milliseconds
+        self.assertAlmostEqual(float(gauges['boom.latency.p50']), 20,
+                               delta=.1)
+        self.assertAlmostEqual(float(gauges['boom.latency.p99']), 3000,
+                               delta=5)
+
+        # only the increments, and a last push when stopping
+        results.status_code_counter[200].append(.01)
+        exporter.stop()
+        lines = server.recv(65536).decode('utf-8').split('\n')
+        self.assertEqual(lines[0], 'boom.calls.200:1|c')
+        self.assertTrue(any(line.startswith('boom.latency.p50:10')
+                            for line in lines), lines)
+
+    def test_statsd_batching(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+        results = RunResults()
+        for code in range(100, 600):
+            results.status_code_counter[code].append(.01)
+        exporter = StatsdExporter(results, server.getsockname(),
+                                  interval=60)
+        exporter.start()
+        exporter.push()
+        exporter._greenlet.kill()
+        server.settimeout(.1)
+        packets = []
+        try:
+            while True:
+                packets.append(server.recv(65536))
+        except socket.timeout:
+            pass
+        self.assertTrue(len(packets) > 1)
+        self.assertTrue(all(len(packet) <= 1432 for packet in packets))
+        lines = b'\n'.join(packets).split(b'\n')
+        self.assertEqual(len([line for line in lines
+                              if line.startswith(b'boom.calls.')]), 500)
@@ -0,0 +1,176 @@
+import unittest
+
+import gevent
+from gevent.lock import Semaphore
+from gevent.server import StreamServer
+
+from boom.boom import calc_stats, patch, run
+from boom.multiplex import H2Connection, StreamReset, request_headers
+from boom.wire import Request
+
+try:
+    from h2 import events
+    from h2.config import H2Configuration
+    from h2.errors import ErrorCodes
+    from h2.settings import SettingCodes, Settings
+except ImportError:
+    pass
+
+
+class H2Server(object):
+    """Answers the calls 10 ms after they end, with a 400 when their
+    body doesn't match their Content-Length. /reset streams are reset and
+    a GOAWAY is sent after `goaway_after` calls on a connection.
+    """
+
+    def __init__(self, max_streams=None, goaway_after=None):
+        self.max_streams = max_streams
+        self.goaway_after = goaway_after
+        self.active = self.peak = 0
+        self.server = StreamServer(('127.0.0.1', 0), self.handle)
+        self.server.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+
+    def stop(self):
+        self.server.stop()
+
+    def handle(self, sock, address):
+        conn = H2Connection(H2Configuration(client_side=False,
+                                            header_encoding=None))
+        if self.max_streams is not None:
+            conn.local_settings = Settings(client=False, initial_values={
+                SettingCodes.MAX_CONCURRENT_STREAMS: self.max_streams})
+        conn.initiate_connection()
+        lock = Semaphore()
+        calls = {}
+        answered = []
+
+        def send():
+            with lock:
+                sock.sendall(conn.data_to_send())
+
+        def answer(stream_id, headers, body):
+            gevent.sleep(.01)
+            self.active -= 1
+            status = b'200'
+            if len(body) != int(headers.get(b'content-length', 0)):
+                status = b'400'
+            conn.send_headers(stream_id, [(b':status', status),
+                                          (b'content-length', b'2')])
+            conn.send_data(stream_id, b'OK', end_stream=True)
+            answered.append(stream_id)
+            if len(answered) == self.goaway_after:
+                conn.close_connection(last_stream_id=stream_id)
+            send()
+
+        send()
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            for event in conn.receive_data(data):
+                if isinstance(event, events.RequestReceived):
+                    calls[event.stream_id] = dict(event.headers), b''
+                    self.active += 1
+                    self.peak = max(self.peak, self.active)
+                    if calls[event.stream_id][0][b':path'] == b'/reset':
+                        self.active -= 1
+                        conn.reset_stream(event.stream_id,
+                                          ErrorCodes.REFUSED_STREAM)
+                elif isinstance(event, events.DataReceived):
+                    headers, body = calls[event.stream_id]
+                    calls[event.stream_id] = headers, body + event.data
+                    conn.acknowledge_received_data(
+                        event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, events.StreamEnded):
+                    headers, body = calls.pop(event.stream_id)
+                    gevent.spawn(answer, event.stream_id, headers, body)
+            send()
+        sock.close()
+
+
+class TestRequestHeaders(unittest.TestCase):
+
+    def test_request_headers(self):
+        request = Request('post', 'http://127.0.0.1:8080/path?q=1',
+                          {'Host': 'example.com', 'X-Test': '1'}, 'data',
+                          keepalive=False)
+        headers = request_headers(request)
+        self.assertEqual(headers[:4], [(':method', 'POST'),
+                                       (':scheme', 'http'),
+                                       (':authority', 'example.com'),
+                                       (':path', '/path?q=1')])
+        names = [name for name, value in headers[4:]]
+        self.assertEqual(names, ['user-agent', 'accept-encoding', 'accept',
+                                 'x-test', 'content-length'])
+
+
+@unittest.skipIf(H2Connection is None, 'h2 is not installed')
+class TestMultiplex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        patch()
+
+    def _server(self, **options):
+        server = H2Server(**options)
+        self.addCleanup(server.stop)
+        return server
+
+    def test_run(self):
+        server = self._server()
+        res = run(server.url, num=50, concurrency=10, quiet=True,
+                  http2=True, connections=2, expect_status=[200],
+                  expect_headers=[('Content-Length', '^2$')],
+                  expect_size=(2, 2))
+        self.assertEqual(len(res.status_code_counter[200]), 50)
+        self.assertEqual(res.connections_opened, 2)
+        self.assertEqual(res.connections_reused, 48)
+        stats = calc_stats(res)
+        self.assertEqual(stats.http2, {'resets': 0, 'goaways': 0})
+        self.assertEqual(stats.bytes_received, 100)
+        self.assertEqual(set(stats.assertions.values()), set([0]))
+        self.assertEqual(server.peak, 10)
+
+    def test_max_streams(self):
+        server = self._server(max_streams=3)
+        res = run(server.url, num=30, concurrency=10, quiet=True,
+                  http2=True)
+        self.assertEqual(len(res.status_code_counter[200]), 30)
+        self.assertEqual(server.peak, 3)
+
+        server = self._server()
+        res = run(server.url, num=30, concurrency=10, quiet=True,
+                  http2=True, max_streams=2)
+        self.assertEqual(len(res.status_code_counter[200]), 30)
+        self.assertEqual(server.peak, 2)
+
+    def test_post(self):
+        # larger than the initial flow control window
+        server = self._server()
+        res = run(server.url, num=3, concurrency=3, method='POST',
+                  data='x' * 100000, quiet=True, http2=True)
+        self.assertEqual(len(res.status_code_counter[200]), 3)
+
+    def test_reset(self):
+        server = self._server()
+        res = run(server.url + '/reset', num=5, concurrency=2, quiet=True,
+                  http2=True)
+        self.assertEqual(res.error_count(), 5)
+        self.assertTrue(all(isinstance(error, StreamReset)
+                            for error in res.errors))
+        self.assertEqual(res.http2['resets'], 5)
+
+    def test_goaway(self):
+        server = self._server(goaway_after=5)
+        res = run(server.url, num=12, quiet=True, http2=True)
+        self.assertEqual(len(res.status_code_counter[200]), 12)
+        self.assertEqual(res.error_count(), 0)
+        self.assertEqual(res.connections_opened, 3)
+        self.assertEqual(res.http2['goaways'], 2)
+
+    def test_unsupported(self):
+        self.assertRaises(ValueError, run, 'http://127.0.0.1', http2=True,
+                          pre_hook='boom.util.resolve_name')
+        self.assertRaises(ValueError, run, 'http://127.0.0.1', http2=True,
+                          engine='asyncio')
@@ -1,5 +1,10 @@
 import unittest
-from boom.pgbar import ProgressBar
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from boom.pgbar import ProgressBar, AnimatedProgressBar
 
 
 class DefaultsTestCase(unittest.TestCase):
@@ -144,5 +149,25 @@ class CustomizedTestCase(unittest.TestCase):
         self.assertEqual(str(self.p), '100% [####################]')
 
 
+class AnimatedTestCase(unittest.TestCase):
+
+    def test_show_progress(self):
+        stdout = StringIO()
+        p = AnimatedProgressBar(stdout=stdout)
+        p + 1
+        p.show_progress('10 RPS')
+        self.assertEqual(stdout.getvalue(), '\n[=>...........] 10% 10 RPS')
+
+    def test_show_progress_tty(self):
+        stdout = StringIO()
+        stdout.isatty = lambda: True
+        p = AnimatedProgressBar(stdout=stdout)
+        p.show_progress('long extra')
+        p.show_progress()
+        self.assertEqual(stdout.getvalue(),
+                         '\r[>............] 0% long extra'
+                         '\r[>............] 0%           ')
+
+
 if __name__ == '__main__':
     unittest.main()
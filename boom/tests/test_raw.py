@@ -0,0 +1,72 @@
+import socket
+import unittest
+
+from boom.raw import Connection, supports
+from boom.wire import ProtocolError, Request
+
+
+class TestRaw(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = Connection('example.com', 80)
+        self.client, self.server = socket.socketpair()
+        # skips connecting
+        self.connection._sock = self.client
+
+    def tearDown(self):
+        self.connection.close()
+        self.server.close()
+
+    def _exchange(self, response, method='GET'):
+        self.server.sendall(response)
+        return self.connection.exchange(Request(method,
+                                                'http://example.com/'))
+
+    def test_supports(self):
+        self.assertTrue(supports('GET', 'http://example.com'))
+        self.assertTrue(supports('head', 'http://example.com'))
+        self.assertFalse(supports('GET', 'https://example.com'))
+        self.assertFalse(supports('POST', 'http://example.com'))
+        self.assertFalse(supports('GET', 'http://example.com', data='x'))
+        self.assertFalse(supports('GET', 'http://example.com',
+                                  pre_hook='hooks.pre'))
+
+    def test_content_length(self):
+        for i in range(3):
+            status, headers, dns, connect, first_byte = self._exchange(
+                b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nhello')
+            self.assertEqual(status, 200)
+            self.assertEqual(dns, None)
+        self.assertEqual(self.connection.calls, 3)
+        self.assertEqual(self.connection._start, self.connection._end)
+
+    def test_chunked(self):
+        status = self._exchange(
+            b'HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'5\r\nhello\r\n6;ext\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n'
+            b'HTTP/1.1 204 No Content\r\n\r\n')[0]
+        self.assertEqual(status, 404)
+        self.assertEqual(self.connection.exchange(
+            Request('GET', 'http://example.com/'))[0], 204)
+
+    def test_head(self):
+        status = self._exchange(b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n'
+                                b'\r\n', method='HEAD')[0]
+        self.assertEqual(status, 200)
+        self.assertEqual(self.connection._start, self.connection._end)
+
+    def test_until_close(self):
+        self.server.sendall(b'HTTP/1.0 200 OK\r\n\r\nbody')
+        self.server.shutdown(socket.SHUT_WR)
+        status = self.connection.exchange(
+            Request('GET', 'http://example.com/'))[0]
+        self.assertEqual(status, 200)
+        self.assertEqual(self.connection._sock, None)
+
+    def test_head_too_large(self):
+        self.connection = Connection('example.com', 80, size=64)
+        self.connection._sock = self.client
+        self.assertRaises(ProtocolError, self._exchange,
+                          b'HTTP/1.1 200 OK\r\nX-Long: ' + b'x' * 100 +
+                          b'\r\n\r\n')
+        self.assertEqual(self.connection._sock, None)
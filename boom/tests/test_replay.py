@@ -0,0 +1,78 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import gevent
+
+from boom.replay import parse_time, read_calls, Replay
+
+
+_LOG = """\
+127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET /a.gif HTTP/1.0" 200 2326
+127.0.0.1 - - [10/Oct/2000:13:55:38 -0700] "POST /form HTTP/1.1" 302 - \
+"http://example.com/" "Mozilla/5.0"
+127.0.0.1 - - [10/Oct/2000:13:55:39 -0700] "-" 400 0
+"""
+
+_URLS = """\
+# comment
+http://example.com/one
+
+POST /two
+/three?x=1
+"""
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.dir, name)
+        opener = gzip.open if name.endswith('.gz') else open
+        with opener(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        return path
+
+    def test_parse_time(self):
+        self.assertEqual(parse_time('10/Oct/2000:13:55:36 -0700'),
+                         971211336)
+        self.assertEqual(parse_time('10/Oct/2000:20:55:36 +0000'),
+                         971211336)
+
+    def test_read_access_log(self):
+        for name in ('access.log', 'access.log.gz'):
+            calls = list(read_calls(self._write(name, _LOG)))
+            self.assertEqual(calls, [(971211336, 'GET', '/a.gif'),
+                                     (971211338, 'POST', '/form')])
+
+    def test_read_urls(self):
+        calls = list(read_calls(self._write('urls.txt', _URLS)))
+        self.assertEqual(calls, [(None, 'GET', 'http://example.com/one'),
+                                 (None, 'POST', '/two'),
+                                 (None, 'GET', '/three?x=1')])
+
+    def test_replay(self):
+        path = self._write('access.log', _LOG)
+        replay = Replay(path, 'http://localhost:8080/', speed=2, start=10)
+        jobs = list(replay)
+        self.assertEqual([scheduled for scheduled, endpoint in jobs],
+                         [10, 11])
+        self.assertEqual([endpoint.url for scheduled, endpoint in jobs],
+                         ['http://localhost:8080/a.gif',
+                          'http://localhost:8080/form'])
+        # every consumer stops
+        self.assertEqual(list(replay), [])
+
+    def test_readahead(self):
+        path = self._write('urls.txt', '/\n' * 100)
+        replay = Replay(path, readahead=10)
+        gevent.sleep(.1)
+        self.assertEqual(replay._queue.qsize(), 10)
+        self.assertEqual(len(list(replay)), 100)
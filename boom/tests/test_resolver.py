@@ -0,0 +1,54 @@
+import socket
+import unittest
+
+from boom import resolver
+from boom.resolver import Resolver, next_address
+
+
+class FakeResolver(Resolver):
+
+    def __init__(self, *lookups, **options):
+        super(FakeResolver, self).__init__('example.com', 80, **options)
+        self.lookups = list(lookups)
+
+    def _lookup(self):
+        addresses = self.lookups.pop(0)
+        if addresses is None:
+            raise socket.gaierror('lookup failed')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, 80))
+                for address in addresses]
+
+
+class TestResolver(unittest.TestCase):
+
+    def _addresses(self, resolver, picks):
+        return [resolver.pick()[4][0] for i in range(picks)]
+
+    def test_round_robin(self):
+        resolver = FakeResolver(['10.0.0.1', '10.0.0.2', '10.0.0.1',
+                                 '10.0.0.3'])
+        self.assertEqual(self._addresses(resolver, 4),
+                         ['10.0.0.1', '10.0.0.2', '10.0.0.3', '10.0.0.1'])
+
+    def test_ttl(self):
+        resolver = FakeResolver(['10.0.0.1'], ['10.0.0.2'], None, ttl=0)
+        self.assertEqual(self._addresses(resolver, 3),
+                         ['10.0.0.1', '10.0.0.2', '10.0.0.2'])
+
+        resolver = FakeResolver(['10.0.0.1'], ['10.0.0.2'])
+        self.assertEqual(self._addresses(resolver, 2),
+                         ['10.0.0.1', '10.0.0.1'])
+
+        resolver = FakeResolver(None)
+        self.assertRaises(socket.gaierror, resolver.pick)
+
+    def test_install(self):
+        fake = FakeResolver(['10.0.0.1'])
+        resolver.install(fake)
+        try:
+            self.assertEqual(next_address('example.com', 80)[4],
+                             ('10.0.0.1', 80))
+        finally:
+            resolver.uninstall(fake)
+        self.assertEqual(next_address('127.0.0.1', 80)[4],
+                         ('127.0.0.1', 80))
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+
+from boom.scenario import AliasSampler, Scenario
+
+
+class TestAliasSampler(unittest.TestCase):
+
+    def test_distribution(self):
+        sampler = AliasSampler([1, 2, 7])
+        counts = Counter(sampler.sample() for i in range(20000))
+        self.assertAlmostEqual(counts[0] / 20000., .1, delta=.02)
+        self.assertAlmostEqual(counts[1] / 20000., .2, delta=.02)
+        self.assertAlmostEqual(counts[2] / 20000., .7, delta=.02)
+
+    def test_single(self):
+        sampler = AliasSampler([3])
+        self.assertEqual(set(sampler.sample() for i in range(100)), set([0]))
+
+
+class TestScenario(unittest.TestCase):
+
+    def _load(self, definition, base_url='http://example.com/api/'):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(definition, f)
+            return Scenario.from_file(path, base_url)
+        finally:
+            os.remove(path)
+
+    def test_from_file(self):
+        scenario = self._load({'endpoints': [
+            {'url': 'items'},
+            {'name': 'create', 'url': 'http://other/items',
+             'method': 'post', 'data': {'a': 1}, 'weight': 3,
+             'headers': {'X-Test': '1'}}]})
+        get, post = scenario.endpoints
+        self.assertEqual(get.name, 'GET items')
+        self.assertEqual(get.url, 'http://example.com/api/items')
+        self.assertEqual(get.weight, 1)
+        self.assertEqual(post.method, 'POST')
+        self.assertEqual(post.url, 'http://other/items')
+        self.assertEqual(post.data, '{"a": 1}')
+        self.assertEqual(post.headers, {'X-Test': '1',
+                                        'Content-Type': 'application/json'})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, self._load, {'endpoints': []})
+        self.assertRaises(ValueError, self._load, {'endpoints': [{}]})
+        self.assertRaises(ValueError, self._load,
+                          {'endpoints': [{'url': '/', 'weight': 0}]})
+        self.assertRaises(ValueError, self._load,
+                          {'endpoints': [{'url': '/', 'method': 'BOOM'}]})
+        self.assertRaises(ValueError, self._load,
+                          {'endpoints': [{'url': '/'}]}, None)
@@ -0,0 +1,52 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from boom.selftest import (Configuration, SUMMARY, compare_baseline, matrix,
+                           selftest)
+
+
+class TestSelftest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_matrix(self):
+        configurations = matrix((1, 10), (16,))
+        self.assertEqual(len(configurations), 8)
+        self.assertEqual(configurations[0], Configuration(1, True, 16,
+                                                          False))
+        self.assertEqual([c.name for c in configurations[:4]], [
+            'c1-keepalive-16B-nohook', 'c1-keepalive-16B-hook',
+            'c1-close-16B-nohook', 'c1-close-16B-hook'])
+
+    def test_selftest(self):
+        base = os.path.join(self.dir, 'base')
+        configurations = [Configuration(2, True, 16, False),
+                          Configuration(2, False, 1000, True)]
+        progress = []
+        measures = selftest(configurations, duration=.5, save=base,
+                            progress=progress.append)
+        self.assertEqual(progress, measures)
+        for measured in measures:
+            self.assertTrue(measured.rps > 0)
+            self.assertTrue(measured.cpu > 0)
+            self.assertEqual(measured.errors, 0)
+            self.assertTrue(os.path.exists(os.path.join(
+                base, measured.name + '.json')))
+        with open(os.path.join(base, SUMMARY)) as f:
+            summary = json.load(f)
+        self.assertEqual([measured['name'] for measured in
+                          summary['measures']],
+                         [c.name for c in configurations])
+        self.assertTrue('gevent' in summary['versions'])
+
+        new = os.path.join(self.dir, 'new')
+        measures = selftest(configurations[:1], duration=.5, save=new)
+        differences = compare_baseline(measures, new, base)
+        self.assertEqual([difference.metric for difference in differences],
+                         ['c2-keepalive-16B-nohook rps',
+                          'c2-keepalive-16B-nohook cpu'])
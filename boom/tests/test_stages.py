@@ -0,0 +1,53 @@
+import unittest
+
+import gevent
+
+from boom.stages import LoadProfile, parse_stages
+
+
+class Results(object):
+    stage = None
+
+
+class TestStages(unittest.TestCase):
+
+    def test_parse_stages(self):
+        self.assertEqual(parse_stages('10s@50, 1m@200,2@0'),
+                         [(10, 50), (60, 200), (2, 0)])
+        for value in ('10s', '10x@5', '0@5', '10@-1', '10@5,'):
+            self.assertRaises(ValueError, parse_stages, value)
+
+    def test_profile(self):
+        profile = LoadProfile.from_stages([(1, 50), (2, 200), (1, 0)])
+        self.assertEqual(profile.concurrency, 200)
+        self.assertEqual(profile.duration, 4)
+        self.assertEqual(profile.stages[0][0], '1: 1s@50')
+
+        profile = LoadProfile.ramp_up(5, 10)
+        self.assertEqual(profile.concurrency, 10)
+        self.assertEqual(profile.duration, None)
+
+    def test_gate(self):
+        profile = LoadProfile.from_stages([(.2, 2), (.2, 0)])
+        results = Results()
+        jobs = iter(range(1000))
+        taken = [[], [], []]
+
+        def work(index):
+            for job in profile.gate(index, jobs):
+                taken[index].append(job)
+                gevent.sleep(.01)
+
+        profile.start(results)
+        workers = [gevent.spawn(work, index) for index in range(3)]
+        gevent.sleep(.1)
+        self.assertEqual(results.stage, '1: 0.2s@2')
+        gevent.sleep(.35)
+        self.assertEqual(profile.active, 0)
+        self.assertEqual(results.stage, '2: 0.2s@0')
+        gevent.killall(workers)
+        profile.stop()
+
+        # the third worker never got activated
+        self.assertTrue(taken[0] and taken[1])
+        self.assertEqual(taken[2], [])
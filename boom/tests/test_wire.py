@@ -0,0 +1,55 @@
+import unittest
+
+from boom.wire import (ProtocolError, Request, chunk_size, has_body,
+                       parse_head)
+
+
+class TestWire(unittest.TestCase):
+
+    def test_request(self):
+        request = Request('get', 'http://example.com:8080/path?q=1',
+                          headers={'host': 'other', 'X-Test': '1'})
+        self.assertEqual((request.host, request.port), ('example.com', 8080))
+        lines = request.payload.decode('latin-1').split('\r\n')
+        self.assertEqual(lines[0], 'GET /path?q=1 HTTP/1.1')
+        self.assertIn('host: other', lines)
+        self.assertNotIn('Host: example.com:8080', lines)
+        self.assertIn('X-Test: 1', lines)
+        # like requests, whichever path sends it
+        self.assertIn('Accept-Encoding: gzip, deflate', lines)
+        self.assertEqual(lines[-2:], ['', ''])
+
+    def test_request_body(self):
+        request = Request('POST', 'https://example.com', data=u'\xe9',
+                          auth=('user', 'pass'), keepalive=False)
+        self.assertEqual(request.port, 443)
+        head, body = request.payload.split(b'\r\n\r\n')
+        self.assertEqual(body, b'\xc3\xa9')
+        self.assertIn(b'Content-Length: 2', head)
+        self.assertIn(b'Authorization: Basic dXNlcjpwYXNz', head)
+        self.assertIn(b'Connection: close', head)
+        self.assertRaises(ValueError, Request, 'GET', 'ftp://example.com')
+
+    def test_parse_head(self):
+        self.assertEqual(parse_head(b'HTTP/1.1 200 OK\r\n'
+                                    b'Content-Length: 12\r\n\r\n'),
+                         (200, True, 12, {'content-length': '12'}))
+        self.assertEqual(parse_head(b'HTTP/1.1 200 OK\r\n'
+                                    b'Transfer-Encoding: chunked\r\n'
+                                    b'Connection: close\r\n\r\n')[:3],
+                         (200, False, -1))
+        self.assertEqual(parse_head(b'HTTP/1.0 404 Not Found\r\n\r\n'),
+                         (404, False, None, {}))
+        self.assertEqual(parse_head(b'HTTP/1.0 204\r\n'
+                                    b'Connection: Keep-Alive\r\n\r\n')[:3],
+                         (204, True, None))
+        for head in (b'garbage\r\n\r\n', b'HTTP/2 200\r\n\r\n',
+                     b'HTTP/1.1 200 OK\r\nContent-Length: x\r\n\r\n'):
+            self.assertRaises(ProtocolError, parse_head, head)
+
+    def test_body(self):
+        self.assertTrue(has_body('GET', 200))
+        self.assertFalse(has_body('HEAD', 200))
+        self.assertFalse(has_body('GET', 304))
+        self.assertEqual(chunk_size(b'1a;ext=1\r\n'), 26)
+        self.assertRaises(ProtocolError, chunk_size, b'zz\r\n')
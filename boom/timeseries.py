@@ -0,0 +1,108 @@
+"""
+Rolls the results of a run up in fixed intervals, written to a file
+while the run is in progress.
+
+Every interval, the histograms of the run are compared with the ones
+of the previous interval, so recording a call costs nothing more and
+each bucket only takes a few numbers.
+"""
+import csv
+import json
+import time
+
+import gevent
+
+from boom.connection import clock
+from boom.histogram import Histogram
+
+
+_COLUMNS = ('timestamp', 'elapsed', 'requests', 'errors', 'rps', 'avg')
+
+
+class TimeSeries(object):
+    """Writes a bucket of stats about the given RunResults every
+    `interval` seconds into the file at `path`.
+
+    The file is written as CSV when its name ends with `.csv`, as JSON
+    lines otherwise. Each bucket holds the wall-clock timestamp, the
+    elapsed time, the number of calls, errors, the RPS, the average and
+    `percentiles` latencies and the count of each status code during
+    the interval. The buckets are also kept, as dicts, in the `timeline`
+    of the results.
+    """
+
+    def __init__(self, results, path, interval=1, percentiles=(50, 90, 99)):
+        self.results = results
+        self.path = path
+        self.interval = interval
+        self.percentiles = percentiles
+        self.csv = path.endswith('.csv')
+        self._file = self._writer = self._greenlet = None
+
+    def start(self):
+        if self.results.timeline is None:
+            self.results.timeline = []
+        self._file = open(self.path, 'w')
+        if self.csv:
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(
+                _COLUMNS + tuple('p%g' % p for p in self.percentiles) +
+                ('status_codes',))
+        self._previous = Histogram(self.results.precision)
+        self._codes = {}
+        self._errors = 0
+        self._started = self._last = clock()
+        self._greenlet = gevent.spawn(self._run)
+
+    def _run(self):
+        deadline = self._started
+        while True:
+            deadline += self.interval
+            gevent.sleep(max(deadline - clock(), 0))
+            self.roll()
+
+    def stop(self):
+        """Writes the last, partial, bucket and closes the file."""
+        if self._greenlet is None:
+            return
+        self._greenlet.kill()
+        self._greenlet = None
+        self.roll()
+        self._file.close()
+
+    def roll(self):
+        """Writes a bucket with the stats since the previous one."""
+        results = self.results
+        now = clock()
+        histogram = results.histogram()
+        bucket = histogram.diff(self._previous)
+        self._previous = histogram
+
+        codes = {}
+        for code, counter in results.status_code_counter.items():
+            count = len(counter) - self._codes.get(code, 0)
+            if count:
+                codes[code] = count
+            self._codes[code] = len(counter)
+
+        errors = results.error_count() - self._errors
+        self._errors = results.error_count()
+
+        elapsed = now - self._last
+        self._last = now
+        row = [time.time(), now - self._started, len(bucket), errors,
+               (len(bucket) + errors) / elapsed if elapsed > 0 else 0,
+               bucket.mean()] + bucket.percentiles(self.percentiles)
+
+        keys = _COLUMNS + tuple('p%g' % p for p in self.percentiles)
+        line = dict(zip(keys, row))
+        line['status_codes'] = dict((str(code), count)
+                                    for code, count in codes.items())
+        results.timeline.append(line)
+
+        if self.csv:
+            codes = ' '.join('%s:%d' % item for item in sorted(codes.items()))
+            self._writer.writerow(row + [codes])
+        else:
+            self._file.write(json.dumps(line, sort_keys=True) + '\n')
+        self._file.flush()
@@ -0,0 +1,141 @@
+"""
+Minimal HTTP/1.1 wire format, for the engines that don't go through
+requests: a request is serialized once for the whole run, and responses
+are only parsed as far as needed to find the status code and where the
+body ends.
+"""
+import base64
+
+from boom import __version__
+
+try:
+    import urlparse
+except ImportError:
+    from urllib import parse as urlparse
+
+
+_PORTS = {'http': 80, 'https': 443}
+# status codes of the responses that never have a body
+_NO_BODY = (204, 304)
+
+
+class ProtocolError(Exception):
+    """Raised when a response is not valid HTTP/1.x."""
+
+
+class Request(object):
+    """A request to `url`, serialized once in `payload`, its (name, value)
+    header fields being kept in `fields`.
+
+    `headers` override the default ones (Host, User-Agent,
+    Accept-Encoding, Accept) and `data` (bytes or a string, encoded in
+    UTF-8) is sent as the body.
+    `auth` is a (user, password) tuple for basic authentication.
+    """
+
+    def __init__(self, method, url, headers=None, data=None, auth=None,
+                 keepalive=True):
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in _PORTS:
+            raise ValueError('Unsupported URL %r' % url)
+        self.method = method.upper()
+        self.url = url
+        self.headers = headers or {}
+        self.data = data
+        self.auth = auth
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or _PORTS[parts.scheme]
+        self.keepalive = keepalive
+
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.netloc = parts.netloc.rsplit('@', 1)[-1]
+
+        # the same encodings as requests are accepted, so the bodies
+        # received don't depend on the path taken. Header names are
+        # case-insensitive: the given ones replace the defaults whatever
+        # their case
+        fields = [('Host', self.netloc),
+                  ('User-Agent', 'boom/%s' % __version__),
+                  ('Accept-Encoding', 'gzip, deflate'), ('Accept', '*/*')]
+        names = set(name.lower() for name in headers or {})
+        fields = [(name, value) for name, value in fields
+                  if name.lower() not in names]
+        fields.extend((headers or {}).items())
+
+        if data is not None and not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        if data is not None or self.method in ('POST', 'PUT'):
+            fields.append(('Content-Length', str(len(data or b''))))
+        if auth is not None:
+            credentials = ('%s:%s' % tuple(auth)).encode('utf-8')
+            fields.append(('Authorization', 'Basic ' + base64.b64encode(
+                credentials).decode('ascii')))
+        if not keepalive:
+            fields.append(('Connection', 'close'))
+
+        self.fields = fields
+
+        head = '%s %s HTTP/1.1\r\n' % (self.method, self.path)
+        head += ''.join('%s: %s\r\n' % field for field in fields) + '\r\n'
+        self.payload = head.encode('latin-1') + (data or b'')
+
+
+def parse_head(head):
+    """Parses the status line and headers of a response.
+
+    Returns a (status, keepalive, length, headers) tuple: `keepalive`
+    tells if the connection can be reused after the body, `length` is the
+    size of the body, -1 when it is chunked and None when it lasts until
+    the connection is closed (which then can't be reused). `headers` maps
+    the lowercased header names to their value.
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        version, status = lines[0].split(' ', 2)[:2]
+        status = int(status)
+    except ValueError:
+        raise ProtocolError('Invalid status line %r' % lines[0])
+    if not version.startswith('HTTP/1.'):
+        raise ProtocolError('Unsupported version %r' % version)
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        keepalive = connection == 'keep-alive'
+    else:
+        keepalive = connection != 'close'
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        length = -1
+    elif 'content-length' in headers:
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise ProtocolError('Invalid Content-Length %r' %
+                                headers['content-length'])
+    else:
+        length = None
+    return status, keepalive, length, headers
+
+
+def has_body(method, status):
+    """Tells if the response to a `method` request with the given
+    `status` has a body."""
+    return method != 'HEAD' and status >= 200 and status not in _NO_BODY
+
+
+def chunk_size(line):
+    """Returns the size announced by the line heading a chunk."""
+    try:
+        return int(line.split(b';', 1)[0].strip(), 16)
+    except ValueError:
+        raise ProtocolError('Invalid chunk size %r' % line)
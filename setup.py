@@ -36,6 +36,7 @@ setup(name='boom',
       zip_safe=False,
       classifiers=classifiers,
       install_requires=install_requires,
+      extras_require={'http2': ['h2']},
       test_suite='unittest2.collector',
       entry_points="""
       [console_scripts]